@@ -0,0 +1,148 @@
+"""
+Analyses positions: the score, best move and principal variation
+(the moves both players are expected to play) that a search finds
+within a time budget.
+
+Results are kept in an AnalysisCache that is shared by everyone
+asking, keyed on the canonical version of the position (see
+symmetry.py), so a position that was analysed before, or any of its
+rotations/reflections, is answered at once. A cached result is only
+used if it was searched for at least as long as was asked for.
+"""
+import threading
+from collections import OrderedDict
+from logic import Game
+from search import Search
+from symmetry import canonicalize, transform_move, inverse_transform_move
+from transposition import TranspositionTable
+
+# each thread that analyses positions keeps its own search,
+# so that its transposition table stays warm between positions
+_searches = threading.local()
+
+class Analysis:
+    def __init__(self, score: int, best_move: tuple, principal_variation: list,
+                 depth: int, nodes: int, seconds: float, cached: bool = False):
+        self.score = score # for the player to move
+        self.best_move = best_move # (gobbler_size, board_position), None if the game is over
+        self.principal_variation = principal_variation # starting with best_move
+        self.depth = depth
+        self.nodes = nodes
+        self.seconds = seconds # that the search took
+        self.cached = cached
+
+    def to_dict(self) -> dict:
+        return {
+            'score': self.score,
+            'best_move': None if self.best_move is None else list(self.best_move),
+            'principal_variation': [list(move) for move in self.principal_variation],
+            'depth': self.depth,
+            'nodes': self.nodes,
+            'seconds': self.seconds,
+            'cached': self.cached,
+        }
+
+class AnalysisCache:
+    def __init__(self, max_entries: int = 10000):
+        """
+        keeps the analyses of at most max_entries positions,
+        dropping the least recently used ones
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # (number of gobblers, canonical key) -> (time budget, analysis of the canonical position)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple, time_budget: float) -> Analysis:
+        """
+        returns the cached analysis of the canonical position,
+        if it was searched for at least time_budget seconds
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time_budget:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, time_budget: float, analysis: Analysis) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            # keep whichever analysis searched for longer
+            if entry is not None and entry[0] > time_budget:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = (time_budget, analysis)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+def analyze(game: Game, time_budget: float = 1.0, cache: AnalysisCache = None) -> Analysis:
+    """
+    searches the position for at most time_budget seconds and returns
+    its Analysis, or the cached one. The game is left as it was
+    """
+    if game.winner is not None:
+        return Analysis(0, None, [], 0, 0, 0.0)
+    if cache is not None:
+        analysis = cached(game, time_budget, cache)
+        if analysis is not None:
+            return analysis
+
+    search = _search()
+    result = search.search(game, time_budget)
+    moves = [] if result.move is None else search.principal_variation(game, result.move, max(result.depth, 1))
+    analysis = Analysis(result.score, result.move, moves, result.depth, result.nodes, result.seconds)
+    if cache is not None:
+        remember(game, time_budget, analysis, cache)
+    return analysis
+
+def cached(game: Game, time_budget: float, cache: AnalysisCache) -> Analysis:
+    """
+    returns the cached analysis of the game if it was searched
+    for at least time_budget seconds, otherwise None
+    """
+    key, transform = canonicalize(game)
+    analysis = cache.get((game.number_of_gobblers, key), time_budget)
+    if analysis is None:
+        return None
+    # the cached moves are for the canonical position
+    return _transformed(analysis, lambda move: inverse_transform_move(move, transform), True)
+
+def remember(game: Game, time_budget: float, analysis: Analysis, cache: AnalysisCache) -> None:
+    """
+    caches the analysis of the game, e.g. one that was made in another process
+    """
+    key, transform = canonicalize(game)
+    cache.put((game.number_of_gobblers, key), time_budget, _transformed(analysis, lambda move: transform_move(move, transform)))
+
+def analyze_many(games: list, time_budget: float = 1.0, cache: AnalysisCache = None) -> list:
+    """
+    returns the Analysis of each game, searching each position
+    that isn't cached for at most time_budget seconds
+    """
+    # symmetric positions in the batch are only searched once
+    cache = cache if cache is not None else AnalysisCache(len(games))
+    return [analyze(game, time_budget, cache) for game in games]
+
+def _search() -> Search:
+    search = getattr(_searches, 'search', None)
+    if search is None:
+        search = _searches.search = Search(TranspositionTable(4))
+    return search
+
+def _transformed(analysis: Analysis, map_move, cached: bool = False) -> Analysis:
+    best_move = None if analysis.best_move is None else map_move(analysis.best_move)
+    return Analysis(analysis.score, best_move, [map_move(move) for move in analysis.principal_variation],
+                    analysis.depth, analysis.nodes, analysis.seconds, cached)
@@ -0,0 +1,311 @@
+"""
+A JSON api for the games of app.py, for bots and other programs:
+
+    POST /api/games                   starts a game, optionally with {"players": [name_0, name_1]},
+                                      and returns its public game_id and the token of its players
+    GET  /api/games/<game_id>         the state of the game
+    GET  /api/games/<game_id>/moves   the legal moves, as [gobbler_size, board_position] pairs
+    POST /api/games/<game_id>/moves   plays {"gobbler_size": 3, "board_position": 5}
+    GET  /api/games/<game_id>/events  a text/event-stream of the moves as they are played
+    POST /api/games/<game_id>/bot-move plays the move of a bot, e.g. {"bot": "search", "time_budget": 0.5}
+    GET  /api/games/<game_id>/analysis the score, best move and principal variation, e.g. ?time_budget=0.5
+    POST /api/analysis                analyses {"board": [...], "current_player": 0} (a board as in the
+                                      state of a game), or many positions at once with {"positions": [...]}
+
+Anyone who knows the game_id can follow a game, but moves are only
+played with the token of the players, sent as "Authorization: Bearer
+<token>" (a browser game sends its session cookie instead).
+
+Analyses are cached for every client (see analysis.py), so asking
+about a position again, or any of its rotations, is answered at once.
+The positions of one request can search for at most
+MAX_ANALYSIS_TOTAL_TIME seconds together.
+
+The games are the same sessions as the browser games. Responses with the
+state of a game have its version as their ETag, so a client can send it
+back in If-None-Match and get an empty 304 Not Modified until it changes.
+Instead of polling, a client can listen to the events of a game: it gets
+a state event first, then a move event for every move (with its version),
+a state event for any other change (e.g. a gobbler picked up on the page
+of app.py but not placed yet), a new_game event when the game is
+restarted, and a resync event if it has missed events and should get the
+state again.
+"""
+import json
+from flask import Blueprint, Response, current_app, jsonify, request
+from analysis import AnalysisCache, analyze, analyze_many
+from logic import Game
+from sessions import SESSION_COOKIE
+from simulate import BOT_TYPES, choose_move
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+# the options a client can give each type of bot, and their largest values
+BOT_OPTIONS = {
+    'random': {},
+    'search': {'time_budget': 5.0},
+    'mcts': {'playouts': 20000},
+}
+# the longest an analysis can search each position, the most positions in
+# one request, and the longest that all of the positions can search together
+MAX_ANALYSIS_TIME = 5.0
+MAX_ANALYSIS_POSITIONS = 100
+MAX_ANALYSIS_TOTAL_TIME = 10.0
+
+def _sessions():
+    return current_app.extensions['sessions']
+
+def analysis_cache(app) -> AnalysisCache:
+    """
+    returns the analysis cache of the app, shared by all of its requests
+    """
+    return app.extensions.setdefault('analysis_cache', AnalysisCache())
+
+def _analysis_cache() -> AnalysisCache:
+    return analysis_cache(current_app)
+
+def _error(message: str, status: int):
+    return jsonify({'error': message}), status
+
+def _not_modified(version: int):
+    """
+    returns an empty 304 response if the client
+    has this version already, otherwise None
+    """
+    if str(version) not in request.if_none_match:
+        return None
+    response = current_app.response_class(status=304)
+    response.set_etag(str(version))
+    return response
+
+def _versioned(data: dict, version: int, status: int = 200):
+    response = jsonify(data)
+    response.status_code = status
+    response.set_etag(str(version))
+    return response
+
+def player_token(authorization: str, cookie: str) -> str:
+    """
+    returns the token that a request plays moves with, from its
+    Authorization header or else its session cookie, or None
+    """
+    scheme, _, token = (authorization or '').partition(' ')
+    if scheme.lower() == 'bearer' and token.strip():
+        return token.strip()
+    return cookie or None
+
+def _authorized(session) -> bool:
+    return session.authorized(player_token(request.headers.get('Authorization'), request.cookies.get(SESSION_COOKIE)))
+
+def parse_bot_request(data: dict) -> tuple:
+    """
+    returns the (bot_type, bot_options) of a bot-move request,
+    raises ValueError if they aren't valid
+    """
+    if not isinstance(data, dict):
+        raise ValueError('the request must be a json object')
+    bot_type = data.get('bot', 'search')
+    if bot_type not in BOT_TYPES:
+        raise ValueError(f'bot must be one of {", ".join(BOT_TYPES)}')
+    options = {}
+    for name, maximum in BOT_OPTIONS[bot_type].items():
+        if name in data:
+            try:
+                value = type(maximum)(data[name])
+            except (TypeError, ValueError):
+                raise ValueError(f'{name} must be a number')
+            if not 0 < value <= maximum:
+                raise ValueError(f'{name} must be more than 0 and at most {maximum}')
+            options[name] = value
+    return bot_type, {bot_type: options}
+
+def parse_time_budget(value, default: float = 1.0) -> float:
+    """
+    returns the time budget of an analysis request,
+    raises ValueError if it isn't valid
+    """
+    if value is None:
+        return default
+    try:
+        time_budget = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('time_budget must be a number')
+    if not 0 < time_budget <= MAX_ANALYSIS_TIME:
+        raise ValueError(f'time_budget must be more than 0 and at most {MAX_ANALYSIS_TIME}')
+    return time_budget
+
+def parse_position(data: dict) -> Game:
+    """
+    returns the game of a {"board": [...], "current_player": 0} position,
+    raises ValueError if it isn't valid
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('board'), list):
+        raise ValueError('a position must be a json object with a board')
+    try:
+        return Game.from_board(data['board'], data.get('current_player', 0))
+    except (TypeError, ValueError) as error:
+        raise ValueError(f'invalid board: {error}')
+
+def parse_analysis_request(data: dict) -> tuple:
+    """
+    returns the (games, time_budget, batch) of a POST /api/analysis
+    request, where batch tells whether it asked for many positions,
+    raises ValueError if it isn't valid
+    """
+    if not isinstance(data, dict):
+        raise ValueError('the request must be a json object')
+    time_budget = parse_time_budget(data.get('time_budget'))
+    if 'positions' not in data:
+        return [parse_position(data)], time_budget, False
+    positions = data['positions']
+    if not isinstance(positions, list) or not 0 < len(positions) <= MAX_ANALYSIS_POSITIONS:
+        raise ValueError(f'positions must be a list of 1 to {MAX_ANALYSIS_POSITIONS} positions')
+    if len(positions) * time_budget > MAX_ANALYSIS_TOTAL_TIME:
+        raise ValueError(f'the positions times time_budget must be at most {MAX_ANALYSIS_TOTAL_TIME} seconds')
+    return [parse_position(position) for position in positions], time_budget, True
+
+@api.route('/games', methods=['POST'])
+def create_game():
+    data = request.get_json(silent=True) or {}
+    session_id = _sessions().create().session_id
+    with _sessions().use(session_id) as session:
+        if session is None:
+            return _error('the server has too many games', 503)
+        if 'players' in data:
+            players = data['players']
+            if not isinstance(players, list) or len(players) != 2 or not all(isinstance(name, str) for name in players):
+                _sessions().remove(session.session_id)
+                return _error('players must be a list of two names', 400)
+            success, message = session.game.set_player_names(players)
+            if not success:
+                _sessions().remove(session.session_id)
+                return _error(message, 400)
+            session.version += 1
+        # the token is only ever given to whoever started the game
+        data = session.state()
+        data['token'] = session.session_id
+        return _versioned(data, session.version, 201)
+
+@api.route('/games/<game_id>', methods=['GET'])
+def game_state(game_id):
+    with _sessions().use_game(game_id) as session:
+        if session is None:
+            return _error('no such game', 404)
+        # don't build the state if the client has it already
+        not_modified = _not_modified(session.version)
+        if not_modified is not None:
+            return not_modified
+        return _versioned(session.state(), session.version)
+
+@api.route('/games/<game_id>/moves', methods=['GET'])
+def legal_moves(game_id):
+    with _sessions().use_game(game_id) as session:
+        if session is None:
+            return _error('no such game', 404)
+        not_modified = _not_modified(session.version)
+        if not_modified is not None:
+            return not_modified
+        moves = [list(move) for move in session.game.legal_moves()]
+        return _versioned({'version': session.version, 'moves': moves}, session.version)
+
+@api.route('/games/<game_id>/moves', methods=['POST'])
+def play_move(game_id):
+    data = request.get_json(silent=True) or {}
+    try:
+        gobbler_size = int(data['gobbler_size'])
+        board_position = int(data['board_position'])
+    except (KeyError, TypeError, ValueError):
+        return _error('gobbler_size and board_position must be integers', 400)
+
+    with _sessions().use_game(game_id) as session:
+        if session is None:
+            return _error('no such game', 404)
+        if not _authorized(session):
+            return _error('moves need the token of the players', 403)
+        if not session.play(gobbler_size, board_position):
+            return _error('illegal move', 409)
+        return _versioned(session.state(), session.version)
+
+@api.route('/games/<game_id>/bot-move', methods=['POST'])
+def play_bot_move(game_id):
+    try:
+        bot_type, bot_options = parse_bot_request(request.get_json(silent=True) or {})
+    except ValueError as error:
+        return _error(str(error), 400)
+
+    # the bot thinks about a copy of the game, so that the game can be
+    # watched meanwhile, and the move is only played if it hasn't changed
+    with _sessions().use_game(game_id) as session:
+        if session is None:
+            return _error('no such game', 404)
+        if not _authorized(session):
+            return _error('moves need the token of the players', 403)
+        game = session.game.copy()
+        version = session.version
+    if next(game.legal_moves(), None) is None:
+        return _error('there are no moves to play', 409)
+    move = choose_move(game, bot_type, bot_options=bot_options)
+    with _sessions().use_game(game_id) as session:
+        if session is None:
+            return _error('no such game', 404)
+        if session.version != version:
+            return _error('the game changed while the bot was thinking', 409)
+        session.play(*move)
+        return _versioned(session.state(), session.version)
+
+@api.route('/games/<game_id>/analysis', methods=['GET'])
+def game_analysis(game_id):
+    try:
+        time_budget = parse_time_budget(request.args.get('time_budget'))
+    except ValueError as error:
+        return _error(str(error), 400)
+
+    # search a copy so that the players don't wait for the analysis
+    with _sessions().use_game(game_id) as session:
+        if session is None:
+            return _error('no such game', 404)
+        game = session.game.copy()
+        version = session.version
+    data = analyze(game, time_budget, _analysis_cache()).to_dict()
+    data['version'] = version
+    return jsonify(data)
+
+@api.route('/analysis', methods=['POST'])
+def analyze_positions():
+    try:
+        games, time_budget, batch = parse_analysis_request(request.get_json(silent=True))
+    except ValueError as error:
+        return _error(str(error), 400)
+    analyses = analyze_many(games, time_budget, _analysis_cache())
+    return jsonify(analyses_response(analyses, batch))
+
+def analyses_response(analyses: list, batch: bool) -> dict:
+    if not batch:
+        return analyses[0].to_dict()
+    return {'analyses': [analysis.to_dict() for analysis in analyses]}
+
+@api.route('/games/<game_id>/events', methods=['GET'])
+def game_events(game_id):
+    last_event_id = request.headers.get('Last-Event-ID')
+
+    # subscribe before getting the state so that no move is missed,
+    # a move that is in both has the same version
+    events = _sessions().events
+    subscription = events.subscribe(game_id, last_event_id)
+    with _sessions().use_game(game_id) as session:
+        if session is None:
+            subscription.close()
+            return _error('no such game', 404)
+        state = session.state()
+
+    def stream():
+        yield f'event: state\ndata: {json.dumps(state)}\n\n'.encode()
+        yield from subscription
+
+    response = Response(stream(), mimetype='text/event-stream')
+    # unsubscribe when the client goes away, even if nothing was sent yet
+    response.call_on_close(subscription.close)
+    response.headers['Cache-Control'] = 'no-cache'
+    # don't let proxies hold the events back
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,65 +1,134 @@
-from flask import Flask, render_template, request, redirect
-from logic import Game, GameStats
+import time
+from flask import Flask, Response, abort, g, render_template, request, redirect, make_response
+from api import api
+from charts import default_renderer
+from sessions import SESSION_COOKIE, SessionStore
+import metrics
 
 app = Flask(__name__)
-game = Game()
-game_stats = GameStats()
+# every client plays its own game, see sessions.py
+sessions = SessionStore()
+app.extensions['sessions'] = sessions
+# the json api for bots and other programs, see api.py
+app.register_blueprint(api)
+
+@app.before_request
+def _start_timer():
+    if metrics.enabled:
+        g.request_start = time.perf_counter()
+
+@app.after_request
+def _record_latency(response):
+    start = g.get('request_start')
+    if start is not None:
+        # labelled with the rule rather than the path, so that
+        # every game doesn't get its own metric
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                        (request.method, route, str(response.status_code)))
+    return response
+
+@app.route("/metrics", methods=['GET'])
+def metrics_page():
+    # metrics are opt-in, see metrics.py
+    if not metrics.enabled:
+        abort(404)
+    return Response(metrics.exposition(), mimetype='text/plain; version=0.0.4')
+
+def _with_session_cookie(response, session_id: str):
+    response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite='Lax')
+    return response
 
 @app.route("/play", methods=['POST','GET'])
 def play():
-    global game
-
-    # make a play
-    message = None
-    play_button_pressed = ('Play' in request.form.getlist('button'))
-    if request.method == 'POST' and play_button_pressed:
-        selected_gobbler = request.form['gobbler_size']
-        board_position = request.form['board_position']
-        select_success = game.select_gobbler(selected_gobbler)
-        place_success, winner = game.place_selected_gobbler(board_position)
-        
-        if not select_success or not place_success:
-            message = 'Invalid selection!'   
-        else:
-            game_stats.record_move(selected_gobbler, board_position)
-
-        if winner is not None:
-            game_stats.save(winner)
-
-    # start a new game
-    new_game_button_pressed = ('New Game' in request.form.getlist('button')) 
-    if request.method == 'POST' and new_game_button_pressed:
-        return redirect('/')
+    with sessions.use(request.cookies.get(SESSION_COOKIE)) as session:
+        # the game has expired, or was never started
+        if session is None:
+            return redirect('/')
+        game = session.game
+
+        # make a play
+        message = None
+        play_button_pressed = ('Play' in request.form.getlist('button'))
+        if request.method == 'POST' and play_button_pressed:
+            selected_gobbler = request.form['gobbler_size']
+            board_position = request.form['board_position']
+            # a gobbler may be left selected by an earlier invalid selection
+            previously_selected = game.selected_gobbler
+            previous_hash = game.zobrist_hash
+            select_success = game.select_gobbler(selected_gobbler)
+            place_success, winner = game.place_selected_gobbler(board_position)
 
-    # view stats
-    stats_button_pressed = ('View Stats' in request.form.getlist('button')) 
-    if request.method == 'POST' and stats_button_pressed:
-        return redirect('/stats')
+            if not select_success or not place_success:
+                message = 'Invalid selection!'
+                if place_success:
+                    # the gobbler that was left selected has been placed
+                    session.moved(previously_selected.size, board_position, winner)
+                elif game.zobrist_hash != previous_hash:
+                    # a gobbler has been picked up but not placed
+                    session.changed()
+            else:
+                session.moved(selected_gobbler, board_position, winner)
+
+        # start a new game
+        new_game_button_pressed = ('New Game' in request.form.getlist('button'))
+        if request.method == 'POST' and new_game_button_pressed:
+            return redirect('/')
+
+        # view stats
+        stats_button_pressed = ('View Stats' in request.form.getlist('button'))
+        if request.method == 'POST' and stats_button_pressed:
+            return redirect('/stats')
+
+        return render_template('play.html', game=game, message=message,
+                               game_id=session.game_id, version=session.version)
+
+@app.route("/watch/<game_id>", methods=['GET'])
+def watch(game_id):
+    # anyone with the public id of a game can follow it, but not play
+    with sessions.use_game(game_id) as session:
+        if session is None:
+            abort(404)
+        return render_template('play.html', game=session.game, message=None, spectator=True,
+                               game_id=session.game_id, version=session.version)
 
-    return render_template('play.html', game=game, message=message)
-    
 
 @app.route("/", methods=['POST','GET'])
 def index():
-    global game
-    button_pressed = ('Start Game' in request.form.getlist('button'))
-    if request.method == 'POST' and button_pressed:
-        player_names = request.form.getlist('name')
-        success, response = game.set_player_names(player_names)
-        if success:
-            return redirect('/play')
-    elif request.method == 'GET':
-        # start a new game when the index page is loaded
-        game = Game() 
-    return render_template('index.html')
+    session_id = request.cookies.get(SESSION_COOKIE)
+    with sessions.use(session_id) as session:
+        if session is None:
+            session = sessions.create()
+            session_id = session.session_id
+
+        button_pressed = ('Start Game' in request.form.getlist('button'))
+        if request.method == 'POST' and button_pressed:
+            player_names = request.form.getlist('name')
+            success, response = session.game.set_player_names(player_names)
+            if success:
+                # spectators see the names at once
+                session.changed()
+                return _with_session_cookie(redirect('/play'), session_id)
+        elif request.method == 'GET':
+            # start a new game when the index page is loaded
+            session.new_game()
+    return _with_session_cookie(make_response(render_template('index.html')), session_id)
 
 @app.route("/stats", methods=['POST','GET'])
 def stats():
-    global game_stats
     new_game_button_pressed = ('New Game' in request.form.getlist('button'))
     if request.method == 'POST' and new_game_button_pressed:
         return redirect('/')
-    return render_template('stats.html')
+
+    # the chart urls change when the charts do, so the
+    # page can be cached until another game is finished
+    # a render of the last game may still be running
+    charts = default_renderer()
+    charts.wait(timeout=2)
+    chart_urls = charts.urls()
+    response = make_response(render_template('stats.html', chart_urls=chart_urls))
+    response.set_etag(f'stats-{charts.version}')
+    return response.make_conditional(request)
 
 if __name__ == "__main__":
     app.run(debug=True, port=8000)
\ No newline at end of file
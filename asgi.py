@@ -0,0 +1,356 @@
+"""
+An asyncio serving mode for app.py, as an ASGI application that
+any ASGI server can run, e.g.
+
+    uvicorn asgi:app --port 8000
+
+It serves the same routes and games as app.py:
+- the event streams of the games are served on the event loop, so an
+  open connection waiting for moves costs no thread
+- bot moves are chosen, and positions analysed, in a pool of worker
+  processes, so a long search never blocks the event loop or the other
+  requests. Analyses are still cached in this process, see analysis.py,
+  and the workers return what they searched so that it is counted in the
+  metrics of this process, see metrics.py
+- every other request is handed to the Flask app in a thread pool,
+  since they only take a moment
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+from analysis import analyze_many, cached, remember
+from api import (analyses_response, analysis_cache, parse_analysis_request, parse_bot_request,
+                 parse_time_budget, player_token)
+from app import app as flask_app, sessions
+from sessions import SESSION_COOKIE
+from simulate import choose_move_and_search
+import metrics
+
+class AsgiApp:
+    def __init__(self, wsgi_app, sessions, threads: int = 32, bot_workers: int = None):
+        """
+        wsgi_app is the Flask app that handles the other requests,
+        sessions its SessionStore
+        """
+        self.wsgi_app = wsgi_app
+        self.sessions = sessions
+        self.threads = threads
+        self.bot_workers = bot_workers if bot_workers is not None else os.cpu_count() or 1
+        # the pools are only started when they are needed
+        self._thread_pool = None
+        self._process_pool = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        route = self._route(scope)
+        if route is None:
+            await self._wsgi(scope, receive, send)
+        elif metrics.enabled:
+            await self._timed(scope, receive, send, *route)
+        else:
+            await route[1](scope, receive, send)
+
+    def _route(self, scope) -> tuple:
+        """
+        returns (rule, handler) of the routes that are served here rather
+        than by the Flask app, with the rule as app.py names it, or None
+        """
+        parts = scope['path'].strip('/').split('/')
+        if len(parts) == 4 and parts[:2] == ['api', 'games']:
+            game_id = parts[2]
+            if scope['method'] == 'GET' and parts[3] == 'events':
+                return '/api/games/<game_id>/events', lambda *args: self._events(*args, game_id)
+            if scope['method'] == 'POST' and parts[3] == 'bot-move':
+                return '/api/games/<game_id>/bot-move', lambda *args: self._bot_move(*args, game_id)
+            if scope['method'] == 'GET' and parts[3] == 'analysis':
+                return '/api/games/<game_id>/analysis', lambda *args: self._game_analysis(*args, game_id)
+        if parts == ['api', 'analysis'] and scope['method'] == 'POST':
+            return '/api/analysis', self._analyze_positions
+        return None
+
+    async def _timed(self, scope, receive, send, rule: str, handler) -> None:
+        # timed until the response starts, as app.py times its routes,
+        # so that an event stream counts the time to its first event
+        start = time.perf_counter()
+
+        async def timed_send(message):
+            if message['type'] == 'http.response.start':
+                metrics.REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                                (scope['method'], rule, str(message['status'])))
+            await send(message)
+
+        await handler(scope, receive, timed_send)
+
+    def close(self) -> None:
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown()
+        if self._process_pool is not None:
+            self._process_pool.shutdown()
+
+    def _run_in_thread(self, function, *args):
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(self.threads, thread_name_prefix='asgi')
+        return asyncio.get_running_loop().run_in_executor(self._thread_pool, function, *args)
+
+    def _run_in_process(self, function, *args):
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(self.bot_workers)
+        return asyncio.get_running_loop().run_in_executor(self._process_pool, function, *args)
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.sessions.events.close()
+                self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _events(self, scope, receive, send, game_id: str) -> None:
+        headers = dict(scope['headers'])
+        last_event_id = headers[b'last-event-id'].decode('latin-1') if b'last-event-id' in headers else None
+
+        # subscribe before getting the state so that no move is missed,
+        # as in api.game_events
+        subscription = self.sessions.events.subscribe(game_id, last_event_id)
+        try:
+            state = await self._run_in_thread(self._state, game_id)
+            if state is None:
+                await _send_json(send, 404, {'error': 'no such game'})
+                return
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+                            (b'x-accel-buffering', b'no')],
+            })
+            await send({'type': 'http.response.body', 'more_body': True,
+                        'body': f'event: state\ndata: {json.dumps(state)}\n\n'.encode()})
+
+            # stream until the client goes away
+            stream = asyncio.ensure_future(self._stream(subscription, send))
+            disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+            await asyncio.wait([stream, disconnect], return_when=asyncio.FIRST_COMPLETED)
+            for task in (stream, disconnect):
+                task.cancel()
+        finally:
+            subscription.close()
+
+    async def _stream(self, subscription, send) -> None:
+        async for message in subscription:
+            await send({'type': 'http.response.body', 'body': message, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    def _state(self, game_id: str) -> dict:
+        with self.sessions.use_game(game_id) as session:
+            return None if session is None else session.state()
+
+    async def _bot_move(self, scope, receive, send, game_id: str) -> None:
+        body = await _read_body(receive)
+        headers = dict(scope['headers'])
+        cookies = SimpleCookie(headers.get(b'cookie', b'').decode('latin-1'))
+        token = player_token(headers.get(b'authorization', b'').decode('latin-1'),
+                             cookies[SESSION_COOKIE].value if SESSION_COOKIE in cookies else None)
+        try:
+            bot_type, bot_options = parse_bot_request(json.loads(body or b'{}'))
+        except ValueError as error:
+            await _send_json(send, 400, {'error': str(error)})
+            return
+
+        # the bot thinks about a copy of the game in another process,
+        # and the move is only played if the game hasn't changed meanwhile
+        snapshot = await self._run_in_thread(self._snapshot, game_id, token)
+        if snapshot is None:
+            await _send_json(send, 404, {'error': 'no such game'})
+            return
+        if snapshot is False:
+            await _send_json(send, 403, {'error': 'moves need the token of the players'})
+            return
+        game, version = snapshot
+        if next(game.legal_moves(), None) is None:
+            await _send_json(send, 409, {'error': 'there are no moves to play'})
+            return
+        move, search = await self._run_in_process(choose_move_and_search, game, bot_type, None, bot_options)
+        if search is not None and metrics.enabled:
+            metrics.record_search(*search)
+        status, data = await self._run_in_thread(self._play, game_id, version, move)
+        await _send_json(send, status, data, data.get('version'))
+
+    async def _game_analysis(self, scope, receive, send, game_id: str) -> None:
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        try:
+            time_budget = parse_time_budget(query.get('time_budget', [None])[0])
+        except ValueError as error:
+            await _send_json(send, 400, {'error': str(error)})
+            return
+
+        # as in api.game_analysis, a copy is analysed so that the players don't wait
+        snapshot = await self._run_in_thread(self._copy, game_id)
+        if snapshot is None:
+            await _send_json(send, 404, {'error': 'no such game'})
+            return
+        game, version = snapshot
+        data = (await self._analyze(game, time_budget=time_budget))[0].to_dict()
+        data['version'] = version
+        await _send_json(send, 200, data)
+
+    async def _analyze_positions(self, scope, receive, send) -> None:
+        body = await _read_body(receive)
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        try:
+            games, time_budget, batch = parse_analysis_request(data)
+        except ValueError as error:
+            await _send_json(send, 400, {'error': str(error)})
+            return
+        analyses = await self._analyze(*games, time_budget=time_budget)
+        await _send_json(send, 200, analyses_response(analyses, batch))
+
+    async def _analyze(self, *games, time_budget: float) -> list:
+        """
+        returns the Analysis of each game, from the cache of the app,
+        or searched in the worker processes and then cached
+        """
+        cache = analysis_cache(self.wsgi_app)
+        analyses = await self._run_in_thread(lambda: [cached(game, time_budget, cache) for game in games])
+        missing = [game for game, analysis in zip(games, analyses) if analysis is None]
+        if missing:
+            searched = iter(await self._run_in_process(analyze_many, missing, time_budget))
+            for n, game in enumerate(games):
+                if analyses[n] is None:
+                    analyses[n] = next(searched)
+                    remember(game, time_budget, analyses[n], cache)
+                    if metrics.enabled and game.winner is None:
+                        metrics.record_search('search', analyses[n].nodes, analyses[n].seconds, analyses[n].depth)
+        return analyses
+
+    def _copy(self, game_id: str) -> tuple:
+        with self.sessions.use_game(game_id) as session:
+            return None if session is None else (session.game.copy(), session.version)
+
+    def _snapshot(self, game_id: str, token: str) -> tuple:
+        """
+        returns a copy of the game and its version, None if there
+        is no such game or False if token isn't the players'
+        """
+        with self.sessions.use_game(game_id) as session:
+            if session is None:
+                return None
+            if not session.authorized(token):
+                return False
+            return session.game.copy(), session.version
+
+    def _play(self, game_id: str, version: int, move: tuple) -> tuple:
+        with self.sessions.use_game(game_id) as session:
+            if session is None:
+                return 404, {'error': 'no such game'}
+            if session.version != version:
+                return 409, {'error': 'the game changed while the bot was thinking'}
+            session.play(*move)
+            return 200, session.state()
+
+    async def _wsgi(self, scope, receive, send) -> None:
+        body = await _read_body(receive)
+        status, headers, body = await self._run_in_thread(self._call_wsgi, _wsgi_environ(scope, body))
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    def _call_wsgi(self, environ: dict) -> tuple:
+        response = []
+
+        def start_response(status, headers, exc_info=None):
+            response[:] = [status, headers]
+
+        chunks = self.wsgi_app(environ, start_response)
+        try:
+            body = b''.join(chunks)
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+        return response[0], response[1], body
+
+async def _read_body(receive) -> bytes:
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return body
+        body += message.get('body', b'')
+        if not message.get('more_body', False):
+            return body
+
+async def _wait_for_disconnect(receive) -> None:
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+async def _send_json(send, status: int, data: dict, etag=None) -> None:
+    headers = [(b'content-type', b'application/json')]
+    if etag is not None:
+        headers.append((b'etag', f'"{etag}"'.encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': json.dumps(data).encode()})
+
+def _wsgi_environ(scope: dict, body: bytes) -> dict:
+    """
+    returns the WSGI environ of an ASGI http request
+    """
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    # the whole body has been read, whether or not it was chunked
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+app = AsgiApp(flask_app, sessions)
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit('Serving the asyncio mode needs an ASGI server, e.g. pip install uvicorn')
+    uvicorn.run(app, port=8000)
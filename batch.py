@@ -0,0 +1,122 @@
+"""
+A batch version of the game engine that plays many games at once
+with NumPy array operations, for large numbers of playouts.
+
+The state of every game uses the same encoding as logic.Game:
+each gobbler has a code, (size - 1) * 2 + player, and each cell a
+12-bit stack with bit `code` set for every gobbler in it, so the top
+gobbler of a cell is its highest set bit.
+Moves are encoded with logic.encode_move, i.e. (size - 1) * 9 + cell.
+"""
+import numpy as np
+from logic import FIRST_WINNING_COMBINATION
+
+SIDELINE = 9
+
+# the code of the top gobbler of every 12-bit stack, or -1 if it is empty
+TOP_CODE = np.array([stack.bit_length() - 1 for stack in range(4096)], dtype=np.int8)
+_FIRST_WINNING_COMBINATION = np.array(FIRST_WINNING_COMBINATION, dtype=np.int8)
+_CELL_BITS = (1 << np.arange(9)).astype(np.int16)
+
+class BatchGame:
+    def __init__(self, number_of_games: int, number_of_gobblers: int = 6):
+        self.number_of_games = number_of_games
+        self.number_of_gobblers = number_of_gobblers
+        self.stacks = np.zeros((number_of_games, 9), dtype=np.int16)
+        # the cell of every gobbler (by code), SIDELINE if it isn't on the board
+        self.cells = np.full((number_of_games, 2 * number_of_gobblers), SIDELINE, dtype=np.int8)
+        self.current_player = np.zeros(number_of_games, dtype=np.int8)
+        self.winner = np.full(number_of_games, -1, dtype=np.int8) # -1 while nobody has won
+        self.plies = np.zeros(number_of_games, dtype=np.int32)
+        self._games = np.arange(number_of_games)
+
+    def legal_move_mask(self) -> np.ndarray:
+        """
+        returns a boolean array of shape (number_of_games, number_of_gobblers * 9),
+        True where the move with that encoding is legal.
+        Games that are over have no legal moves
+        """
+        n = self.number_of_gobblers
+        games = self._games
+        top = TOP_CODE[self.stacks] # (games, 9)
+        size_idx = np.arange(n)
+
+        # the gobblers of the current player, and whether they are free to move
+        codes = size_idx[None, :] * 2 + self.current_player[:, None] # (games, sizes)
+        origins = self.cells[games[:, None], codes] # (games, sizes)
+        on_board = origins != SIDELINE
+        origin_top = top[games[:, None], np.where(on_board, origins, 0)]
+        movable = ~on_board | (origin_top == codes)
+
+        # a gobbler can go where the top is smaller than it,
+        # but not back where it came from
+        destinations = top[:, None, :] < (size_idx * 2)[None, :, None] # (games, sizes, 9)
+        destinations &= origins[:, :, None] != np.arange(9)[None, None, :]
+        destinations &= movable[:, :, None]
+        destinations &= (self.winner == -1)[:, None, None]
+        return destinations.reshape(self.number_of_games, n * 9)
+
+    def apply_moves(self, moves: np.ndarray) -> None:
+        """
+        plays one move in every game, moves is an array of encoded
+        moves with -1 for games that shouldn't move.
+        The moves must be legal, see legal_move_mask
+        """
+        moves = np.asarray(moves)
+        games = np.nonzero(moves >= 0)[0]
+        if len(games) == 0:
+            return
+        moves = moves[games]
+        player = self.current_player[games]
+        codes = (moves // 9) * 2 + player
+        destinations = moves % 9
+        bits = (1 << codes).astype(np.int16)
+
+        # pick the gobblers up
+        origins = self.cells[games, codes]
+        on_board = origins != SIDELINE
+        self.stacks[games[on_board], origins[on_board]] ^= bits[on_board]
+
+        # and put them down
+        self.stacks[games, destinations] |= bits
+        self.cells[games, codes] = destinations
+        self.current_player[games] = player ^ 1
+        self.plies[games] += 1
+
+        # the first winning combination found wins,
+        # whoever it belongs to
+        top = TOP_CODE[self.stacks[games]]
+        occupied = top >= 0
+        visible_1 = ((occupied & (top & 1 == 1)) * _CELL_BITS).sum(axis=1)
+        visible_0 = ((occupied & (top & 1 == 0)) * _CELL_BITS).sum(axis=1)
+        first_0 = _FIRST_WINNING_COMBINATION[visible_0]
+        first_1 = _FIRST_WINNING_COMBINATION[visible_1]
+        winner = np.where(first_0 < first_1, 0, np.where(first_1 < first_0, 1, -1))
+        self.winner[games] = winner
+
+    def playout(self, policy, max_plies: int = 200) -> np.ndarray:
+        """
+        plays every game until it is over or max_plies have been played.
+        policy(batch, mask) returns a move for each game, given the legal
+        move mask. Returns the winners, -1 for games without a winner
+        """
+        for _ in range(max_plies):
+            mask = self.legal_move_mask()
+            has_moves = mask.any(axis=1)
+            if not has_moves.any():
+                break
+            moves = np.where(has_moves, policy(self, mask), -1)
+            self.apply_moves(moves)
+        return self.winner
+
+    def random_playout(self, rng: np.random.Generator = None, max_plies: int = 200) -> np.ndarray:
+        """
+        plays random legal moves in every game, see playout
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+
+        def random_policy(batch, mask):
+            # the legal move with the highest random priority
+            return np.argmax(rng.random(mask.shape) * mask, axis=1)
+
+        return self.playout(random_policy, max_plies)
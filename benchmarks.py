@@ -0,0 +1,342 @@
+"""
+Benchmarks of the game engine, the bots, the stats and the web app,
+to tell whether a change made things faster or slower.
+
+Every benchmark is run a few times and the statistics of the runs are
+printed, and saved as json with --output so that two commits can be
+compared with --compare:
+
+    python benchmarks.py --output before.json
+    git checkout my-branch
+    python benchmarks.py --output after.json --compare before.json
+
+The positions and games are made from a fixed seed, so every run and
+every commit measures the same work.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from logic import Game, GameStats
+from charts import ChartRenderer
+from game_records import GameRecordWriter
+from mcts import MCTS
+from search import Search
+from stats_store import BinaryStatsBackend
+
+SEED = 1
+
+class BenchmarkResult:
+    def __init__(self, name: str, unit: str, values: list, higher_is_better: bool = True):
+        """
+        values are what each run measured, e.g. the moves per second of
+        each run, or the seconds that each request took
+        """
+        self.name = name
+        self.unit = unit
+        self.values = values
+        self.higher_is_better = higher_is_better
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.values)
+
+    def percentile(self, percent: float) -> float:
+        values = sorted(self.values)
+        return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+    def to_dict(self) -> dict:
+        return {
+            'unit': self.unit,
+            'higher_is_better': self.higher_is_better,
+            'runs': len(self.values),
+            'min': min(self.values),
+            'max': max(self.values),
+            'mean': statistics.mean(self.values),
+            'median': self.median,
+            'stdev': statistics.stdev(self.values) if len(self.values) > 1 else 0.0,
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+    def __str__(self) -> str:
+        data = self.to_dict()
+        return (f'{self.name:<32} median {data["median"]:>12.6g} {self.unit:<14} '
+                f'min {data["min"]:.6g}  max {data["max"]:.6g}  stdev {data["stdev"]:.3g}  p95 {data["p95"]:.6g}')
+
+def _rate(function, repeat: int) -> list:
+    """
+    runs function repeat times, and returns how many
+    things it did per second in each run
+    """
+    rates = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = function()
+        rates.append(count / (time.perf_counter() - start))
+    return rates
+
+def random_games(number_of_games: int, seed: int = SEED, max_plies: int = 100) -> list:
+    """
+    returns the moves of number_of_games random games
+    """
+    rng = random.Random(seed)
+    games = []
+    for _ in range(number_of_games):
+        game = Game()
+        moves = []
+        while game.winner is None and len(moves) < max_plies:
+            legal_moves = list(game.legal_moves())
+            if not legal_moves:
+                break
+            move = rng.choice(legal_moves)
+            game.apply_move(move)
+            moves.append(move)
+        games.append(moves)
+    return games
+
+def random_positions(number_of_positions: int, seed: int = SEED) -> list:
+    """
+    returns games in the middle of random games, without a winner
+    """
+    positions = []
+    for moves in random_games(number_of_positions, seed):
+        game = Game()
+        for move in moves[:len(moves) // 2]:
+            game.apply_move(move)
+        positions.append(game)
+    return positions
+
+def bench_select_place(repeat: int = 5, number_of_games: int = 200) -> BenchmarkResult:
+    games = random_games(number_of_games)
+
+    def play():
+        for moves in games:
+            game = Game()
+            for gobbler_size, board_position in moves:
+                game.select_gobbler(gobbler_size)
+                game.place_selected_gobbler(board_position)
+        return sum(len(moves) for moves in games)
+
+    return BenchmarkResult('select_place', 'moves/s', _rate(play, repeat))
+
+def bench_check_for_winner(repeat: int = 5, calls: int = 20000) -> BenchmarkResult:
+    positions = random_positions(100)
+
+    def check():
+        for game in positions * (calls // len(positions)):
+            game._check_for_winner()
+        return calls
+
+    return BenchmarkResult('check_for_winner', 'calls/s', _rate(check, repeat))
+
+def bench_update_on_top(repeat: int = 5, calls: int = 20000) -> BenchmarkResult:
+    positions = random_positions(100)
+
+    def update():
+        for game in positions * (calls // len(positions)):
+            game._update_on_top()
+        return calls
+
+    return BenchmarkResult('update_on_top', 'calls/s', _rate(update, repeat))
+
+def bench_random_playouts(repeat: int = 5, number_of_games: int = 200) -> BenchmarkResult:
+    rng = random.Random(SEED)
+
+    def play():
+        # choosing the moves is part of what is measured
+        for _ in range(number_of_games):
+            game = Game()
+            for _ in range(100):
+                legal_moves = list(game.legal_moves())
+                if not legal_moves:
+                    break
+                game.apply_move(rng.choice(legal_moves))
+                if game.winner is not None:
+                    break
+        return number_of_games
+
+    return BenchmarkResult('random_playouts', 'games/s', _rate(play, repeat))
+
+def bench_search_bot(repeat: int = 5, depth: int = 3) -> BenchmarkResult:
+    # searched to a depth rather than for a time, so that
+    # a faster search gets through more moves
+    positions = random_positions(10)
+
+    def move():
+        search = Search()
+        for game in positions:
+            search.search(game, float('inf'), depth)
+        return len(positions)
+
+    return BenchmarkResult(f'search_bot_depth_{depth}', 'moves/s', _rate(move, repeat))
+
+def bench_mcts_bot(repeat: int = 5, playouts: int = 500) -> BenchmarkResult:
+    positions = random_positions(4)
+
+    def move():
+        mcts = MCTS(playouts=playouts)
+        for n, game in enumerate(positions):
+            mcts.search(game, seed=n)
+        return len(positions)
+
+    return BenchmarkResult(f'mcts_bot_{playouts}_playouts', 'moves/s', _rate(move, repeat))
+
+def bench_stats_save(repeat: int = 5, history_sizes: tuple = (0, 1000, 10000)) -> list:
+    """
+    returns the latency of GameStats.save (the stats, the game record
+    and the charts) after each number of games in history_sizes
+    """
+    # the games that were won, with their winners
+    games = [(moves, (len(moves) - 1) % 2) for moves in random_games(100) if len(moves) < 100]
+    results = []
+    directory = tempfile.mkdtemp()
+    try:
+        for history_size in history_sizes:
+            path = os.path.join(directory, f'{history_size}.bin')
+            backend = BinaryStatsBackend(path)
+            charts = ChartRenderer(backend, directory)
+            records = GameRecordWriter(os.path.join(directory, f'{history_size}.games.bin'))
+            if history_size:
+                backend.append([_stats(moves, backend, charts, records).get_record(winner)
+                                for _, (moves, winner) in zip(range(history_size), _cycle(games))])
+
+            latencies = []
+            for _, (moves, winner) in zip(range(repeat), _cycle(games)):
+                stats = _stats(moves, backend, charts, records)
+                start = time.perf_counter()
+                stats.save(winner)
+                latencies.append(time.perf_counter() - start)
+            results.append(BenchmarkResult(f'stats_save_{history_size}_games', 's', latencies, False))
+            charts.close()
+            records.close()
+            backend.close()
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+def _stats(moves: list, backend, charts, records) -> GameStats:
+    stats = GameStats(backend, charts, records)
+    for gobbler_size, board_position in moves:
+        stats.record_move(gobbler_size, board_position)
+    return stats
+
+def _cycle(values: list):
+    while True:
+        yield from values
+
+def bench_play_request(repeat: int = 5, requests: int = 50) -> BenchmarkResult:
+    """
+    returns the latency of playing a move with a POST to /play
+    """
+    from app import app
+    client = app.test_client()
+    # the last move of each game is left out, so that nothing is saved
+    games = [moves[:-1] for moves in random_games(20) if len(moves) > 1]
+
+    latencies = []
+    for _ in range(repeat):
+        played = 0
+        for moves in _cycle(games):
+            client.get('/')
+            client.post('/', data={'name': ['anna', 'bert'], 'button': 'Start Game'})
+            for gobbler_size, board_position in moves:
+                start = time.perf_counter()
+                client.post('/play', data={'gobbler_size': gobbler_size, 'board_position': board_position,
+                                           'button': 'Play'})
+                latencies.append(time.perf_counter() - start)
+                played += 1
+                if played == requests:
+                    break
+            if played == requests:
+                break
+    return BenchmarkResult('play_request', 's', latencies, False)
+
+BENCHMARKS = {
+    'select_place': bench_select_place,
+    'check_for_winner': bench_check_for_winner,
+    'update_on_top': bench_update_on_top,
+    'random_playouts': bench_random_playouts,
+    'search_bot': bench_search_bot,
+    'mcts_bot': bench_mcts_bot,
+    'stats_save': bench_stats_save,
+    'play_request': bench_play_request,
+}
+
+def run_benchmarks(names: list = None, repeat: int = 5, verbose: bool = True) -> dict:
+    """
+    runs the benchmarks with these names (all of them by default)
+    and returns their results, as they are saved with --output
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        benchmark_results = BENCHMARKS[name](repeat)
+        if isinstance(benchmark_results, BenchmarkResult):
+            benchmark_results = [benchmark_results]
+        for result in benchmark_results:
+            if verbose:
+                print(result)
+            results[result.name] = result.to_dict()
+    return {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeat': repeat,
+        'results': results,
+    }
+
+def compare(old: dict, new: dict) -> list:
+    """
+    returns (name, old median, new median, speedup) for the benchmarks
+    in both, where a speedup above 1 means that new is better
+    """
+    rows = []
+    for name, result in new['results'].items():
+        if name not in old['results']:
+            continue
+        old_median = old['results'][name]['median']
+        new_median = result['median']
+        if result['higher_is_better']:
+            speedup = new_median / old_median if old_median else float('inf')
+        else:
+            speedup = old_median / new_median if new_median else float('inf')
+        rows.append((name, old_median, new_median, speedup))
+    return rows
+
+def _commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the engine, the bots, the stats and the web app.')
+    parser.add_argument('benchmarks', nargs='*',
+                        help=f'the benchmarks to run, all of them by default: {", ".join(BENCHMARKS)}')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs of each benchmark')
+    parser.add_argument('--output', help='json file to save the results to')
+    parser.add_argument('--compare', help='json file of earlier results to compare with')
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f'unknown benchmarks: {", ".join(unknown)}')
+
+    results = run_benchmarks(args.benchmarks, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        print(f'\nCompared with {old.get("commit")}:')
+        for name, old_median, new_median, speedup in compare(old, results):
+            print(f'{name:<32} {old_median:>12.6g} -> {new_median:<12.6g} {speedup:.2f}x')
@@ -0,0 +1,184 @@
+"""
+An opening book: the best move of every position in the first few
+plies of the game, worked out offline with a deep search, so that
+bots don't have to search them during a game.
+
+Symmetric positions are stored once, under the canonical hash of the
+position (see symmetry.py), with the move for the canonical version.
+The file is a 16-byte header (magic, version, number of gobbler sizes,
+plies, number of positions) and three columns: the sorted hashes
+(8 bytes each), the moves (1 byte, encoded with logic.encode_move)
+and their scores (4 bytes). It is memory-mapped and looked up with a
+binary search, so it costs next to nothing to open however big it is.
+
+    python book.py book.bin --plies 3 --depth 5 --workers 4
+"""
+import argparse
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from logic import Game, encode_move, decode_move
+from search import Search
+from symmetry import canonicalize, canonical_hash, transform_move, inverse_transform_move
+
+MAGIC = b'GGOB'
+VERSION = 1
+# magic, version, number of gobbler sizes, plies, number of positions
+HEADER = struct.Struct('<4sBBBxQ')
+
+class OpeningBook:
+    def __init__(self, path: str = 'book.bin'):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, self.number_of_gobblers, self.plies, count = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not an opening book')
+        self.hits = 0
+        self.misses = 0
+
+        keys_offset, moves_offset, scores_offset = _offsets(count)
+        if count:
+            self._keys = np.memmap(path, dtype='<u8', mode='r', offset=keys_offset, shape=(count,))
+            self._moves = np.memmap(path, dtype=np.uint8, mode='r', offset=moves_offset, shape=(count,))
+            self._scores = np.memmap(path, dtype='<i4', mode='r', offset=scores_offset, shape=(count,))
+        else:
+            self._keys = np.zeros(0, dtype='<u8')
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def probe(self, game: Game) -> tuple:
+        """
+        returns (move, score) for the position, where move is a
+        (gobbler_size, board_position) pair and score is the search score
+        for the player to move, or None if the position isn't in the book
+        """
+        if game.winner is not None or game.number_of_gobblers != self.number_of_gobblers:
+            return None
+        _, transform = canonicalize(game)
+        key = canonical_hash(game, transform)
+        index = int(np.searchsorted(self._keys, np.uint64(key)))
+        if index == len(self._keys) or int(self._keys[index]) != key:
+            self.misses += 1
+            return None
+
+        move = inverse_transform_move(decode_move(int(self._moves[index])), transform)
+        # the hash could belong to another position, so check the move
+        if move not in set(game.legal_moves()):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return move, int(self._scores[index])
+
+    def best_move(self, game: Game) -> tuple:
+        """
+        returns the book move for the position, or None
+        """
+        entry = self.probe(game)
+        return None if entry is None else entry[0]
+
+    def close(self) -> None:
+        # the memory maps are closed when they are garbage collected
+        self._keys = self._moves = self._scores = None
+
+def open_book(path: str = 'book.bin') -> OpeningBook:
+    """
+    returns the opening book at path, or None if there isn't one
+    """
+    if not os.path.exists(path):
+        return None
+    return OpeningBook(path)
+
+def book_positions(plies: int, number_of_gobblers: int = 6) -> list:
+    """
+    returns one game for every position (up to symmetry) that can
+    come up in the first plies plies, without the finished ones
+    """
+    positions = []
+    seen = set()
+    frontier = [Game(number_of_gobblers)]
+    for ply in range(plies):
+        next_frontier = []
+        for game in frontier:
+            key = canonical_hash(game)
+            if key in seen or game.winner is not None:
+                continue
+            seen.add(key)
+            positions.append(game)
+            if ply + 1 < plies:
+                for move in game.legal_moves():
+                    child = game.copy()
+                    child.apply_move(move)
+                    next_frontier.append(child)
+        frontier = next_frontier
+    return positions
+
+def search_position(game: Game, depth: int, time_budget: float) -> tuple:
+    """
+    returns (key, encoded canonical move, score) of a position.
+    This is what the worker processes run
+    """
+    result = Search().search(game, time_budget, depth)
+    _, transform = canonicalize(game)
+    move = transform_move(result.move, transform)
+    return canonical_hash(game, transform), encode_move(move), result.score
+
+def build_book(path: str, plies: int = 3, depth: int = 5, time_budget: float = None,
+               workers: int = 1, number_of_gobblers: int = 6) -> int:
+    """
+    searches every position of the first plies plies to depth plies
+    (or for time_budget seconds each) and writes the book to path.
+    returns the number of positions in it
+    """
+    positions = book_positions(plies, number_of_gobblers)
+    time_budget = time_budget if time_budget is not None else float('inf')
+    depths = [depth] * len(positions)
+    budgets = [time_budget] * len(positions)
+    if workers == 1:
+        entries = list(map(search_position, positions, depths, budgets))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            entries = list(executor.map(search_position, positions, depths, budgets, chunksize=8))
+
+    entries.sort()
+    keys = np.array([key for key, _, _ in entries], dtype='<u8')
+    moves = np.array([move for _, move, _ in entries], dtype=np.uint8)
+    scores = np.array([score for _, _, score in entries], dtype='<i4')
+
+    # write the book next to the old one and swap them,
+    # so that a book that is in use is never half written
+    keys_offset, moves_offset, scores_offset = _offsets(len(entries))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, number_of_gobblers, plies, len(entries)))
+        f.write(keys.tobytes())
+        f.write(moves.tobytes())
+        f.write(b'\0' * (scores_offset - moves_offset - len(moves)))
+        f.write(scores.tobytes())
+    os.replace(tmp_path, path)
+    return len(entries)
+
+def _offsets(count: int) -> tuple:
+    """
+    returns the offsets of the keys, moves and scores columns,
+    with the scores aligned to 4 bytes
+    """
+    keys_offset = HEADER.size
+    moves_offset = keys_offset + 8 * count
+    scores_offset = (moves_offset + count + 3) // 4 * 4
+    return keys_offset, moves_offset, scores_offset
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build an opening book with a deep search of the first plies.')
+    parser.add_argument('path', help='the book file to write')
+    parser.add_argument('--plies', type=int, default=3, help='number of plies from the start to cover')
+    parser.add_argument('--depth', type=int, default=5, help='search depth of every position')
+    parser.add_argument('--time-budget', type=float, default=None, help='seconds to search every position')
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    count = build_book(args.path, args.plies, args.depth, args.time_budget, args.workers)
+    print(f'Wrote {count} positions to {args.path} in {time.monotonic() - start:.1f}s.')
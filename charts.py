@@ -0,0 +1,183 @@
+"""
+Renders the stats charts (static/winners.png, opening_moves.png and
+num_turns.png) from the stats aggregates.
+
+ChartRenderer keeps one matplotlib figure per chart and redraws it,
+instead of making new figures, and replaces each image file atomically
+so a page being served never gets a half-written image.
+Renders can be requested from a background thread: any number of
+games finished while a render is running are drawn by the next one.
+
+The images are versioned by the number of games they show, so
+their urls change when they do and can be cached by browsers.
+"""
+import logging
+import os
+import threading
+import time
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from stats_store import default_backend
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CHARTS = ['winners', 'opening_moves', 'num_turns']
+
+class ChartRenderer:
+    def __init__(self, backend=None, directory: str = 'static'):
+        """
+        backend is where the aggregates come from,
+        the default stats backend if it is None
+        """
+        self._backend = backend
+        self.directory = directory
+        self.version = None # the number of games in the images, None until they are rendered
+        self.renders = 0
+
+        # figures are made once and redrawn, pyplot isn't used
+        # because it isn't safe outside of the main thread
+        self._figures = {}
+        for name in CHARTS:
+            figure = Figure(figsize=(4, 4))
+            FigureCanvasAgg(figure)
+            self._figures[name] = figure
+
+        self._render_lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._requested = False
+        self._rendering = False
+        self._closed = False
+        self._thread = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = default_backend()
+        return self._backend
+
+    def render(self) -> int:
+        """
+        renders all of the charts now and returns their version
+        """
+        with self._render_lock:
+            start = time.perf_counter() if metrics.enabled else None
+            # a copy, so that games recorded meanwhile don't change it while it is drawn
+            aggregates = self.backend.aggregates
+            if start is not None:
+                read = time.perf_counter()
+                metrics.STATS_SAVE_SECONDS.observe(read - start, ('read',))
+            self._draw_winners(aggregates)
+            self._draw_opening_moves(aggregates)
+            self._draw_num_turns(aggregates)
+            os.makedirs(self.directory, exist_ok=True)
+            for name, figure in self._figures.items():
+                path = os.path.join(self.directory, f'{name}.png')
+                tmp_path = path + '.tmp'
+                figure.savefig(tmp_path, format='png')
+                os.replace(tmp_path, path)
+            if start is not None:
+                metrics.STATS_SAVE_SECONDS.observe(time.perf_counter() - read, ('render',))
+            self.version = aggregates.games
+            self.renders += 1
+            return self.version
+
+    def request_render(self) -> None:
+        """
+        renders the charts in the background and returns immediately
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._requested = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='chart-renderer', daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        waits for the requested renders to finish,
+        returns False if the timeout ran out first
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._requested and not self._rendering, timeout)
+
+    def urls(self, static_url: str = '/static') -> dict:
+        """
+        returns the versioned url of each chart,
+        rendering them first if this process hasn't yet
+        """
+        if self.version is None:
+            self.render()
+        return {name: f'{static_url}/{name}.png?v={self.version}' for name in CHARTS}
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _run(self) -> None:
+        try:
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._requested or self._closed)
+                    if self._closed:
+                        return
+                    # everything requested until now is drawn by this render
+                    self._requested = False
+                    self._rendering = True
+                try:
+                    self.render()
+                except Exception:
+                    # keep the thread going, the next game may render
+                    logger.exception('rendering the charts failed')
+                finally:
+                    with self._condition:
+                        self._rendering = False
+                        self._condition.notify_all()
+        finally:
+            # request_render starts another thread if this one is gone
+            with self._condition:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+    def _draw_winners(self, aggregates) -> None:
+        figure = self._figures['winners']
+        figure.clear()
+        axes = figure.add_subplot()
+        axes.bar(['Player 0', 'Player 1'], aggregates.wins, color=[(0,0,1), (1,191/255,0)], width = 0.3)
+        axes.set_title('Win Count')
+
+    def _draw_opening_moves(self, aggregates) -> None:
+        top_openers = aggregates.top_openers(5)
+        figure = self._figures['opening_moves']
+        figure.clear()
+        axes = figure.add_subplot()
+        axes.bar([move for move, _ in top_openers], [count for _, count in top_openers],
+                 color='maroon', width = 0.3)
+        axes.set_title('Successful Openers (Gobbler -> Board Pos.)')
+
+    def _draw_num_turns(self, aggregates) -> None:
+        num_turns = sorted(aggregates.turns)
+        figure = self._figures['num_turns']
+        figure.clear()
+        axes = figure.add_subplot()
+        axes.bar(num_turns, [aggregates.turns[n] for n in num_turns], color='blue')
+        axes.set_title('Num. of Turns Per Game')
+
+_renderers = {}
+_renderers_lock = threading.Lock()
+
+def default_renderer(directory: str = 'static') -> ChartRenderer:
+    """
+    returns the renderer of the default stats backend that is
+    shared by everything in this process
+    """
+    with _renderers_lock:
+        if directory not in _renderers:
+            _renderers[directory] = ChartRenderer(directory=directory)
+        return _renderers[directory]
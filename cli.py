@@ -1,4 +1,7 @@
+from book import open_book
 from logic import Game
+from mcts import MCTS
+from search import Search
 import random
 
 class Player:
@@ -22,68 +25,154 @@ class Human(Player):
         return input(text)
 
 class Bot(Player):
-    def __init__(self, player_number, name, game):
+    def __init__(self, player_number, name, game, seed=None, verbose=True):
         super().__init__(player_number, name, game)
+        self.rng = random.Random(seed)
+        self.verbose = verbose # whether to print what the bot is doing
+        self.book = None # the opening book that the bot plays from
 
     def select_gobbler(self):
-        available_gobblers = [g for g in self.game.gobblers if g.player == self.player_number and g.is_on_top]
-        random_idx = random.randint(0, len(available_gobblers) - 1)
-        return available_gobblers[random_idx].size
+        # pick a random move out of all of the legal ones, and
+        # remember where the gobbler should go
+        self.move = self.rng.choice(list(self.game.legal_moves()))
+        return self.move[0]
 
     def select_board_position(self):
-        return random.randint(0, 9)
-
-while True:
-    game = Game()
-    winner = None
-    print('Let the games begin!')
-
-    # create players
-    players = []
-    for player_number in range(2):
-        txt = f'Enter a name for player {player_number}. Leave blank to make it a bot: '
-        name = input(txt)
-        if name:
-            players.append(Human(player_number, name, game))
-        else:
-            players.append(Bot(player_number, 'Bot', game))
-
-    # start a match
-    while winner is None:
-        # select gobbler
-        current_player = players[game.current_player_idx]
-        print(game.represent_board())
+        return self.move[1]
+
+    def _book_move(self):
+        """
+        returns the move of the opening book for the position,
+        or None if there is no book or it doesn't have the position
+        """
+        if self.book is None:
+            return None
+        move = self.book.best_move(self.game)
+        if move is not None and self.verbose:
+            print(f'{self.repr} plays {move[0]} to {move[1]} from the opening book.')
+        return move
+
+class SearchBot(Bot):
+    """
+    A bot that looks for the best move with an alpha-beta
+    search, limited to time_budget seconds per move.
+    Moves in the opening book are played without searching
+    """
+    def __init__(self, player_number, name, game, time_budget=1.0, table=None, seed=None, verbose=True,
+                 book=None):
+        super().__init__(player_number, name, game, seed, verbose)
+        self.time_budget = time_budget
+        self.search = Search(table)
+        self.book = book
+        self.last_result = None
 
-        while winner is None:
-            selected_gobbler_size = current_player.select_gobbler()
-            success = game.select_gobbler(selected_gobbler_size)
-            if success:
-                print(f'{current_player.repr} selects gobbler {selected_gobbler_size}.')
-                break
-            else:
-                print(('Try again!'))
+    def select_gobbler(self):
+        self.move = self._book_move()
+        if self.move is not None:
+            return self.move[0]
+
+        result = self.search.search(self.game, self.time_budget)
+        self.last_result = result
+        self.move = result.move
+        if self.verbose:
+            print(f'{self.repr} searched {result.nodes} nodes to depth {result.depth} '
+                  f'in {result.seconds:.2f}s ({result.nodes_per_second:.0f} nodes/sec).')
+        return self.move[0]
+
+class MCTSBot(Bot):
+    """
+    A bot that picks moves with Monte Carlo Tree Search,
+    spread over a number of worker processes.
+    Moves in the opening book are played without searching
+    """
+    def __init__(self, player_number, name, game, playouts=2000, workers=1, seed=None, verbose=True,
+                 book=None):
+        # each move gets its own seed from self.rng, so that a game is reproducible
+        super().__init__(player_number, name, game, seed, verbose)
+        self.mcts = MCTS(workers=workers, playouts=playouts)
+        self.book = book
+        self.last_result = None
 
-        # play gobbler
-        print(game.represent_board())
-        while winner is None:
-            board_position = current_player.select_board_position()
-            success, winner = game.place_selected_gobbler(board_position)
-            if success:
-                print(f'{current_player.repr} moves gobbler {selected_gobbler_size} to {board_position}.')
+    def select_gobbler(self):
+        self.move = self._book_move()
+        if self.move is not None:
+            return self.move[0]
+
+        result = self.mcts.search(self.game, seed=self.rng.getrandbits(64))
+        self.last_result = result
+        self.move = result.move
+        if self.verbose:
+            print(f'{self.repr} ran {result.playouts} playouts in {result.seconds:.2f}s '
+                  f'({result.playouts_per_second:.0f} playouts/sec).')
+        return self.move[0]
+
+def main():
+    # bots play the moves of book.bin, if it has been built
+    book = open_book()
+    while True:
+        game = Game()
+        winner = None
+        print('Let the games begin!')
+
+        # create players
+        players = []
+        for player_number in range(2):
+            txt = f'Enter a name for player {player_number}. Leave blank to make it a bot: '
+            name = input(txt)
+            if name:
+                players.append(Human(player_number, name, game))
+                continue
+            # a random bot unless another type is chosen
+            while True:
+                bot_type = input('Which bot, random, search or mcts? Leave blank for random: ')
+                if bot_type in ('', 'random'):
+                    players.append(Bot(player_number, 'Bot', game))
+                elif bot_type == 'search':
+                    players.append(SearchBot(player_number, 'SearchBot', game, book=book))
+                elif bot_type == 'mcts':
+                    players.append(MCTSBot(player_number, 'MCTSBot', game, book=book))
+                else:
+                    print('Try again!')
+                    continue
                 break
-            else:
-                print('Try again!')
-
-    # announce winner
-    print(game.represent_board())
-    winner = players[winner]
-    print(f'{winner.repr} has won!')
 
-    # play again?
-    play_again = input('Play again? (y/n): ')
-    if play_again != 'y':
-        break
+        # start a match
+        while winner is None:
+            # select gobbler
+            current_player = players[game.current_player_idx]
+            print(game.represent_board())
+
+            while winner is None:
+                selected_gobbler_size = current_player.select_gobbler()
+                success = game.select_gobbler(selected_gobbler_size)
+                if success:
+                    print(f'{current_player.repr} selects gobbler {selected_gobbler_size}.')
+                    break
+                else:
+                    print(('Try again!'))
+
+            # play gobbler
+            print(game.represent_board())
+            while winner is None:
+                board_position = current_player.select_board_position()
+                success, winner = game.place_selected_gobbler(board_position)
+                if success:
+                    print(f'{current_player.repr} moves gobbler {selected_gobbler_size} to {board_position}.')
+                    break
+                else:
+                    print('Try again!')
+
+        # announce winner
+        print(game.represent_board())
+        winner = players[winner]
+        print(f'{winner.repr} has won!')
 
-print('Thank you for playing.')
+        # play again?
+        play_again = input('Play again? (y/n): ')
+        if play_again != 'y':
+            break
 
+    print('Thank you for playing.')
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""
+Pushes the moves of a game to everyone watching it (both players and
+any spectators) as Server-Sent Events.
+
+Each game that has subscribers has a channel with the last few events.
+An event is formatted once when it is published, and every subscriber
+waits on the channel and sends whatever events it hasn't sent yet, so
+publishing costs the same however many subscribers there are. Events
+for games that nobody is watching are dropped.
+
+Event ids are the epoch of the channel and a number, e.g. 3f9c0a1e-2.7.
+A channel gets a new epoch whenever it is created, so an id from a
+channel that was dropped, or from before the server restarted, never
+matches and the client is told to resync.
+
+Subscriptions can be iterated by a thread (as app.py does) or with
+async for on an event loop (as asgi.py does), where waiting for an
+event costs no thread at all.
+"""
+import asyncio
+import json
+import secrets
+import threading
+from collections import deque
+
+# tells a client that it missed events
+RESYNC = b'event: resync\ndata: {}\n\n'
+KEEPALIVE = b': keepalive\n\n'
+
+class _Channel:
+    def __init__(self, lock: threading.Lock, history: int, epoch: str):
+        self.condition = threading.Condition(lock)
+        self.epoch = epoch # the first part of the ids of its events
+        self.events = deque(maxlen=history) # (event number, message)
+        self.last_id = 0 # the number of the last event
+        self.subscribers = 0
+        # set on the event loop when there are new events, and
+        # then replaced, so that async subscribers can wait on it
+        self.wakeup = None
+
+class EventBroker:
+    def __init__(self, history: int = 64, keepalive: float = 15):
+        self.history = history # events kept for subscribers that fall behind or reconnect
+        self.keepalive = keepalive # seconds between messages that keep idle connections open
+        self.published = 0
+
+        # one lock for all channels, but a condition for each
+        # so that a move only wakes the subscribers of its game
+        self._lock = threading.Lock()
+        self._channels = {}
+        # the epochs of the channels are unique to this broker
+        self._token = secrets.token_hex(4)
+        self._epochs = 0
+        self._closed = False
+        self._loop = None # of the async subscribers
+
+    def publish(self, game_id: str, event_type: str, data: dict) -> None:
+        """
+        sends an event to all of the subscribers of a game,
+        from any thread
+        """
+        if game_id not in self._channels:
+            return
+        body = f'event: {event_type}\ndata: {json.dumps(data)}\n\n'.encode()
+        with self._lock:
+            channel = self._channels.get(game_id)
+            if channel is None:
+                return
+            channel.last_id += 1
+            event_id = f'{channel.epoch}.{channel.last_id}'.encode()
+            channel.events.append((channel.last_id, b'id: ' + event_id + b'\n' + body))
+            self.published += 1
+            channel.condition.notify_all()
+            wake_async = channel.wakeup is not None
+        if wake_async:
+            self._loop.call_soon_threadsafe(self._wake, channel)
+
+    def subscribe(self, game_id: str, last_event_id: str = None):
+        """
+        subscribes to the events of a game and returns a Subscription,
+        an iterator over the messages to send. last_event_id is the id
+        of the last event a reconnecting client got
+        """
+        epoch, _, number = (last_event_id or '').rpartition('.')
+        with self._lock:
+            channel = self._channels.get(game_id)
+            if channel is None:
+                self._epochs += 1
+                channel = self._channels[game_id] = _Channel(self._lock, self.history,
+                                                             f'{self._token}-{self._epochs}')
+            channel.subscribers += 1
+            # events published while nobody was subscribed were dropped,
+            # so a client with an id from another epoch has to get the state again
+            resync = last_event_id is not None and (
+                epoch != channel.epoch or not number.isdigit() or int(number) > channel.last_id)
+            if last_event_id is None or resync:
+                next_id = channel.last_id + 1
+            else:
+                next_id = int(number) + 1
+        return Subscription(self, game_id, channel, next_id, resync)
+
+    def subscribers(self, game_id: str) -> int:
+        channel = self._channels.get(game_id)
+        return 0 if channel is None else channel.subscribers
+
+    def close(self) -> None:
+        """
+        ends all of the subscriptions
+        """
+        with self._lock:
+            self._closed = True
+            channels = list(self._channels.values())
+            for channel in channels:
+                channel.condition.notify_all()
+        if self._loop is not None:
+            for channel in channels:
+                self._loop.call_soon_threadsafe(self._wake, channel)
+
+    def _take(self, subscription) -> list:
+        """
+        returns the messages that a subscriber hasn't had yet,
+        must be called with the lock held
+        """
+        channel = subscription.channel
+        if channel.events and channel.events[0][0] > subscription.next_id:
+            # the events the client missed are gone, so it has to get the state again
+            messages = [RESYNC] + [message for _, message in channel.events]
+        else:
+            messages = [message for event_id, message in channel.events if event_id >= subscription.next_id]
+        subscription.next_id = channel.last_id + 1
+        return messages
+
+    def _wait(self, subscription) -> list:
+        """
+        waits for messages in the calling thread,
+        returns None once the subscription has ended
+        """
+        channel = subscription.channel
+        with self._lock:
+            has_events = channel.condition.wait_for(
+                lambda: channel.last_id >= subscription.next_id or self._closed or subscription.closed,
+                self.keepalive)
+            if self._closed or subscription.closed:
+                return None
+            if not has_events:
+                return [KEEPALIVE]
+            return self._take(subscription)
+
+    async def _wait_async(self, subscription) -> list:
+        """
+        waits for messages on the event loop,
+        returns None once the subscription has ended
+        """
+        channel = subscription.channel
+        with self._lock:
+            if self._closed or subscription.closed:
+                return None
+            if channel.last_id >= subscription.next_id:
+                return self._take(subscription)
+            self._loop = asyncio.get_running_loop()
+            if channel.wakeup is None:
+                channel.wakeup = asyncio.Event()
+            wakeup = channel.wakeup
+        try:
+            await asyncio.wait_for(wakeup.wait(), self.keepalive)
+        except asyncio.TimeoutError:
+            return [KEEPALIVE]
+        # look again now that something has happened
+        return []
+
+    def _wake(self, channel: _Channel) -> None:
+        # runs on the event loop, like the async subscribers
+        wakeup = channel.wakeup
+        if wakeup is not None:
+            channel.wakeup = asyncio.Event()
+            wakeup.set()
+
+    def _unsubscribe(self, subscription) -> None:
+        channel = subscription.channel
+        with self._lock:
+            channel.subscribers -= 1
+            channel.condition.notify_all()
+            if channel.subscribers == 0 and self._channels.get(subscription.game_id) is channel:
+                del self._channels[subscription.game_id]
+
+class Subscription:
+    """
+    The messages for one subscriber, with `for` in a thread
+    or `async for` on an event loop. Close it when the
+    subscriber goes away
+    """
+    def __init__(self, broker: EventBroker, game_id: str, channel: _Channel, next_id: int, resync: bool):
+        self.broker = broker
+        self.game_id = game_id
+        self.channel = channel
+        self.next_id = next_id # of the next event to send
+        self.closed = False
+        self._messages = deque([RESYNC] if resync else [])
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        while not self._messages:
+            messages = self.broker._wait(self)
+            if messages is None:
+                raise StopIteration
+            self._messages.extend(messages)
+        return self._messages.popleft()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        while not self._messages:
+            messages = await self.broker._wait_async(self)
+            if messages is None:
+                raise StopAsyncIteration
+            self._messages.extend(messages)
+        return self._messages.popleft()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self.broker._unsubscribe(self)
@@ -0,0 +1,165 @@
+"""
+A compact binary file of complete games (games.bin), so that
+games can be replayed and analyzed later.
+
+After an 8-byte file header (magic, version, number of gobbler sizes)
+the games are stored one after another, each as a 14-byte header:
+    number of moves (2 bytes), the type of each player (1 byte each,
+    see PLAYER_TYPES), winner (1 byte, 255 if nobody won),
+    flags (1 byte, bit 0 is set if there is a seed), seed (8 bytes)
+followed by one byte per move, encoded with logic.encode_move.
+
+read_games streams the games from a file of any size,
+a chunk at a time.
+"""
+import os
+import struct
+import threading
+from logic import Game, decode_move
+
+MAGIC = b'GGGR'
+VERSION = 1
+# magic, version, number of gobbler sizes
+FILE_HEADER = struct.Struct('<4sBB2x')
+# number of moves, player types, winner, flags, seed
+GAME_HEADER = struct.Struct('<HBBBBQ')
+
+PLAYER_TYPES = ['human', 'random', 'search', 'mcts']
+NO_WINNER = 255
+HAS_SEED = 1
+
+class GameRecord:
+    def __init__(self, moves: bytes, winner: int = None, players: list = None, seed: int = None):
+        """
+        moves are encoded with logic.encode_move, one per byte
+        """
+        self.encoded_moves = bytes(moves)
+        self.winner = winner
+        self.players = players if players is not None else ['human', 'human']
+        self.seed = seed
+
+    @property
+    def moves(self) -> list:
+        """
+        the (gobbler_size, board_position) of every move
+        """
+        return [decode_move(value) for value in self.encoded_moves]
+
+    def replay(self, number_of_gobblers: int = 6):
+        """
+        plays the moves on a new game and yields (move, game) after each
+        one. The same game object is yielded every time, so copy it
+        to keep a position
+        """
+        game = Game(number_of_gobblers)
+        for value in self.encoded_moves:
+            move = decode_move(value)
+            game.apply_move(move)
+            yield move, game
+
+    def pack(self) -> bytes:
+        flags = HAS_SEED if self.seed is not None else 0
+        header = GAME_HEADER.pack(len(self.encoded_moves),
+                                  PLAYER_TYPES.index(self.players[0]), PLAYER_TYPES.index(self.players[1]),
+                                  NO_WINNER if self.winner is None else self.winner,
+                                  flags, self.seed or 0)
+        return header + self.encoded_moves
+
+class GameRecordWriter:
+    def __init__(self, path: str = 'games.bin', number_of_gobblers: int = 6):
+        """
+        opens the file at path to append games to it,
+        creating it if it doesn't exist
+        """
+        self.path = path
+        self.number_of_gobblers = number_of_gobblers
+        self._lock = threading.Lock()
+
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, 'wb') as f:
+                f.write(FILE_HEADER.pack(MAGIC, VERSION, number_of_gobblers))
+        else:
+            # drop a game that was only partly written
+            length = _complete_length(path)
+            if length < os.path.getsize(path):
+                os.truncate(path, length)
+        self._file = open(path, 'ab')
+
+    def write(self, records: list) -> None:
+        """
+        appends any number of GameRecords
+        """
+        data = b''.join(record.pack() for record in records)
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+def read_games(path: str = 'games.bin', chunk_size: int = 1 << 20):
+    """
+    yields the GameRecord of every game in the file, reading
+    chunk_size bytes at a time so that only the games in
+    one chunk are in memory at once
+    """
+    with open(path, 'rb') as f:
+        _read_file_header(f, path)
+        buffer = b''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                # anything left over is a game that was only partly written
+                return
+            buffer += chunk
+            offset = 0
+            while offset + GAME_HEADER.size <= len(buffer):
+                number_of_moves, player_0, player_1, winner, flags, seed = \
+                    GAME_HEADER.unpack_from(buffer, offset)
+                start = offset + GAME_HEADER.size
+                end = start + number_of_moves
+                if end > len(buffer):
+                    break
+                yield GameRecord(buffer[start:end],
+                                 None if winner == NO_WINNER else winner,
+                                 [PLAYER_TYPES[player_0], PLAYER_TYPES[player_1]],
+                                 seed if flags & HAS_SEED else None)
+                offset = end
+            buffer = buffer[offset:]
+
+def _read_file_header(f, path: str) -> int:
+    """
+    checks the file header and returns the number of gobbler sizes
+    """
+    magic, version, number_of_gobblers = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'{path} is not a game record file')
+    return number_of_gobblers
+
+def _complete_length(path: str) -> int:
+    """
+    returns the length of the file up to the end of its last complete game
+    """
+    with open(path, 'rb') as f:
+        _read_file_header(f, path)
+        length = FILE_HEADER.size
+        while True:
+            header = f.read(GAME_HEADER.size)
+            if len(header) < GAME_HEADER.size:
+                return length
+            number_of_moves = GAME_HEADER.unpack(header)[0]
+            if len(f.read(number_of_moves)) < number_of_moves:
+                return length
+            length += GAME_HEADER.size + number_of_moves
+
+_default_writers = {}
+_default_writers_lock = threading.Lock()
+
+def default_writer(path: str = 'games.bin') -> GameRecordWriter:
+    """
+    returns the writer shared by everything in the process that uses path
+    """
+    with _default_writers_lock:
+        if path not in _default_writers:
+            _default_writers[path] = GameRecordWriter(path)
+        return _default_writers[path]
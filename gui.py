@@ -1,13 +1,18 @@
+import argparse
+import json
+import time
 import cv2
 import numpy as np
 from math import sqrt
 from logic import Game, Gobbler, GameStats
-from matplotlib import pyplot as plt
-import io
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
 class Board:
-    def __init__(self, game):
+    def __init__(self, game, charts=None):
         self.game = game
+        # the stats charts, which can be kept from one game to the next
+        self.charts = charts if charts is not None else ChartImages()
 
         self.winner = None
         self.blue = (255,0,0)
@@ -73,23 +78,70 @@ class Board:
             gobbler.radius = (gobbler.size - 1) * self.gobbler_radius_range / 6  \
                         + self.min_gobbler_radius
 
-    def draw_static_board(self): 
-        """
-        Draw the elements on the board that change only occasionally, 
-        e.g. the gobblers that have been placed on the board
-        """
-        self.static_board = self.blank_board.copy()
-        gobblers_sorted = sorted(self.game.gobblers, key=lambda x: x.size, reverse=False)
-        for gobbler in gobblers_sorted:
-            center = (round(gobbler.x), round(gobbler.y))
+        # every gobbler is drawn once, and then copied onto the board
+        self.sprites = {}
+        self.selected_sprites = {}
+        self.shadows = {}
+        for gobbler in self.game.gobblers:
             radius = round(gobbler.radius)
-            color = gobbler.color
-            if gobbler is not self.game.selected_gobbler:
-                cv2.circle(self.static_board, center, radius, color, -1) 
-                text = str(gobbler.size)
-                pos = (round(gobbler.x - 6), round(gobbler.y + 4))
-                cv2.putText(self.static_board, text, pos, cv2.FONT_HERSHEY_COMPLEX_SMALL, 1,(255,255,255), 1, cv2.LINE_AA)    
+            selected_radius = round(gobbler.radius * 1.2)
+            self.sprites[gobbler.code] = self._make_sprite(gobbler.size, gobbler.color, radius)
+            self.selected_sprites[gobbler.code] = self._make_sprite(gobbler.size, gobbler.color, selected_radius, True)
+            shadow = np.zeros((2 * selected_radius + 1, 2 * selected_radius + 1), dtype='uint8')
+            cv2.circle(shadow, (selected_radius, selected_radius), selected_radius, 255, -1)
+            self.shadows[gobbler.code] = shadow
+
+        # only the rectangles (x1, y1, x2, y2) that change are redrawn,
+        # dirty_rects are the ones that changed since the frame was last shown
+        self.full_rect = (0, 0, self.blank_board.shape[1], self.blank_board.shape[0])
         self.dynamic_board = self.static_board.copy()
+        self.dirty_rects = []
+        self._placed = None # the centre of each gobbler on the static board
+        self._overlay_state = None # what the cursor or the selected gobbler looked like
+        self._overlay_rects = [] # where they were drawn
+
+    def draw_static_board(self):
+        """
+        Draw the elements on the board that change only occasionally,
+        e.g. the gobblers that have been placed on the board.
+        Only the areas of the gobblers that moved are redrawn
+        """
+        placed = {}
+        selected = self.game.selected_gobbler
+        for gobbler in self.game.gobblers:
+            if gobbler is not selected:
+                placed[gobbler.code] = (round(gobbler.x), round(gobbler.y))
+
+        if self._placed is None:
+            # the first time, draw everything
+            self._placed = placed
+            self._compose_static(self.full_rect)
+            return
+
+        # redraw where gobblers left and where they arrived
+        rects = []
+        for code in self._placed.keys() | placed.keys():
+            if self._placed.get(code) != placed.get(code):
+                for center in (self._placed.get(code), placed.get(code)):
+                    if center is not None:
+                        rects.append(self._sprite_rect(self.sprites[code], center))
+        self._placed = placed
+        for rect in rects:
+            self._compose_static(rect)
+
+    def _compose_static(self, rect: tuple) -> None:
+        """
+        redraws the blank board and the placed gobblers in a
+        rectangle of the static board, smallest gobblers first
+        """
+        x1, y1, x2, y2 = rect
+        self.static_board[y1:y2, x1:x2] = self.blank_board[y1:y2, x1:x2]
+        for code, center in sorted(self._placed.items()):
+            self._blit(self.static_board, self.sprites[code], center, rect)
+        self.dynamic_board[y1:y2, x1:x2] = self.static_board[y1:y2, x1:x2]
+        self.dirty_rects.append(rect)
+        # the cursor or the selected gobbler may have been covered
+        self._overlay_state = None
 
     def draw_dynamic_board(self):
         """
@@ -100,43 +152,43 @@ class Board:
             self.draw_cursor()
             return
 
-        self.dynamic_board = self.static_board.copy()
         gobbler = self.game.selected_gobbler
-        radius = round(gobbler.radius * 1.2)
-
-        # draw a transparent shadow
-        overlay = self.static_board.copy()
         center = (round(gobbler.x), round(gobbler.y))
-        shadow = (0,0,0)
-        cv2.circle(overlay, center, radius, shadow, -1)
-        self.dynamic_board = cv2.addWeighted(self.dynamic_board, .9, overlay, .1, 0)
+        if not self._begin_overlay(('gobbler', gobbler.code, center)):
+            return
+
+        # draw a transparent shadow, by darkening the board under it
+        shadow = self.shadows[gobbler.code]
+        shadow_rect = self._sprite_rect((shadow,), center)
+        x1, y1, x2, y2 = shadow_rect
+        if x1 < x2 and y1 < y2:
+            half = shadow.shape[0] // 2
+            mask = shadow[y1 - center[1] + half:y2 - center[1] + half,
+                          x1 - center[0] + half:x2 - center[0] + half]
+            region = self.dynamic_board[y1:y2, x1:x2]
+            cv2.copyTo(cv2.convertScaleAbs(region, alpha=.9), mask, region)
 
         # draw the selected gobbler
         offset = 8
-        offset_center = (round(gobbler.x + offset), round(gobbler.y - offset))
-        color = gobbler.color
-        white = (255,255,255)
-        cv2.circle(self.dynamic_board, offset_center, radius, color, -1) 
-        cv2.circle(self.dynamic_board, offset_center, radius, white, 2) 
-
-        # put text on the gobbler
-        text = str(gobbler.size)
-        pos = (round(gobbler.x - 6 + offset), round(gobbler.y + 4 - offset))
-        cv2.putText(self.dynamic_board, text, pos, cv2.FONT_HERSHEY_COMPLEX_SMALL, 1, white, 1, cv2.LINE_AA)
+        offset_center = (center[0] + offset, center[1] - offset)
+        sprite = self.selected_sprites[gobbler.code]
+        self._blit(self.dynamic_board, sprite, offset_center)
+        self._end_overlay([shadow_rect, self._sprite_rect(sprite, offset_center)])
 
     def draw_cursor(self):
-        # copy the static board to get a fresh copy to draw on
-        self.dynamic_board = self.static_board.copy()
+        x = self.hover_coordinate_x
+        y = self.hover_coordinate_y
+        player = self.game.current_player_idx
+        if not self._begin_overlay(('cursor', player, x, y)):
+            return
 
         # determine the color of the player
-        if self.game.current_player_idx == 0:
+        if player == 0:
             color = self.blue
         else:
             color = self.orange
 
         # define the lines of the crosshairs
-        x = self.hover_coordinate_x
-        y = self.hover_coordinate_y
         cursor_width = 20
         cursor_thickness = 6
         pt1_hor = (x - cursor_width, y)
@@ -152,6 +204,26 @@ class Board:
         cv2.line(self.dynamic_board, pt1_hor, pt2_hor, color, cursor_thickness)
         cv2.line(self.dynamic_board, pt1_vert, pt2_vert, color, cursor_thickness)
 
+        reach = cursor_width + cursor_thickness + border_thickness
+        self._end_overlay([self._clip((x - reach, y - reach, x + reach + 1, y + reach + 1))])
+
+    def _begin_overlay(self, state: tuple) -> bool:
+        """
+        puts back the board where the cursor or the selected gobbler
+        was drawn, returns False if they haven't changed
+        """
+        if state == self._overlay_state:
+            return False
+        for x1, y1, x2, y2 in self._overlay_rects:
+            self.dynamic_board[y1:y2, x1:x2] = self.static_board[y1:y2, x1:x2]
+        self.dirty_rects.extend(self._overlay_rects)
+        self._overlay_state = state
+        return True
+
+    def _end_overlay(self, rects: list) -> None:
+        self._overlay_rects = rects
+        self.dirty_rects.extend(rects)
+
     def draw_winner(self):
         x1 = self.margin_width + self.main_area_width / 6
         y1 = self.main_area_height / 5
@@ -171,6 +243,55 @@ class Board:
         cv2.putText(self.dynamic_board, text, (round(x1 + 34), round(y1 + 35)), cv2.FONT_HERSHEY_COMPLEX_SMALL, .75, color, 1, cv2.LINE_AA)
         text = 'Press any key to continue.'
         cv2.putText(self.dynamic_board, text, (round(x1 + 34), round(y1 + 65)), cv2.FONT_HERSHEY_COMPLEX_SMALL, .75, color, 1, cv2.LINE_AA)
+        self.dirty_rects.append(self._clip((pt1[0] - 1, pt1[1] - 1, pt2[0] + 2, pt2[1] + 2)))
+
+    def _make_sprite(self, size: int, color: tuple, radius: int, outline: bool = False) -> tuple:
+        """
+        draws a gobbler once, so that it can be copied onto the board.
+        returns the image and a mask of its pixels, centred on the gobbler
+        """
+        half = radius + 2
+        image = np.zeros((2 * half + 1, 2 * half + 1, 3), dtype='uint8')
+        mask = np.zeros((2 * half + 1, 2 * half + 1), dtype='uint8')
+        white = (255,255,255)
+        cv2.circle(image, (half, half), radius, color, -1)
+        cv2.circle(mask, (half, half), radius, 255, -1)
+        if outline:
+            cv2.circle(image, (half, half), radius, white, 2)
+            cv2.circle(mask, (half, half), radius, 255, 2)
+        cv2.putText(image, str(size), (half - 6, half + 4), cv2.FONT_HERSHEY_COMPLEX_SMALL, 1, white, 1, cv2.LINE_AA)
+        return image, mask
+
+    def _sprite_rect(self, sprite: tuple, center: tuple) -> tuple:
+        """
+        returns the rectangle (x1, y1, x2, y2) of the board
+        that a sprite covers, without the part that is off the board
+        """
+        half = sprite[0].shape[0] // 2
+        return self._clip((center[0] - half, center[1] - half, center[0] + half + 1, center[1] + half + 1))
+
+    def _clip(self, rect: tuple) -> tuple:
+        x1, y1, x2, y2 = rect
+        _, _, width, height = self.full_rect
+        return max(x1, 0), max(y1, 0), max(min(x2, width), 0), max(min(y2, height), 0)
+
+    def _blit(self, frame, sprite: tuple, center: tuple, clip: tuple = None) -> None:
+        """
+        copies the pixels of a sprite onto the frame, only
+        inside of the clip rectangle if there is one
+        """
+        image, mask = sprite
+        half = image.shape[0] // 2
+        x1, y1, x2, y2 = self._sprite_rect(sprite, center)
+        if clip is not None:
+            x1, y1 = max(x1, clip[0]), max(y1, clip[1])
+            x2, y2 = min(x2, clip[2]), min(y2, clip[3])
+        if x1 >= x2 or y1 >= y2:
+            return
+        sprite_x = x1 - center[0] + half
+        sprite_y = y1 - center[1] + half
+        cv2.copyTo(image[sprite_y:sprite_y + y2 - y1, sprite_x:sprite_x + x2 - x1],
+                   mask[sprite_y:sprite_y + y2 - y1, sprite_x:sprite_x + x2 - x1], frame[y1:y2, x1:x2])
 
     def click_event(self, event, x, y, flags, param):
         """
@@ -258,19 +379,6 @@ class Board:
                 region += 1
             y += self.main_area_height / 3
 
-    def _get_img_from_fig(self, fig, dpi=180):
-        """
-        returns an image as numpy array from figure
-        source: https://stackoverflow.com/questions/7821518/matplotlib-save-plot-to-numpy-array
-        """
-        buf = io.BytesIO()
-        fig.savefig(buf, format="png", dpi=dpi)
-        buf.seek(0)
-        img_arr = np.frombuffer(buf.getvalue(), dtype=np.uint8)
-        buf.close()
-        img = cv2.imdecode(img_arr, 1)
-        return img
-
     def _bgr2rgbnorm(self, color: tuple) -> tuple:
         """
         takes a BGR color (from OpenCV) and converts
@@ -281,63 +389,154 @@ class Board:
         r = color[2]
         return r/255, g/255, b/255
 
-    def get_winner_bar_chart(self, stats):
+    def get_winner_bar_chart(self, aggregates):
         """
-        Given the stats of all previously recorded games,
+        Given the aggregated stats of all previously recorded games,
         generate a bar chart that shows the winner breakdown
         """
-        value_counts = stats['winner'].value_counts()
-        try:
-            won_by_0 = value_counts[0]
-        except:
-            won_by_0 = 0
-        try:
-            won_by_1 = value_counts[1]
-        except:
-            won_by_1 = 0
-        players = ['Player 0', 'Player 1']
-        values = [won_by_0, won_by_1]
-        fig = plt.figure(figsize = (3.5, 2.5))
-        plt.bar(players, values, color=[self.blue_rgb, self.orange_rgb], width = 0.3)
-        plt.title('Win Count')
-        img = self._get_img_from_fig(fig)
-        return img
-
-    def get_successful_opening_moves_bar_chart(self, stats):
-        """
-        Given the stats of all previously recorded games,
+        return self.charts.image('winners', (3.5, 2.5), aggregates, self._draw_winner_bar_chart)
+
+    def _draw_winner_bar_chart(self, axes, aggregates):
+        axes.bar(['Player 0', 'Player 1'], aggregates.wins, color=[self.blue_rgb, self.orange_rgb], width = 0.3)
+        axes.set_title('Win Count')
+
+    def get_successful_opening_moves_bar_chart(self, aggregates):
+        """
+        Given the aggregated stats of all previously recorded games,
         generate a bar chart that shows successful opening moves
         """
-        value_counts = stats['first_move_winner'].value_counts().to_dict()
-        moves = list(value_counts.keys())
-        counts = list(value_counts.values())
-        if len(moves) > 5:
-            moves = moves[:5]
-            counts = counts[:5]
-        fig = plt.figure(figsize = (4, 4))
-        plt.bar(moves, counts, color='maroon', width = 0.3)
-        plt.title('Successful Openers (Gobbler -> Board Pos.)',)
-        img = self._get_img_from_fig(fig)
-        return img
-
-    def get_num_turns_chart(self, stats):
-        """
-        Given the stats of all previously recorded games,
-        generate a line graph of the number of turns per game
-        """
-        turns = stats['num_turns'].to_list()
-        fig = plt.figure(figsize = (4, 4))
-        plt.plot(turns, color='blue')
-        plt.title('Num. of Turns Each Game',)
-        img = self._get_img_from_fig(fig)
-        return img
-
-def main():
-    board = Board(Game())
+        return self.charts.image('opening_moves', (4, 4), aggregates, self._draw_successful_opening_moves_bar_chart)
+
+    def _draw_successful_opening_moves_bar_chart(self, axes, aggregates):
+        top_openers = aggregates.top_openers(5)
+        moves = [move for move, _ in top_openers]
+        counts = [count for _, count in top_openers]
+        axes.bar(moves, counts, color='maroon', width = 0.3)
+        axes.set_title('Successful Openers (Gobbler -> Board Pos.)',)
+
+    def get_num_turns_chart(self, aggregates):
+        """
+        Given the aggregated stats of all previously recorded games,
+        generate a bar chart of the number of games
+        that took each number of turns
+        """
+        return self.charts.image('num_turns', (4, 4), aggregates, self._draw_num_turns_chart)
+
+    def _draw_num_turns_chart(self, axes, aggregates):
+        num_turns = sorted(aggregates.turns)
+        games = [aggregates.turns[n] for n in num_turns]
+        axes.bar(num_turns, games, color='blue')
+        axes.set_title('Num. of Turns Per Game',)
+
+class ChartImages:
+    """
+    The stats charts as images for OpenCV. Each chart keeps one
+    figure that is redrawn, its image is taken straight from the
+    Agg canvas, and it is only redrawn when the stats have changed
+    """
+    def __init__(self, dpi: int = 180):
+        self.dpi = dpi
+        self.renders = 0
+        self._figures = {}
+        self._images = {} # name -> (number of games, image)
+
+    def image(self, name: str, figsize: tuple, aggregates, draw):
+        """
+        returns the BGR image of a chart, drawing it on a
+        fresh set of axes with draw(axes, aggregates) if the
+        number of games changed since it was last drawn
+        """
+        cached = self._images.get(name)
+        if cached is not None and cached[0] == aggregates.games:
+            return cached[1]
+
+        figure = self._figures.get(name)
+        if figure is None:
+            figure = self._figures[name] = Figure(figsize=figsize, dpi=self.dpi)
+            FigureCanvasAgg(figure)
+        figure.clear()
+        draw(figure.add_subplot(), aggregates)
+        figure.canvas.draw()
+        # the canvas is reused, so the pixels are copied
+        image = cv2.cvtColor(np.asarray(figure.canvas.buffer_rgba()), cv2.COLOR_RGBA2BGR)
+        self._images[name] = (aggregates.games, image)
+        self.renders += 1
+        return image
+
+class FrameTimer:
+    """
+    Records how long each frame took to draw and show,
+    and how long it was since the frame before
+    """
+    def __init__(self, idle_after: float = 0.25):
+        self.frame_times = []
+        self.intervals = []
+        # longer gaps between frames are pauses rather than slow frames
+        self.idle_after = idle_after
+        self._last_frame = None
+
+    def record(self, start: float, end: float) -> None:
+        self.frame_times.append(end - start)
+        if self._last_frame is not None and end - self._last_frame <= self.idle_after:
+            self.intervals.append(end - self._last_frame)
+        self._last_frame = end
+
+    def percentiles(self, percents: tuple = (50, 90, 99, 100)) -> dict:
+        """
+        returns the percentiles of the frame times
+        and of the intervals, in milliseconds
+        """
+        summary = {'frames': len(self.frame_times)}
+        for name, values in (('frame_time_ms', self.frame_times), ('interval_ms', self.intervals)):
+            values = sorted(values)
+            summary[name] = {f'p{percent}': 1000 * values[min(len(values) - 1, len(values) * percent // 100)]
+                             for percent in percents} if values else {}
+        return summary
+
+    def dump(self, path: str = None) -> None:
+        """
+        prints the percentiles, and saves them as json to path
+        """
+        summary = self.percentiles()
+        print(f'{summary["frames"]} frames')
+        for name in ('frame_time_ms', 'interval_ms'):
+            print(f'{name}: ' + ', '.join(f'{key} {value:.2f}' for key, value in summary[name].items()))
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(summary, f, indent=2)
+
+WINDOW = 'Gobblet Gobblers'
+
+def main(max_fps: float = 60, frame_stats: str = None):
+    """
+    Shows a new frame only when the mouse or the game changed
+    it, at most max_fps times a second. The frame times are
+    printed on exit, and saved to frame_stats if it is given
+    """
+    charts = ChartImages()
+    board = Board(Game(), charts)
     board.draw_static_board()
     stats = GameStats()
+    timer = FrameTimer()
+    frame_interval = 1 / max_fps
+
+    # the callback is registered once, and always goes to the current board
+    cv2.namedWindow(WINDOW)
+    cv2.setMouseCallback(WINDOW, lambda *args: board.click_event(*args))
+    last_frame = 0
 
     while True:
+        # wait for input until the next frame is due, without
+        # drawing anything if nothing has changed meanwhile
+        remaining = last_frame + frame_interval - time.perf_counter()
+        key = cv2.waitKey(max(1, round(1000 * (remaining if remaining > 0 else frame_interval))))
+        if key == ord('q') or cv2.getWindowProperty(WINDOW, cv2.WND_PROP_VISIBLE) < 1:
+            break
+        # a key was pressed before the next frame was due
+        if time.perf_counter() - last_frame < frame_interval:
+            continue
+        start = time.perf_counter()
+
         # handle clicks
         # place the gobbler
         if board.click_coordinate_x is not None and  \
@@ -355,10 +554,12 @@ def main():
            board.game.selected_gobbler is None:
             gobbler_size = board.check_for_clicked_gobbler()
             if gobbler_size:
-                success = board.game.select_gobbler(gobbler_size)                
+                success = board.game.select_gobbler(gobbler_size)
                 if success:
                     board.draw_static_board()
-        
+        # a click is only handled once
+        board.click_coordinate_x, board.click_coordinate_y = None, None
+
         # draw the dynamic board
         board.draw_dynamic_board()
 
@@ -366,31 +567,37 @@ def main():
         if board.winner is not None:
             board.draw_static_board()
             board.draw_winner()
-            stats.write_to_csv(board.winner)
-            stats_all_time = stats.read_stats_from_csv()
-            winner_bar_chart = board.get_winner_bar_chart(stats_all_time)
-            opening_moves_chart = board.get_successful_opening_moves_bar_chart(stats_all_time)
-            num_turns_chart = board.get_num_turns_chart(stats_all_time)
-            cv2.imshow('Gobblet Gobblers', board.dynamic_board)
+            stats.write(board.winner)
+            aggregates = stats.backend.aggregates
+            winner_bar_chart = board.get_winner_bar_chart(aggregates)
+            opening_moves_chart = board.get_successful_opening_moves_bar_chart(aggregates)
+            num_turns_chart = board.get_num_turns_chart(aggregates)
+            cv2.imshow(WINDOW, board.dynamic_board)
             cv2.imshow('Wins', winner_bar_chart)
             cv2.imshow('Opening Moves', opening_moves_chart)
             cv2.imshow('Number of Turns', num_turns_chart)
             cv2.waitKey(0)
-            cv2.destroyAllWindows()
-            board = Board(Game())
+            # keep the game window, and its mouse callback
+            for window in ('Wins', 'Opening Moves', 'Number of Turns'):
+                cv2.destroyWindow(window)
+            board = Board(Game(), charts)
             board.draw_static_board()
             stats = GameStats()
-
-        # show the results
-        cv2.imshow('Gobblet Gobblers', board.dynamic_board)
-        cv2.setMouseCallback("Gobblet Gobblers", board.click_event)
-
-        # check for pressed keys
-        key = cv2.waitKey(30)
-        if key == ord('q'):
-            break
+            start = time.perf_counter()
+
+        # show the frame if anything changed
+        if board.dirty_rects:
+            cv2.imshow(WINDOW, board.dynamic_board)
+            board.dirty_rects.clear()
+            last_frame = time.perf_counter()
+            timer.record(start, last_frame)
     # clean up
     cv2.destroyAllWindows()
+    timer.dump(frame_stats)
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Play Gobblet Gobblers in a window.')
+    parser.add_argument('--max-fps', type=float, default=60, help='the most frames to show a second')
+    parser.add_argument('--frame-stats', help='json file to save the frame time percentiles to on exit')
+    args = parser.parse_args()
+    main(args.max_fps, args.frame_stats)
@@ -1,38 +1,95 @@
-import  os
+import random
+import time
 import pandas as pd
-from matplotlib import pyplot as plt
+from stats_store import CSVStatsBackend, default_backend
+from charts import ChartRenderer, default_renderer
+import metrics
+
+WINNING_COMBINATIONS = [
+    [0,1,2],
+    [3,4,5],
+    [6,7,8],
+    [0,3,6],
+    [1,4,7],
+    [2,5,8],
+    [0,4,8],
+    [6,4,2],
+]
+
+# the winning combinations as 9-bit masks of cells
+WINNING_MASKS = [sum(1 << position for position in combo) for combo in WINNING_COMBINATIONS]
+
+# for every 9-bit mask of cells, the index of the first winning
+# combination it covers, or len(WINNING_MASKS) if it covers none
+FIRST_WINNING_COMBINATION = [
+    next((n for n, combo_mask in enumerate(WINNING_MASKS) if mask & combo_mask == combo_mask),
+         len(WINNING_MASKS))
+    for mask in range(512)
+]
+
+# for every 9-bit mask of cells, the cells (0-8) that are set
+CELLS_IN_MASK = [tuple(cell for cell in range(9) if mask >> cell & 1) for mask in range(512)]
+
+# random 64-bit keys for zobrist hashing, generated from a fixed
+# seed so that hashes are the same in every process
+_zobrist_random = random.Random(0x60BB1E)
+# a gobbler (by code) on a cell
+ZOBRIST_PIECES = [[_zobrist_random.getrandbits(64) for cell in range(9)] for code in range(12)]
+# a gobbler (by code) that is selected
+ZOBRIST_SELECTED = [_zobrist_random.getrandbits(64) for code in range(12)]
+# the cell the selected gobbler was picked up from
+ZOBRIST_PREVIOUS = [_zobrist_random.getrandbits(64) for cell in range(9)]
+# player 1 is to move
+ZOBRIST_PLAYER = _zobrist_random.getrandbits(64)
+
+def encode_move(move: tuple) -> int:
+    """
+    packs a (gobbler_size, board_position) move
+    into a single integer 0-53
+    """
+    gobbler_size, board_position = move
+    return (gobbler_size - 1) * 9 + board_position - 1
+
+def decode_move(value: int) -> tuple:
+    """
+    unpacks an integer made by encode_move
+    """
+    return value // 9 + 1, value % 9 + 1
 
 class Game:
-    def __init__(self):
+    """
+    Tracks the game state and logic.
+
+    Internally the board is stored as a handful of integers rather
+    than lists of Gobbler objects:
+    - each piece has a code, (size - 1) * 2 + player, so that a bigger
+      piece always has a bigger code
+    - _masks[code] is a 9-bit mask of the cell the piece is on (0 if
+      the piece is on the sideline)
+    - _stacks[cell] is a 12-bit stack encoding with bit `code` set for
+      every piece in the cell. Because pieces can only gobble smaller
+      pieces, the top of a stack is always its highest set bit
+    - _visible[player] is a 9-bit mask of the cells the player is on top of
+    - _hash is the zobrist hash of the position, updated with every change
+    The Gobbler objects are only views on this state.
+    """
+    def __init__(self, number_of_gobblers: int = 6):
         self.player_names = ['player 0', 'player 1']
         self.winner = None
 
-        # create the gobblers
-        number_of_gobblers = 6
-        self.gobblers = []
-        for player in range(2): # number of players
-            size = 1
-            for gobbler in range(number_of_gobblers):
-                gobbler = Gobbler(player, size)
-                self.gobblers.append(gobbler)
-                size += 1
-
         # initialize some values
+        # (smaller variants are only used to test the solver)
+        self.number_of_gobblers = number_of_gobblers
         self.current_player_idx = 0
-        self.selected_gobbler = None
-        # used for keeping track of gobblers on board
-        self.board = [[] for n in range(9)]
-
-        self.winning_combinations = [
-            [0,1,2],
-            [3,4,5],
-            [6,7,8],
-            [0,3,6],
-            [1,4,7],
-            [2,5,8],
-            [0,4,8],
-            [6,4,2],
-        ]
+        self._gobblers = None
+        self._selected = None # code of the selected gobbler
+        self._masks = [0] * 2 * self.number_of_gobblers
+        self._previous = [None] * 2 * self.number_of_gobblers
+        self._stacks = [0] * 9
+        self._visible = [0, 0]
+        self._hash = 0
+
+        self.winning_combinations = [list(combo) for combo in WINNING_COMBINATIONS]
 
     def select_gobbler(self, gobbler_size: int) -> bool:
         # Don't allow any more plays if the game is over
@@ -41,49 +98,58 @@ class Game:
 
         # don't allow the player to select a gobbler if one is
         # already selected
-        if self.selected_gobbler:
+        if self._selected is not None:
             return False
 
         # convert to integer and check if the value is valid (between 0 and 5)
-        gobbler_idx = self._convert_input(gobbler_size, 0, 5)
+        gobbler_idx = self._convert_input(gobbler_size, 0, self.number_of_gobblers - 1)
 
         # if the value is invalid, return False
         if gobbler_idx is None:
             return False
-        
-        # gobblers can only be selected if they are on top
-        gobbler = [g for g in self.gobblers if g.player == self.current_player_idx][gobbler_idx]
-        if not gobbler.is_on_top:
-            return False
-
-        # if no exclusionary conditions are met, select 
-        # the indicated gobbler
-        self.selected_gobbler = gobbler
-
-        # remove gobbler from its previous position, if it has one
-        if self.selected_gobbler.board_position is not None:
-            del self.board[self.selected_gobbler.board_position][-1]
 
-        # update the gobbler's board position
-        self.selected_gobbler.board_position_previous = self.selected_gobbler.board_position
-        self.selected_gobbler.board_position = None
+        # gobblers can only be selected if they are on top, i.e. if
+        # nothing bigger is stacked in the same cell
+        code = gobbler_idx * 2 + self.current_player_idx
+        mask = self._masks[code]
+        if mask:
+            cell = mask.bit_length() - 1
+            stack = self._stacks[cell]
+            if stack >> (code + 1):
+                return False
+
+            # remove gobbler from its previous position and reveal
+            # whatever was underneath it
+            stack ^= 1 << code
+            self._stacks[cell] = stack
+            self._masks[code] = 0
+            self._visible[self.current_player_idx] &= ~mask
+            if stack:
+                self._visible[(stack.bit_length() - 1) & 1] |= mask
+            self._previous[code] = cell
+            self._hash ^= ZOBRIST_PIECES[code][cell] ^ ZOBRIST_PREVIOUS[cell]
+        else:
+            self._previous[code] = None
+        self._hash ^= ZOBRIST_SELECTED[code]
 
-        # update the is_on_top flag for all gobblers
-        self._update_on_top()
+        # if no exclusionary conditions are met, select
+        # the indicated gobbler
+        self._selected = code
 
         return True
 
     def place_selected_gobbler(self, board_position: int) -> bool:
         # if there is no selected gobbler, then there is
         # nothing to place
-        if not self.selected_gobbler:
+        code = self._selected
+        if code is None:
             return False, None
 
         # convert to integer and check if the value is valid (between 0 and 8)
         board_position = self._convert_input(board_position, 0, 8)
 
         # don't allow the player to put the gobbler back where they got it
-        if self.selected_gobbler.board_position_previous == board_position:
+        if self._previous[code] == board_position:
             return False, None
 
         # if the value is invalid, return False
@@ -91,28 +157,226 @@ class Game:
             return False, None
 
         # if there is already a gobbler on the indicated board
-        # position, and it is bigger than the selected gobbler,
-        # cannot place the selected gobbler
-        if self.board[board_position] and \
-            self.selected_gobbler.size <= self.board[board_position][-1].size:
+        # position, and it is bigger than (or as big as) the selected
+        # gobbler, cannot place the selected gobbler
+        stack = self._stacks[board_position]
+        if stack >> (code & ~1):
             return False, None
 
         # add the gobbler to the board
-        self.board[board_position].append(self.selected_gobbler)
-
-        # update the gobbler's board position
-        self.selected_gobbler.board_position = board_position
+        mask = 1 << board_position
+        player = code & 1
+        self._stacks[board_position] = stack | (1 << code)
+        self._masks[code] = mask
+        self._visible[player] |= mask
+        self._visible[player ^ 1] &= ~mask
+        self._hash ^= ZOBRIST_SELECTED[code] ^ ZOBRIST_PIECES[code][board_position] ^ ZOBRIST_PLAYER
+        if self._previous[code] is not None:
+            self._hash ^= ZOBRIST_PREVIOUS[self._previous[code]]
 
-        # update the is_on_top flag for all gobblers
-        self._update_on_top()
-        
         # toggle the current player
-        self.current_player_idx = int(not self.current_player_idx)
+        self.current_player_idx = player ^ 1
 
         # deselect gobbler
-        self.selected_gobbler = None
+        self._selected = None
 
-        return True, self._check_for_winner()
+        winner = self._check_for_winner()
+        if metrics.enabled:
+            metrics.MOVES.inc()
+            if winner is not None:
+                metrics.GAMES.inc(labels=(str(winner),))
+        return True, winner
+
+    def legal_moves(self):
+        """
+        yields every valid (gobbler_size, board_position) pair for the
+        current player, using the same 1-based values that
+        select_gobbler and place_selected_gobbler accept.
+        if a gobbler is already selected, only its moves are yielded
+        """
+        if self.winner is not None:
+            return
+
+        # covered[n] is a mask of the cells whose top gobbler is
+        # at least as big as a gobbler of size n + 1
+        covered = [0] * (self.number_of_gobblers + 1)
+        for cell, stack in enumerate(self._stacks):
+            if stack:
+                covered[(stack.bit_length() - 1) >> 1] |= 1 << cell
+        for size_idx in range(self.number_of_gobblers - 2, -1, -1):
+            covered[size_idx] |= covered[size_idx + 1]
+
+        if self._selected is not None:
+            code = self._selected
+            previous = self._previous[code]
+            destinations = ~covered[code >> 1] & 0x1FF
+            if previous is not None:
+                destinations &= ~(1 << previous)
+            for cell in CELLS_IN_MASK[destinations]:
+                yield (code >> 1) + 1, cell + 1
+            return
+
+        for size_idx in range(self.number_of_gobblers):
+            code = size_idx * 2 + self.current_player_idx
+            mask = self._masks[code]
+            # gobblers that are covered cannot move
+            if mask and self._stacks[mask.bit_length() - 1] >> (code + 1):
+                continue
+            # a gobbler cannot be put back where it came from
+            destinations = ~(covered[size_idx] | mask) & 0x1FF
+            for cell in CELLS_IN_MASK[destinations]:
+                yield size_idx + 1, cell + 1
+
+    def apply_move(self, move: tuple) -> int:
+        """
+        plays a (gobbler_size, board_position) move in one step, i.e.
+        selects and places the gobbler, and returns an undo record
+        for undo_move. The move is not validated, so it must be one
+        of legal_moves(), i.e. of the selected gobbler if there is one.
+        The undo record is an integer:
+        bits 0-3 the cell the gobbler came from + 1 (0 for the sideline),
+        bits 4-5 the previous winner + 1, bits 6-9 the cell it went to,
+        bits 10-13 its previous board_position_previous + 1,
+        bits 14-17 its code and bit 18 whether it was selected
+        """
+        code = (move[0] - 1) * 2 + self.current_player_idx
+        cell = move[1] - 1
+        player = code & 1
+        stacks = self._stacks
+        visible = self._visible
+        previous = self._previous[code]
+        record = (code << 14) | (cell << 6)
+        if previous is not None:
+            record |= (previous + 1) << 10
+        if self.winner is not None:
+            record |= (self.winner + 1) << 4
+
+        # pick the gobbler up, revealing whatever was underneath it,
+        # unless it has been picked up (from previous) already
+        mask = self._masks[code]
+        if self._selected is not None:
+            self._selected = None
+            self._hash ^= ZOBRIST_SELECTED[code]
+            if previous is not None:
+                self._hash ^= ZOBRIST_PREVIOUS[previous]
+            record |= 1 << 18
+        elif mask:
+            origin = mask.bit_length() - 1
+            stack = stacks[origin] ^ (1 << code)
+            stacks[origin] = stack
+            visible[player] &= ~mask
+            if stack:
+                visible[(stack.bit_length() - 1) & 1] |= mask
+            self._previous[code] = origin
+            self._hash ^= ZOBRIST_PIECES[code][origin]
+            record |= origin + 1
+        else:
+            self._previous[code] = None
+
+        # put it down
+        mask = 1 << cell
+        stacks[cell] |= 1 << code
+        self._masks[code] = mask
+        visible[player] |= mask
+        visible[player ^ 1] &= ~mask
+        self._hash ^= ZOBRIST_PIECES[code][cell] ^ ZOBRIST_PLAYER
+        self.current_player_idx = player ^ 1
+
+        self._check_for_winner()
+        return record
+
+    def undo_move(self, record: int) -> None:
+        """
+        takes back the move that returned the undo record,
+        restoring the exact state from before it
+        """
+        code = (record >> 14) & 0xF
+        player = code & 1
+        cell = (record >> 6) & 0xF
+        origin = (record & 0xF) - 1
+        stacks = self._stacks
+        visible = self._visible
+
+        # take the gobbler off the cell it went to
+        mask = 1 << cell
+        stack = stacks[cell] ^ (1 << code)
+        stacks[cell] = stack
+        visible[player] &= ~mask
+        if stack:
+            visible[(stack.bit_length() - 1) & 1] |= mask
+        self._hash ^= ZOBRIST_PIECES[code][cell] ^ ZOBRIST_PLAYER
+
+        # and put it back where it came from, or in the player's hand
+        previous = (record >> 10) & 0xF
+        if record >> 18:
+            self._masks[code] = 0
+            self._selected = code
+            self._hash ^= ZOBRIST_SELECTED[code]
+            if previous:
+                self._hash ^= ZOBRIST_PREVIOUS[previous - 1]
+        elif origin >= 0:
+            mask = 1 << origin
+            stacks[origin] |= 1 << code
+            self._masks[code] = mask
+            visible[player] |= mask
+            visible[player ^ 1] &= ~mask
+            self._hash ^= ZOBRIST_PIECES[code][origin]
+        else:
+            self._masks[code] = 0
+
+        self._previous[code] = previous - 1 if previous else None
+        winner = (record >> 4) & 0x3
+        self.winner = winner - 1 if winner else None
+        self.current_player_idx = player
+
+    @classmethod
+    def from_board(cls, board: list, current_player: int = 0, number_of_gobblers: int = 6):
+        """
+        returns a game in the position of a board, given as 9 lists of
+        [player, size] pairs from the bottom of each cell to the top
+        (the format of the json api). Nothing is selected and no gobbler
+        has a previous position. Raises ValueError if the board can't
+        happen in a game
+        """
+        if len(board) != 9 or current_player not in (0, 1):
+            raise ValueError('a board has 9 cells and the current player is 0 or 1')
+        game = cls(number_of_gobblers)
+        for cell, stack in enumerate(board):
+            previous_code = -1
+            for player, size in stack:
+                if player not in (0, 1) or not 1 <= size <= number_of_gobblers:
+                    raise ValueError(f'there is no gobbler of size {size} for player {player}')
+                code = (size - 1) * 2 + player
+                if game._masks[code]:
+                    raise ValueError(f'the gobbler of size {size} of player {player} is on the board twice')
+                # only bigger gobblers can go on top
+                if code >> 1 <= previous_code >> 1:
+                    raise ValueError(f'the gobbler of size {size} can\'t be on top of a gobbler that big')
+                previous_code = code
+                game._stacks[cell] |= 1 << code
+                game._masks[code] = 1 << cell
+                game._hash ^= ZOBRIST_PIECES[code][cell]
+        game.current_player_idx = current_player
+        if current_player:
+            game._hash ^= ZOBRIST_PLAYER
+        game._update_on_top()
+        game._check_for_winner()
+        return game
+
+    def copy(self):
+        """
+        returns an independent copy of the game state
+        (without the gobbler views)
+        """
+        game = Game.__new__(Game)
+        game.__dict__.update(self.__dict__)
+        game._gobblers = None
+        game._masks = list(self._masks)
+        game._previous = list(self._previous)
+        game._stacks = list(self._stacks)
+        game._visible = list(self._visible)
+        game.player_names = list(self.player_names)
+        return game
 
     def set_player_names(self, player_names: list) -> list[bool, str]:
         player_name_0 = player_names[0]
@@ -133,10 +397,11 @@ class Game:
         """
         str_repr = ''
         n = 0
-        for cell in self.board:
-            if cell:
-                player = cell[-1].player
-                size = cell[-1].size
+        for stack in self._stacks:
+            if stack:
+                top = stack.bit_length() - 1
+                player = top & 1
+                size = (top >> 1) + 1
                 str_to_add = f'|{size}({player})' 
             else:
                 str_to_add = f'|____'
@@ -179,37 +444,80 @@ class Game:
         if so, returns winner (int)
         if not, returns None
         """
-        # check all of the winning combinations for a winner
-        for combo in self.winning_combinations:
-            # initialize a list to keep track of the
-            # owner of each piece
-            result_to_check = []
-            for position in combo:
-                if self.board[position]: 
-                    # record the player of the current piece in a list
-                    result_to_check.append(self.board[position][-1].player)
-                else:
-                    result_to_check.append(None)
-            # if there is only one non-None unique value, then
-            # we have a winner
-            unique_values = list(set(result_to_check))
-            if len(unique_values) == 1 and unique_values[0] is not None:
-                self.winner = unique_values[0]
-                return self.winner
-        
-        return None
-    
+        # look up the first winning combination each player is on top of.
+        # if both players have one, the combination listed first wins
+        first_0 = FIRST_WINNING_COMBINATION[self._visible[0]]
+        first_1 = FIRST_WINNING_COMBINATION[self._visible[1]]
+        if first_0 < first_1:
+            self.winner = 0
+        elif first_1 < first_0:
+            self.winner = 1
+        else:
+            return None
+        return self.winner
+
     def _update_on_top(self):
         """
-        checks all of the gobblers on the board and 
-        updates their is_on_top flag
+        recomputes which player is on top of each cell
+        from the stacks
+        """
+        self._visible = [0, 0]
+        for cell, stack in enumerate(self._stacks):
+            if stack:
+                self._visible[(stack.bit_length() - 1) & 1] |= 1 << cell
+
+    def _is_on_top(self, code: int) -> bool:
+        mask = self._masks[code]
+        if not mask:
+            return True
+        return not self._stacks[mask.bit_length() - 1] >> (code + 1)
+
+    @property
+    def zobrist_hash(self) -> int:
+        """
+        64-bit hash of the position, i.e. the gobblers on the board,
+        the selected gobbler and the player to move
+        """
+        return self._hash
+
+    @property
+    def gobblers(self) -> list:
+        # the Gobbler views are only created when someone asks for them,
+        # e.g. a user interface, so that simulations don't pay for them
+        if self._gobblers is None:
+            self._gobblers = []
+            for player in range(2): # number of players
+                size = 1
+                for _ in range(self.number_of_gobblers):
+                    self._gobblers.append(Gobbler(player, size, self))
+                    size += 1
+        return self._gobblers
+
+    @property
+    def selected_gobbler(self):
+        if self._selected is None:
+            return None
+        return self._gobbler_from_code(self._selected)
+
+    @property
+    def board(self) -> list:
+        """
+        the gobblers in each cell, from the bottom
+        of the stack to the top
         """
-        for position in self.board:
-            for n, gobbler in enumerate(position):
-                if len(position) - 1 == n:
-                    gobbler.is_on_top = True
-                else:
-                    gobbler.is_on_top = False
+        board = [[] for n in range(9)]
+        for cell, stack in enumerate(self._stacks):
+            code = 0
+            while stack:
+                if stack & 1:
+                    board[cell].append(self._gobbler_from_code(code))
+                stack >>= 1
+                code += 1
+        return board
+
+    def _gobbler_from_code(self, code: int):
+        return self.gobblers[(code & 1) * self.number_of_gobblers + (code >> 1)]
+
     @property
     def winner_name(self) -> str:
         if self.winner is None:
@@ -222,36 +530,116 @@ class Game:
         return self.player_names[self.current_player_idx]
      
 class Gobbler:
-    def __init__(self, player: int, size: int):
+    def __init__(self, player: int, size: int, game: Game = None):
         self.player = player # integer 0-1
         self.size = size # integers 0-5
-        self.board_position = None # integers 0-8 or None
-        self.board_position_previous = None # so that it can be placed back where it came from
-        self.is_on_top = True
+        self.game = game # the game that holds this gobbler's state
+        self.code = (size - 1) * 2 + player
+
+    @property
+    def board_position(self) -> int:
+        """
+        integers 0-8 or None
+        """
+        if self.game is None:
+            return None
+        mask = self.game._masks[self.code]
+        if not mask:
+            return None
+        return mask.bit_length() - 1
+
+    @property
+    def board_position_previous(self) -> int:
+        """
+        so that it can be placed back where it came from
+        """
+        if self.game is None:
+            return None
+        return self.game._previous[self.code]
+
+    @property
+    def is_on_top(self) -> bool:
+        if self.game is None:
+            return True
+        return self.game._is_on_top(self.code)
 
 class GameStats:
-    def __init__(self):
+    def __init__(self, backend=None, charts=None, records=None):
         self.num_turns = 0
         self.player = 0
         self.moves = [[],  # a list of lists, one for each player
                       [],]
+        # every move in order, encoded with encode_move
+        self.history = bytearray()
+        # the type of each player and the seed of the game,
+        # saved with the history, see game_records.py
+        self.players = ['human', 'human']
+        self.seed = None
+        self._records = records
+        # where the stats are stored, see stats_store.py
+        self._backend = backend
+        # what draws the charts, see charts.py
+        self._charts = charts
+
+    @property
+    def backend(self):
+        # the default backend is only opened when it is needed
+        if self._backend is None:
+            self._backend = default_backend()
+        return self._backend
+
+    @property
+    def charts(self) -> ChartRenderer:
+        if self._charts is None:
+            if self._backend is None:
+                self._charts = default_renderer()
+            else:
+                self._charts = ChartRenderer(self._backend)
+        return self._charts
+
+    @property
+    def records(self):
+        # game_records imports this module, so it is imported here
+        if self._records is None:
+            from game_records import default_writer
+            self._records = default_writer()
+        return self._records
 
     def record_move(self, gobbler_size:int, board_position:int) -> None:
         self.moves[self.player].append(f'{gobbler_size} to {board_position}')
+        self.history.append(encode_move((int(gobbler_size), int(board_position))))
         self.num_turns = len(self.moves[0])
         self.player = int(not self.player)
 
-    def save(self, winner) -> None:
+    def save(self, winner, background: bool = False) -> None:
         """
-        Save the stats to csv and
+        Save the stats and
         save some images.
+        With background, the images are saved
+        by another thread after this returns.
         """
-        self.write_to_csv(winner)
-        self.read_stats_from_csv()
-        self._save_charts()
+        start = time.perf_counter() if metrics.enabled else None
+        self.write(winner)
+        if start is not None:
+            metrics.STATS_SAVE_SECONDS.observe(time.perf_counter() - start, ('write',))
+        if background:
+            self.charts.request_render()
+        else:
+            self.charts.render()
 
-    def write_to_csv(self, winner) -> None:
-        data_to_record = {
+    def write(self, winner) -> None:
+        self.backend.append([self.get_record(winner)])
+        self.records.write([self.get_game_record(winner)])
+
+    def read_stats(self) -> pd.DataFrame:
+        self.stats = self.backend.load()
+        return self.stats
+
+    def get_record(self, winner) -> dict:
+        """
+        returns the stats of the game that are saved
+        """
+        return {
             'winner': winner,
             'first_move_0': self.moves[0][0],
             'first_move_1': self.moves[1][0],
@@ -262,89 +650,27 @@ class GameStats:
             'num_turns': self.num_turns,
         }
 
-        path = 'stats.csv'
-        column_headers = ''
-        line_to_write = ''
-        file_is_new = not os.path.exists(path)
-        for k, v in data_to_record.items():
-            if file_is_new:
-                column_headers += f'{k},'
-
-            line_to_write += f'{v},'
-
-        # add linebreaks
-        column_headers += '\n'
-        line_to_write += '\n'
-
-        # write the column headers
-        if file_is_new:
-            with open(path, 'a') as f:
-                f.write(column_headers)
-
-        # write the line
-        with open(path, 'a') as f:
-            f.write(line_to_write)
-
-    def read_stats_from_csv(self) -> pd.DataFrame:
-        self.stats = pd.read_csv('stats.csv')
-        return self.stats
-
-    def _save_charts(self) -> None:
+    def get_game_record(self, winner):
         """
-        saves all of the bar charts
+        returns the whole game as a game_records.GameRecord
         """
+        from game_records import GameRecord
+        return GameRecord(self.history, winner, self.players, self.seed)
 
-        chart_funcs = [self._get_winner_bar_chart,
-                    self._get_num_turns_chart,
-                    self._get_successful_opening_moves_bar_chart]
-
-        for func in chart_funcs:
-            func()
+    def write_to_csv(self, winner) -> None:
+        """
+        exports the stats of this game to stats.csv
+        """
+        self.write_records_to_csv([self.get_record(winner)])
 
-    def _get_winner_bar_chart(self) -> None:
+    @staticmethod
+    def write_records_to_csv(records: list, path: str = 'stats.csv') -> None:
         """
-        Given the stats of all previously recorded games,
-        generate a bar chart that shows the winner breakdown
+        exports the records of any number of games
+        to the csv in one go
         """
-        value_counts = self.stats['winner'].value_counts()
-        try:
-            won_by_0 = value_counts[0]
-        except:
-            won_by_0 = 0
-        try:
-            won_by_1 = value_counts[1]
-        except:
-            won_by_1 = 0
-        players = ['Player 0', 'Player 1']
-        values = [won_by_0, won_by_1]
-        plt.figure(figsize = (4, 4))
-        plt.bar(players, values, color=[(0,0,1), (1,191/255,0)], width = 0.3)
-        plt.title('Win Count')
-        plt.savefig('static/winners.png')
-
-    def _get_successful_opening_moves_bar_chart(self) -> None:
-        """
-        Given the stats of all previously recorded games,
-        generate a bar chart that shows successful opening moves
-        """
-        value_counts = self.stats['first_move_winner'].value_counts().to_dict()
-        moves = list(value_counts.keys())
-        counts = list(value_counts.values())
-        if len(moves) > 5:
-            moves = moves[:5]
-            counts = counts[:5]
-        plt.figure(figsize = (4, 4))
-        plt.bar(moves, counts, color='maroon', width = 0.3)
-        plt.title('Successful Openers (Gobbler -> Board Pos.)',)
-        plt.savefig('static/opening_moves.png')
-
-    def _get_num_turns_chart(self) -> None:
-        """
-        Given the stats of all previously recorded games,
-        generate a line graph of the number of turns per game
-        """
-        turns = self.stats['num_turns'].to_list()
-        plt.figure(figsize = (4, 4))
-        plt.plot(turns, color='blue')
-        plt.title('Num. of Turns Each Game',)
-        plt.savefig('static/num_turns.png')
\ No newline at end of file
+        CSVStatsBackend(path).append(records)
+
+    def read_stats_from_csv(self) -> pd.DataFrame:
+        self.stats = CSVStatsBackend('stats.csv').load()
+        return self.stats
\ No newline at end of file
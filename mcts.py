@@ -0,0 +1,140 @@
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from logic import Game
+import metrics
+
+class MCTSResult:
+    def __init__(self, move: tuple, visits: dict, playouts: int, seconds: float):
+        self.move = move # (gobbler_size, board_position)
+        self.visits = visits # number of playouts through each root move
+        self.playouts = playouts
+        self.seconds = seconds
+
+    @property
+    def playouts_per_second(self) -> float:
+        if self.seconds == 0:
+            return 0.0
+        return self.playouts / self.seconds
+
+class MCTS:
+    """
+    Monte Carlo Tree Search with random playouts.
+
+    With more than one worker, every worker grows its own tree from
+    the root in a separate process (root parallelization) and the
+    visit counts of the root moves are added up. Given a seed,
+    the result is the same for the same number of workers.
+    """
+    def __init__(self, workers: int = 1, playouts: int = 2000, exploration: float = 1.4,
+                 max_plies: int = 100):
+        self.workers = workers
+        self.playouts = playouts
+        self.exploration = exploration
+        self.max_plies = max_plies # playouts longer than this count as draws
+        self._executor = None
+
+    def search(self, game: Game, seed: int = None) -> MCTSResult:
+        start = time.monotonic()
+        rng = random.Random(seed)
+        seeds = [rng.getrandbits(64) for _ in range(self.workers)]
+
+        # split the playouts between the workers
+        playouts = [self.playouts // self.workers + (1 if n < self.playouts % self.workers else 0)
+                    for n in range(self.workers)]
+        args = [(game.copy(), playouts[n], seeds[n], self.exploration, self.max_plies)
+                for n in range(self.workers)]
+
+        if self.workers == 1:
+            results = [run_playouts(*args[0])]
+        else:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            futures = [self._executor.submit(run_playouts, *worker_args) for worker_args in args]
+            results = [future.result() for future in futures]
+
+        visits = {}
+        for result in results:
+            for move, move_visits in result.items():
+                visits[move] = visits.get(move, 0) + move_visits
+
+        best_move = None
+        for move in sorted(visits):
+            if best_move is None or visits[move] > visits[best_move]:
+                best_move = move
+
+        result = MCTSResult(best_move, visits, self.playouts, time.monotonic() - start)
+        if metrics.enabled:
+            metrics.record_search('mcts', result.playouts, result.seconds)
+        return result
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+class _Node:
+    def __init__(self, move: tuple, parent, player: int, moves: list):
+        self.move = move
+        self.parent = parent
+        self.player = player # the player that made the move
+        self.untried_moves = moves
+        self.children = []
+        self.visits = 0
+        self.wins = 0.0 # for the player that made the move
+        self.winner = None
+
+def run_playouts(game: Game, playouts: int, seed: int, exploration: float = 1.4,
+                 max_plies: int = 100) -> dict:
+    """
+    grows a tree from the game's position with the given number of
+    playouts, and returns the number of visits of each root move.
+    This is what each worker process runs.
+    """
+    rng = random.Random(seed)
+    root = _Node(None, None, None, list(game.legal_moves()))
+
+    for _ in range(playouts):
+        node = root
+        state = game.copy()
+
+        # selection: follow the most promising moves down the tree
+        while not node.untried_moves and node.children and node.winner is None:
+            log_visits = math.log(node.visits)
+            node = max(node.children, key=lambda child: child.wins / child.visits
+                       + exploration * math.sqrt(log_visits / child.visits))
+            state.apply_move(node.move)
+        winner = node.winner
+
+        # expansion: add one untried move to the tree
+        if winner is None and node.untried_moves:
+            move = node.untried_moves.pop(rng.randrange(len(node.untried_moves)))
+            player = state.current_player_idx
+            state.apply_move(move)
+            winner = state.winner
+            child = _Node(move, node, player, [] if winner is not None else list(state.legal_moves()))
+            child.winner = winner
+            node.children.append(child)
+            node = child
+
+        # playout: random moves until the game ends
+        plies = 0
+        while winner is None and plies < max_plies:
+            moves = list(state.legal_moves())
+            if not moves:
+                break
+            state.apply_move(rng.choice(moves))
+            winner = state.winner
+            plies += 1
+
+        # backpropagation
+        while node is not None:
+            node.visits += 1
+            if winner is None:
+                node.wins += 0.5
+            elif winner == node.player:
+                node.wins += 1
+            node = node.parent
+
+    return {child.move: child.visits for child in root.children}
@@ -0,0 +1,179 @@
+"""
+Counters and histograms of where the time goes: the latency of every
+route of app.py, the moves and games played, the time that saving the
+stats takes (writing them, reading the aggregates and rendering the
+charts) and what the bots searched.
+
+Metrics are off unless they are turned on with enable(), or by setting
+GOBBLERS_METRICS=1 before starting. While they are off, the code that
+records them only checks metrics.enabled, so they cost next to nothing.
+They can be read in the process with snapshot(), or by Prometheus
+from /metrics in the Prometheus text format.
+"""
+import bisect
+import os
+import threading
+
+enabled = os.environ.get('GOBBLERS_METRICS', '') not in ('', '0')
+
+# in seconds, from a quick move to a long search
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def enable() -> None:
+    global enabled
+    enabled = True
+
+def disable() -> None:
+    global enabled
+    enabled = False
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels # the names of the labels
+        self._values = {} # label values -> count
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, labels: tuple = ()) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: tuple = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def exposition(self) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self.snapshot().items()):
+            lines.append(f'{self.name}{_format_labels(self.labels, labels)} {value}')
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets) # upper bounds, without +Inf
+        self._values = {} # label values -> [count of each bucket and +Inf, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(labels)
+            if values is None:
+                values = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            values[index] += 1
+            values[-1] += value
+
+    def count(self, labels: tuple = ()) -> int:
+        values = self._values.get(labels)
+        return 0 if values is None else sum(values[:-1])
+
+    def sum(self, labels: tuple = ()) -> float:
+        values = self._values.get(labels)
+        return 0.0 if values is None else values[-1]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def snapshot(self) -> dict:
+        """
+        returns {label values: {'count', 'sum', 'buckets'}} where buckets
+        has the cumulative count of each upper bound, as in Prometheus
+        """
+        with self._lock:
+            values = {labels: list(counts) for labels, counts in self._values.items()}
+        snapshot = {}
+        for labels, counts in values.items():
+            cumulative = []
+            total = 0
+            for count in counts[:-1]:
+                total += count
+                cumulative.append(total)
+            snapshot[labels] = {
+                'count': total,
+                'sum': counts[-1],
+                'buckets': dict(zip(self.buckets + (float('inf'),), cumulative)),
+            }
+        return snapshot
+
+    def exposition(self) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, values in sorted(self.snapshot().items()):
+            for bound, count in values['buckets'].items():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels + ("le",), labels + (le,))} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, labels)} {values["sum"]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, labels)} {values["count"]}')
+        return lines
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+# all of the metrics, by name
+REGISTRY = {}
+
+def _register(metric):
+    REGISTRY[metric.name] = metric
+    return metric
+
+REQUEST_SECONDS = _register(Histogram(
+    'gobblers_request_seconds', 'Time taken to handle a request of app.py.', ('method', 'route', 'status')))
+MOVES = _register(Counter('gobblers_moves_total', 'Gobblers placed in games.'))
+GAMES = _register(Counter('gobblers_games_total', 'Games that were won, by the winning player.', ('winner',)))
+STATS_SAVE_SECONDS = _register(Histogram(
+    'gobblers_stats_save_seconds', 'Time taken to save the stats of a game, by phase (write the stats and the '
+    'game record, read a copy of the aggregates once the games being written are done, render the charts).',
+    ('phase',)))
+SEARCHES = _register(Counter('gobblers_searches_total', 'Moves chosen by a bot with a search.', ('bot',)))
+SEARCH_NODES = _register(Counter('gobblers_search_nodes_total', 'Positions searched by the search bot, '
+                                 'or playouts of the mcts bot.', ('bot',)))
+SEARCH_SECONDS = _register(Histogram('gobblers_search_seconds', 'Time taken by a bot to choose a move.', ('bot',)))
+SEARCH_DEPTH = _register(Histogram('gobblers_search_depth', 'Depth of the last completed iteration of a search.',
+                                   buckets=(1, 2, 3, 4, 5, 6, 8, 10, 12, 16, 24, 32, 64)))
+
+def record_search(bot: str, nodes: int, seconds: float, depth: int = None) -> None:
+    """
+    records a search of a bot, in this process or in a worker process
+    that returned what it searched. depth is None for bots without one
+    """
+    SEARCHES.inc(labels=(bot,))
+    SEARCH_NODES.inc(nodes, (bot,))
+    SEARCH_SECONDS.observe(seconds, (bot,))
+    if depth is not None:
+        SEARCH_DEPTH.observe(depth)
+
+def snapshot() -> dict:
+    """
+    returns the values of all of the metrics, by name
+    """
+    return {name: metric.snapshot() for name, metric in REGISTRY.items()}
+
+def reset() -> None:
+    for metric in REGISTRY.values():
+        metric.reset()
+
+def exposition() -> str:
+    """
+    returns all of the metrics in the Prometheus text format
+    """
+    lines = []
+    for metric in REGISTRY.values():
+        lines.extend(metric.exposition())
+    return '\n'.join(lines) + '\n'
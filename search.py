@@ -0,0 +1,249 @@
+import time
+import metrics
+from logic import Game, WINNING_MASKS, encode_move, decode_move
+from transposition import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
+
+WIN_SCORE = 100000
+MAX_DEPTH = 64
+
+# scores that are this close to WIN_SCORE are wins in a number of plies
+_WIN_THRESHOLD = WIN_SCORE - 1000
+
+# for every 9-bit mask of cells, how many cells of each
+# winning combination it covers
+_LINE_COUNTS = [tuple(bin(mask & combo_mask).count('1') for combo_mask in WINNING_MASKS)
+                for mask in range(512)]
+# the value of having 0, 1, 2 or 3 cells of a combination
+# that the opponent is not on
+_LINE_WEIGHTS = [0, 1, 10, 0]
+
+class SearchTimeout(Exception):
+    pass
+
+class SearchResult:
+    def __init__(self, move: tuple, score: int, depth: int, nodes: int, seconds: float):
+        self.move = move # (gobbler_size, board_position)
+        self.score = score # for the player to move
+        self.depth = depth # of the last completed iteration
+        self.nodes = nodes
+        self.seconds = seconds
+
+    @property
+    def nodes_per_second(self) -> float:
+        if self.seconds == 0:
+            return 0.0
+        return self.nodes / self.seconds
+
+class Search:
+    """
+    Negamax search with alpha-beta pruning and iterative deepening.
+    Moves are ordered by the transposition table move, then the
+    killer moves of the ply, then the history heuristic.
+    """
+    def __init__(self, table: TranspositionTable = None):
+        self.table = table if table is not None else TranspositionTable()
+        self.killers = [[None, None] for _ in range(MAX_DEPTH + 1)]
+        self.history = [0] * 54
+        self.nodes = 0
+        self._deadline = None
+
+    def search(self, game: Game, time_budget: float, max_depth: int = MAX_DEPTH) -> SearchResult:
+        """
+        searches the position for at most time_budget seconds
+        and returns the best move found.
+        The moves are made and taken back on the game itself, which
+        is left as it was
+        """
+        start = time.monotonic()
+        self._deadline = start + time_budget
+        self.nodes = 0
+        self.table.new_search()
+        self.killers = [[None, None] for _ in range(MAX_DEPTH + 1)]
+        self.history = [0] * 54
+
+        moves = list(game.legal_moves())
+        if not moves:
+            return SearchResult(None, 0, 0, 0, 0.0)
+        best_move, best_score, completed_depth = moves[0], 0, 0
+
+        for depth in range(1, min(max_depth, MAX_DEPTH) + 1):
+            try:
+                move, score = self._search_root(game, depth)
+            except SearchTimeout:
+                break
+            best_move, best_score, completed_depth = move, score, depth
+            # no need to look further once the result is certain
+            if abs(score) >= _WIN_THRESHOLD:
+                break
+
+        result = SearchResult(best_move, best_score, completed_depth, self.nodes, time.monotonic() - start)
+        if metrics.enabled:
+            metrics.record_search('search', result.nodes, result.seconds, result.depth)
+        return result
+
+    def principal_variation(self, game: Game, first_move: tuple, max_length: int = MAX_DEPTH) -> list:
+        """
+        returns the moves that the last search expects to be played from
+        the position, starting with first_move and then following the
+        best moves stored in the transposition table
+        """
+        moves = []
+        records = []
+        seen = {game.zobrist_hash}
+        move = first_move
+        try:
+            while move is not None and len(moves) < max_length:
+                # an entry could belong to another position with the same index
+                if move not in set(game.legal_moves()):
+                    break
+                moves.append(move)
+                records.append(game.apply_move(move))
+                if game.winner is not None or game.zobrist_hash in seen:
+                    break
+                seen.add(game.zobrist_hash)
+                entry = self.table.probe(game.zobrist_hash)
+                move = decode_move(entry[3]) if entry is not None and entry[3] is not None else None
+        finally:
+            for record in reversed(records):
+                game.undo_move(record)
+        return moves
+
+    def _search_root(self, game: Game, depth: int) -> tuple:
+        alpha, beta = -WIN_SCORE - 1, WIN_SCORE + 1
+        best_move = None
+        entry = self.table.probe(game.zobrist_hash)
+        table_move = entry[3] if entry is not None else None
+        for move in self._ordered_moves(game, 0, table_move):
+            score = -self._child_value(game, move, depth, -beta, -alpha, 0)
+            if score > alpha:
+                alpha, best_move = score, move
+        self.table.store(game.zobrist_hash, depth, alpha, EXACT, encode_move(best_move))
+        return best_move, alpha
+
+    def _negamax(self, game: Game, depth: int, alpha: int, beta: int, ply: int) -> int:
+        self.nodes += 1
+        if self.nodes & 0xFF == 0 and time.monotonic() >= self._deadline:
+            raise SearchTimeout
+
+        if depth == 0:
+            return self.evaluate(game)
+
+        # use a previous result for this position, if it is good enough
+        key = game.zobrist_hash
+        entry = self.table.probe(key)
+        table_move = None
+        if entry is not None:
+            entry_depth, value, flag, table_move = entry
+            value = _score_from_table(value, ply)
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return value
+                elif flag == LOWER_BOUND and value >= beta:
+                    return value
+                elif flag == UPPER_BOUND and value <= alpha:
+                    return value
+
+        original_alpha = alpha
+        best_score = -WIN_SCORE - 1
+        best_move = None
+        for move in self._ordered_moves(game, ply, table_move):
+            score = -self._child_value(game, move, depth, -beta, -alpha, ply)
+            if score > best_score:
+                best_score, best_move = score, move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                # remember the moves that cause cutoffs
+                killers = self.killers[ply]
+                if move != killers[0]:
+                    killers[1] = killers[0]
+                    killers[0] = move
+                self.history[encode_move(move)] += depth * depth
+                break
+
+        # a player who can't move can't do anything but wait
+        if best_move is None:
+            return 0
+
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.table.store(key, depth, _score_to_table(best_score, ply), flag, encode_move(best_move))
+        return best_score
+
+    def _child_value(self, game: Game, move: tuple, depth: int, alpha: int, beta: int, ply: int) -> int:
+        """
+        returns the value of the position after move,
+        for the opponent of the player making it
+        """
+        player = game.current_player_idx
+        record = game.apply_move(move)
+        winner = game.winner
+        try:
+            if winner is None:
+                return self._negamax(game, depth - 1, alpha, beta, ply + 1)
+        finally:
+            game.undo_move(record)
+        # a faster win is a better win
+        if winner == player:
+            return -(WIN_SCORE - ply - 1)
+        return WIN_SCORE - ply - 1
+
+    def _ordered_moves(self, game: Game, ply: int, table_move: int = None) -> list:
+        """
+        returns the legal moves, most promising first
+        """
+        moves = list(game.legal_moves())
+        if table_move is not None:
+            table_move = decode_move(table_move)
+        killers = self.killers[ply]
+        history = self.history
+
+        def priority(move):
+            if move == table_move:
+                return 1 << 40
+            if move == killers[0]:
+                return 1 << 39
+            if move == killers[1]:
+                return 1 << 38
+            return history[encode_move(move)]
+
+        moves.sort(key=priority, reverse=True)
+        return moves
+
+    def evaluate(self, game: Game) -> int:
+        """
+        scores a position for the player to move by the number of
+        cells they are on top of in the combinations that are still open
+        """
+        player = game.current_player_idx
+        own_counts = _LINE_COUNTS[game._visible[player]]
+        opponent_counts = _LINE_COUNTS[game._visible[player ^ 1]]
+        score = 0
+        for own, opponent in zip(own_counts, opponent_counts):
+            if not opponent:
+                score += _LINE_WEIGHTS[own]
+            if not own:
+                score -= _LINE_WEIGHTS[opponent]
+        return score
+
+def _score_to_table(score: int, ply: int) -> int:
+    """
+    wins are stored as a number of plies from the position
+    rather than from the root
+    """
+    if score >= _WIN_THRESHOLD:
+        return score + ply
+    if score <= -_WIN_THRESHOLD:
+        return score - ply
+    return score
+
+def _score_from_table(score: int, ply: int) -> int:
+    if score >= _WIN_THRESHOLD:
+        return score - ply
+    if score <= -_WIN_THRESHOLD:
+        return score + ply
+    return score
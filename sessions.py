@@ -0,0 +1,248 @@
+"""
+Keeps a separate game for every client of app.py.
+
+Each session has its own Game and GameStats, and two random ids:
+- the session id is the secret of the players, kept by a browser in a
+  cookie (or by an api client as a token), and needed to play moves
+- the game id is public, and lets anyone watch the game
+
+The store holds at most max_sessions sessions and about max_bytes
+of game state: when either is exceeded, or a session hasn't been used
+for idle_timeout seconds, the least recently used sessions are dropped.
+
+The moves of every session are published to the subscribers of
+its game id, see events.py.
+"""
+import secrets
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from events import EventBroker
+from logic import Game, GameStats
+
+# the cookie that keeps the session id of a browser
+SESSION_COOKIE = 'game_session'
+
+class GameSession:
+    def __init__(self, session_id: str, events: EventBroker = None, game_id: str = None):
+        self.session_id = session_id # secret
+        self.game_id = game_id if game_id is not None else secrets.token_urlsafe(12) # public
+        self.events = events
+        self.game = Game()
+        self.stats = GameStats()
+        self.last_used = time.monotonic()
+        self.version = 0 # changes whenever the game does
+        self.accounted_bytes = 0 # what the store counted for this session
+        # held while a request uses the session
+        self.lock = threading.Lock()
+
+    def new_game(self) -> None:
+        self.game = Game()
+        self.stats = GameStats()
+        self.version += 1
+        if self.events is not None:
+            self.events.publish(self.game_id, 'new_game', {'version': self.version})
+
+    def play(self, gobbler_size: int, board_position: int) -> bool:
+        """
+        plays a move if it is legal, and saves the stats if it wins.
+        returns whether the move was played
+        """
+        if (gobbler_size, board_position) not in set(self.game.legal_moves()):
+            return False
+        self.game.select_gobbler(gobbler_size)
+        _, winner = self.game.place_selected_gobbler(board_position)
+        self.moved(gobbler_size, board_position, winner)
+        return True
+
+    def moved(self, gobbler_size: int, board_position: int, winner: int) -> None:
+        """
+        records a move that has just been placed, tells
+        the subscribers and saves the stats if it won
+        """
+        self.stats.record_move(gobbler_size, board_position)
+        self.version += 1
+        if self.events is not None:
+            self.events.publish(self.game_id, 'move', {
+                'version': self.version,
+                'player': self.game.current_player_idx ^ 1,
+                'gobbler_size': int(gobbler_size),
+                'board_position': int(board_position),
+                'current_player': self.game.current_player_idx,
+                'winner': winner,
+            })
+        if winner is not None:
+            # the charts are drawn after the response is sent
+            self.stats.save(winner, background=True)
+
+    def changed(self) -> None:
+        """
+        tells the subscribers about a change that isn't a move,
+        e.g. a gobbler that was picked up but not placed
+        """
+        self.version += 1
+        if self.events is not None:
+            self.events.publish(self.game_id, 'state', self.state())
+
+    def state(self) -> dict:
+        """
+        returns the state of the game, with each cell
+        of the board as a list of [player, size] from the
+        bottom of its stack to the top
+        """
+        game = self.game
+        board = [[[code & 1, (code >> 1) + 1] for code in range(2 * game.number_of_gobblers) if stack >> code & 1]
+                 for stack in game._stacks]
+        selected = game._selected
+        return {
+            'game_id': self.game_id,
+            'version': self.version,
+            'players': game.player_names,
+            'current_player': game.current_player_idx,
+            'winner': game.winner,
+            'selected': None if selected is None else (selected >> 1) + 1,
+            'board': board,
+        }
+
+    def authorized(self, token: str) -> bool:
+        """
+        returns whether token is the secret of the players
+        """
+        # compared as bytes, since a token may not be ascii
+        return token is not None and secrets.compare_digest(token.encode(), self.session_id.encode())
+
+    def memory_bytes(self) -> int:
+        """
+        returns an estimate of the memory that the game state
+        and the stats of the session take
+        """
+        game = self.game
+        size = sys.getsizeof(self) + sys.getsizeof(game) + sys.getsizeof(game.__dict__)
+        for values in (game._masks, game._previous, game._stacks, game._visible, game.player_names):
+            size += sys.getsizeof(values)
+        size += sum(sys.getsizeof(name) for name in game.player_names)
+
+        stats = self.stats
+        size += sys.getsizeof(stats) + sys.getsizeof(stats.__dict__) + sys.getsizeof(stats.history)
+        for moves in stats.moves:
+            size += sys.getsizeof(moves) + sum(sys.getsizeof(move) for move in moves)
+        return size
+
+class SessionStore:
+    def __init__(self, max_sessions: int = 10000, idle_timeout: float = 3600,
+                 max_bytes: int = 64 * 1024 * 1024, events: EventBroker = None):
+        self.events = events if events is not None else EventBroker()
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout # seconds
+        self.max_bytes = max_bytes
+        self.memory_bytes = 0 # of all of the sessions
+        self.evictions = 0
+
+        # least recently used first
+        self._sessions = OrderedDict()
+        self._games = {} # the same sessions by game id
+        self._lock = threading.Lock()
+
+    def create(self) -> GameSession:
+        """
+        starts a new session with a new game
+        """
+        session = GameSession(secrets.token_urlsafe(16), self.events)
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._games[session.game_id] = session
+            self._account(session)
+            self._evict()
+        return session
+
+    def get(self, session_id: str) -> GameSession:
+        """
+        returns the session, or None if there is no such
+        session or it has expired
+        """
+        with self._lock:
+            return self._touch(self._sessions.get(session_id))
+
+    def get_game(self, game_id: str) -> GameSession:
+        """
+        returns the session of a public game id, or None
+        """
+        with self._lock:
+            return self._touch(self._games.get(game_id))
+
+    @contextmanager
+    def use(self, session_id: str):
+        """
+        yields the session (or None) and keeps other requests of the same
+        session out until the with block is done. Its memory is counted
+        again afterwards, since the block may have changed the game
+        """
+        with self._use(self.get(session_id)) as session:
+            yield session
+
+    @contextmanager
+    def use_game(self, game_id: str):
+        """
+        as use, for the session of a public game id
+        """
+        with self._use(self.get_game(game_id)) as session:
+            yield session
+
+    @contextmanager
+    def _use(self, session: GameSession):
+        if session is None:
+            yield None
+            return
+        with session.lock:
+            try:
+                yield session
+            finally:
+                with self._lock:
+                    if self._sessions.get(session.session_id) is session:
+                        self._account(session)
+                        self._evict()
+
+    def _touch(self, session: GameSession) -> GameSession:
+        # must be called with the lock held
+        self._evict()
+        if session is not None and self._sessions.get(session.session_id) is session:
+            session.last_used = time.monotonic()
+            self._sessions.move_to_end(session.session_id)
+            return session
+        return None
+
+    def remove(self, session_id: str) -> None:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                del self._games[session.game_id]
+                self.memory_bytes -= session.accounted_bytes
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def _account(self, session: GameSession) -> None:
+        size = session.memory_bytes()
+        self.memory_bytes += size - session.accounted_bytes
+        session.accounted_bytes = size
+
+    def _evict(self) -> None:
+        """
+        drops expired sessions and then the least recently used
+        ones until the store is within its limits
+        """
+        oldest = time.monotonic() - self.idle_timeout
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            over_limit = len(self._sessions) > self.max_sessions or self.memory_bytes > self.max_bytes
+            if session.last_used >= oldest and not over_limit:
+                break
+            del self._sessions[session.session_id]
+            del self._games[session.game_id]
+            self.memory_bytes -= session.accounted_bytes
+            self.evictions += 1
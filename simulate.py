@@ -0,0 +1,238 @@
+"""
+Plays many bot vs bot games without any prompts or printing,
+spread over a pool of worker processes, and saves the results
+to the stats in batches (to stats.bin, or to a csv if the
+output ends with .csv). Every game, including the ones without a
+winner, is also saved to games.bin next to the output.
+
+    python simulate.py 1000 --players random search --workers 4 --seed 1
+"""
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from book import open_book
+from cli import Bot, SearchBot, MCTSBot
+from logic import Game, GameStats
+from game_records import default_writer
+from stats_store import CSVStatsBackend, default_backend
+from transposition import TranspositionTable
+
+BOT_TYPES = {
+    'random': Bot,
+    'search': SearchBot,
+    'mcts': MCTSBot,
+}
+
+# simulated search bots think for a short time unless told otherwise, and
+# the bots of a process share one small transposition table rather than
+# allocating a 16 MB table each
+SIMULATION_TIME_BUDGET = 0.05
+SIMULATION_TABLE_MB = 2
+_table = None
+# book.bin, opened once per process, see shared_book
+_book = None
+_book_opened = False
+
+class SimulationResult:
+    def __init__(self, games: int, draws: int, wins: list, seconds: float):
+        self.games = games
+        self.draws = draws # games that reached max_plies without a winner
+        self.wins = wins # for each player
+        self.seconds = seconds
+
+    @property
+    def games_per_second(self) -> float:
+        if self.seconds == 0:
+            return 0.0
+        return self.games / self.seconds
+
+def make_bot(bot_type: str, player_number: int, game: Game, seed: int, bot_options: dict = None) -> Bot:
+    """
+    bot_options holds extra arguments for each bot type,
+    e.g. {'search': {'time_budget': 0.1}}
+    """
+    bot_class = BOT_TYPES[bot_type]
+    options = dict((bot_options or {}).get(bot_type, {}))
+    if bot_class in (SearchBot, MCTSBot):
+        options.setdefault('book', shared_book())
+    return bot_class(player_number, bot_type, game, seed=seed, verbose=False, **options)
+
+def shared_book():
+    """
+    returns the opening book (book.bin) that the bots of this process
+    play from, or None if it hasn't been built
+    """
+    global _book, _book_opened
+    if not _book_opened:
+        _book = open_book()
+        _book_opened = True
+    return _book
+
+def choose_move(game: Game, bot_type: str, seed: int = None, bot_options: dict = None) -> tuple:
+    """
+    returns the (gobbler_size, board_position) that a bot would play
+    in a position, without changing the game. Games can be pickled,
+    so this can run in another process
+    """
+    return choose_move_and_search(game, bot_type, seed, bot_options)[0]
+
+def choose_move_and_search(game: Game, bot_type: str, seed: int = None, bot_options: dict = None) -> tuple:
+    """
+    as choose_move, but returns (move, search) where search is what the
+    bot searched, as the arguments of metrics.record_search, or None.
+    A process that chose a move for another returns this, so that the
+    search is recorded in the metrics of the process that serves them
+    """
+    game = game.copy()
+    bot = make_bot(bot_type, game.current_player_idx, game, seed, bot_options)
+    bot.select_gobbler()
+    result = getattr(bot, 'last_result', None)
+    if isinstance(bot, SearchBot) and result is not None:
+        return bot.move, ('search', result.nodes, result.seconds, result.depth)
+    if isinstance(bot, MCTSBot) and result is not None:
+        return bot.move, ('mcts', result.playouts, result.seconds)
+    return bot.move, None
+
+def play_game(bot_types: list, rng: random.Random, max_plies: int = 200, bot_options: dict = None) -> tuple:
+    """
+    plays one game and returns (winner, stats),
+    winner is None if nobody won within max_plies
+    """
+    game = Game()
+    stats = GameStats()
+    # the bots are seeded from the seed of the game, so that
+    # the game can be played again from its record
+    stats.seed = rng.getrandbits(64)
+    stats.players = list(bot_types)
+    game_rng = random.Random(stats.seed)
+    players = [make_bot(bot_types[n], n, game, game_rng.getrandbits(64), bot_options) for n in range(2)]
+
+    for _ in range(max_plies):
+        # a player that can't move can't finish the game
+        if next(game.legal_moves(), None) is None:
+            break
+        player = players[game.current_player_idx]
+        gobbler_size = player.select_gobbler()
+        game.select_gobbler(gobbler_size)
+        board_position = player.select_board_position()
+        _, winner = game.place_selected_gobbler(board_position)
+        stats.record_move(gobbler_size, board_position)
+        if winner is not None:
+            return winner, stats
+    return None, stats
+
+def simulation_options(bot_options: dict = None) -> dict:
+    """
+    returns bot_options with the defaults of simulated search bots,
+    and the transposition table that they share in this process
+    """
+    global _table
+    if _table is None:
+        _table = TranspositionTable(SIMULATION_TABLE_MB)
+    options = {bot_type: dict(values) for bot_type, values in (bot_options or {}).items()}
+    search_options = options.setdefault('search', {})
+    search_options.setdefault('time_budget', SIMULATION_TIME_BUDGET)
+    search_options['table'] = _table
+    return options
+
+def play_games(bot_types: list, number_of_games: int, seed: int, max_plies: int = 200,
+               bot_options: dict = None) -> tuple:
+    """
+    plays a batch of games and returns (records, draws, game_records),
+    where records are the stats of the games that were won and
+    game_records the GameRecords of all of the games.
+    This is what each worker process runs.
+    """
+    bot_options = simulation_options(bot_options)
+    rng = random.Random(seed)
+    records = []
+    draws = 0
+    game_records = []
+    for _ in range(number_of_games):
+        winner, stats = play_game(bot_types, rng, max_plies, bot_options)
+        if winner is None:
+            draws += 1
+        else:
+            records.append(stats.get_record(winner))
+        game_records.append(stats.get_game_record(winner))
+    return records, draws, game_records
+
+def simulate(number_of_games: int, bot_types: list, workers: int = 1, seed: int = None,
+             batch_size: int = 100, max_plies: int = 200, bot_options: dict = None,
+             path: str = 'stats.bin', games_path: str = None) -> SimulationResult:
+    """
+    plays number_of_games games in batches of batch_size, and appends
+    the results of each batch to the stats as soon as it is done.
+    The games are saved to games_path, games.bin next to path by default.
+    Given a seed, the same games are played whatever the number of workers
+    """
+    start = time.monotonic()
+    rng = random.Random(seed)
+    batches = []
+    remaining = number_of_games
+    while remaining > 0:
+        batches.append((min(batch_size, remaining), rng.getrandbits(64)))
+        remaining -= batch_size
+
+    wins = [0, 0]
+    draws = 0
+    if path.endswith('.csv'):
+        backend = CSVStatsBackend(path)
+    else:
+        backend = default_backend(path)
+    if games_path is None:
+        games_path = os.path.join(os.path.dirname(path), 'games.bin')
+    writer = default_writer(games_path)
+
+    def save(records, batch_draws, game_records):
+        nonlocal draws
+        backend.append(records)
+        writer.write(game_records)
+        for record in records:
+            wins[record['winner']] += 1
+        draws += batch_draws
+
+    if workers == 1:
+        for games, batch_seed in batches:
+            save(*play_games(bot_types, games, batch_seed, max_plies, bot_options))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(play_games, bot_types, games, batch_seed, max_plies, bot_options)
+                       for games, batch_seed in batches]
+            for future in as_completed(futures):
+                save(*future.result())
+
+    return SimulationResult(number_of_games, draws, wins, time.monotonic() - start)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play bot vs bot games without a user interface.')
+    parser.add_argument('games', type=int, help='number of games to play')
+    parser.add_argument('--players', nargs=2, default=['random', 'random'], choices=list(BOT_TYPES),
+                        help='the bot type of player 0 and player 1')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help='number of games each worker plays before its results are saved')
+    parser.add_argument('--max-plies', type=int, default=200,
+                        help='games without a winner after this many plies are draws')
+    parser.add_argument('--time-budget', type=float, default=None,
+                        help=f'seconds per move of search bots, {SIMULATION_TIME_BUDGET} by default')
+    parser.add_argument('--playouts', type=int, default=None, help='playouts per move of mcts bots')
+    parser.add_argument('--output', default='stats.bin')
+    parser.add_argument('--games-output', default=None,
+                        help='where to save every game, games.bin next to the output by default')
+    args = parser.parse_args()
+
+    bot_options = {'search': {}, 'mcts': {}}
+    if args.time_budget is not None:
+        bot_options['search']['time_budget'] = args.time_budget
+    if args.playouts is not None:
+        bot_options['mcts']['playouts'] = args.playouts
+
+    result = simulate(args.games, args.players, args.workers, args.seed, args.batch_size,
+                      args.max_plies, bot_options, args.output, args.games_output)
+    print(f'Played {result.games} games in {result.seconds:.2f}s ({result.games_per_second:.1f} games/sec).')
+    print(f'Player 0 ({args.players[0]}) won {result.wins[0]}, player 1 ({args.players[1]}) won '
+          f'{result.wins[1]}, {result.draws} draws.')
@@ -0,0 +1,361 @@
+"""
+Offline retrograde solver for the small variants of Gobblet Gobblers
+(fewer gobbler sizes than the real game's 6).
+
+Every position (the cell of each gobbler and the player to move) has
+a fixed index, and the solver stores one 16-bit entry per index in a
+file that is memory-mapped, both while solving and when it is loaded:
+bits 0-2 hold the state of the position and bits 3-15 the number of
+plies until the game ends with perfect play.
+
+Solving runs in two phases:
+1. the positions reachable from the start are found by sweeping the
+   file and expanding every newly reached position
+2. positions are labeled won or lost one distance at a time: a position
+   is won in d plies if a move leads to a position lost in d - 1 plies,
+   and lost in d plies if every move leads to a position won in fewer
+   than d plies. Whatever is left when a pass finds nothing is a draw
+
+The progress (phase, pass and position) is kept in the file header and
+written every few seconds, so a run can be stopped and resumed.
+
+Every index is swept, reachable or not, so this only suits the small
+variants: 3 sizes (2 * 91 ** 3 indices, a 3 MB file) are solved in
+under a minute and 4 sizes (a 274 MB file) in about an hour. The 6-size
+game has 2 * 91 ** 6 (about 10 ** 12) indices, i.e. a 2 TB file and
+weeks of sweeping, and is not what this is for.
+"""
+import argparse
+import mmap
+import os
+import struct
+import time
+from logic import Game, FIRST_WINNING_COMBINATION
+
+# states of a position
+UNREACHABLE = 0
+FRONTIER = 1 # reached but not expanded yet, only used in phase 1
+DRAW = 2 # also used for positions that are not solved yet
+WIN = 3 # for the player to move
+LOSS = 4
+
+# phases of the solver
+PHASE_REACH = 0
+PHASE_RETROGRADE = 1
+PHASE_DONE = 2
+
+SIDELINE = 9
+
+# the pairs of cells that the two gobblers of one size can be on
+# (cell 9 is the sideline). They can't be on the same cell.
+PAIRS = [(cell_0, cell_1) for cell_0 in range(10) for cell_1 in range(10)
+         if cell_0 != cell_1 or cell_0 == SIDELINE]
+PAIR_INDEX = {pair: n for n, pair in enumerate(PAIRS)}
+
+MAGIC = b'GGTB'
+VERSION = 1
+# magic, version, number of gobblers, phase, changed, pass number, cursor
+HEADER = struct.Struct('<4sBBBBIQ')
+HEADER_SIZE = 32
+ENTRY_SIZE = 2
+
+def number_of_positions(number_of_gobblers: int) -> int:
+    return 2 * len(PAIRS) ** number_of_gobblers
+
+def position_index(game: Game) -> int:
+    """
+    returns the index of the position of a game
+    that has no selected gobbler
+    """
+    index = 0
+    for size_idx in range(game.number_of_gobblers - 1, -1, -1):
+        mask_0 = game._masks[size_idx * 2]
+        mask_1 = game._masks[size_idx * 2 + 1]
+        pair = (mask_0.bit_length() - 1 if mask_0 else SIDELINE,
+                mask_1.bit_length() - 1 if mask_1 else SIDELINE)
+        index = index * len(PAIRS) + PAIR_INDEX[pair]
+    return index * 2 + game.current_player_idx
+
+def successors(index: int, number_of_gobblers: int):
+    """
+    yields (move, child_index, winner) for every legal move in a
+    position, where move is a (gobbler_size, board_position) pair and
+    winner is the player that wins with the move, or None
+    """
+    player = index & 1
+    number_of_pairs = len(PAIRS)
+
+    # decode the position
+    cells = []
+    stacks = [0] * 9
+    weights = []
+    rest = index >> 1
+    weight = 2
+    for size_idx in range(number_of_gobblers):
+        pair = PAIRS[rest % number_of_pairs]
+        rest //= number_of_pairs
+        for gobbler_player in range(2):
+            cell = pair[gobbler_player]
+            cells.append(cell)
+            if cell != SIDELINE:
+                stacks[cell] |= 1 << (size_idx * 2 + gobbler_player)
+        weights.append(weight)
+        weight *= number_of_pairs
+    visible = [0, 0]
+    for cell, stack in enumerate(stacks):
+        if stack:
+            visible[(stack.bit_length() - 1) & 1] |= 1 << cell
+
+    for size_idx in range(number_of_gobblers):
+        code = size_idx * 2 + player
+        origin = cells[code]
+        visible_player, visible_opponent = visible[player], visible[player ^ 1]
+
+        # pick the gobbler up, if it is on top
+        if origin != SIDELINE:
+            stack = stacks[origin]
+            if stack >> (code + 1):
+                continue
+            stack ^= 1 << code
+            visible_player &= ~(1 << origin)
+            if stack and (stack.bit_length() - 1) & 1 != player:
+                visible_opponent |= 1 << origin
+            elif stack:
+                visible_player |= 1 << origin
+
+        other_cell = cells[code ^ 1]
+        old_pair = (origin, other_cell) if player == 0 else (other_cell, origin)
+        base = index - PAIR_INDEX[old_pair] * weights[size_idx] - player + (player ^ 1)
+
+        for cell in range(9):
+            if cell == origin or stacks[cell] >> (code & ~1):
+                continue
+            mask = 1 << cell
+            first_player = FIRST_WINNING_COMBINATION[visible_player | mask]
+            first_opponent = FIRST_WINNING_COMBINATION[visible_opponent & ~mask]
+            if first_player < first_opponent:
+                winner = player
+            elif first_opponent < first_player:
+                winner = player ^ 1
+            else:
+                winner = None
+            new_pair = (cell, other_cell) if player == 0 else (other_cell, cell)
+            child = base + PAIR_INDEX[new_pair] * weights[size_idx]
+            yield (size_idx + 1, cell + 1), child, winner
+
+class Solver:
+    def __init__(self, path: str, number_of_gobblers: int = 6, checkpoint_seconds: float = 30):
+        """
+        opens the tablebase file at path to continue solving it,
+        or creates it if it doesn't exist
+        """
+        self.path = path
+        self.number_of_gobblers = number_of_gobblers
+        self.checkpoint_seconds = checkpoint_seconds
+        self.size = number_of_positions(number_of_gobblers)
+
+        file_is_new = not os.path.exists(path)
+        self._file = open(path, 'w+b' if file_is_new else 'r+b')
+        if file_is_new:
+            # the file is sparse, so untouched positions take no space on disk
+            self._file.truncate(HEADER_SIZE + ENTRY_SIZE * self.size)
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        self._table = memoryview(self._mmap)[HEADER_SIZE:].cast('H')
+
+        if file_is_new:
+            # start with only the initial position reached
+            self.phase = PHASE_REACH
+            self.pass_number = 0
+            self.cursor = 0
+            self.changed = False
+            self._table[position_index(Game(number_of_gobblers))] = FRONTIER
+            self._write_header()
+        else:
+            self._read_header()
+
+    def run(self, max_seconds: float = None) -> bool:
+        """
+        solves until done or until max_seconds have passed.
+        returns True if the tablebase is complete
+        """
+        start = time.monotonic()
+        last_checkpoint = start
+        table = self._table
+        n = self.number_of_gobblers
+
+        while self.phase != PHASE_DONE:
+            for index in range(self.cursor, self.size):
+                entry = table[index]
+                if self.phase == PHASE_REACH and entry == FRONTIER:
+                    for _, child, winner in successors(index, n):
+                        if winner is None and table[child] == UNREACHABLE:
+                            table[child] = FRONTIER
+                            # a position behind the cursor needs another sweep
+                            if child < index:
+                                self.changed = True
+                    table[index] = DRAW
+                elif self.phase == PHASE_RETROGRADE and entry == DRAW:
+                    label = self._label(index)
+                    if label:
+                        table[index] = label
+                        self.changed = True
+
+                # every so often, save the progress
+                if index & 0xFFF == 0:
+                    now = time.monotonic()
+                    if max_seconds is not None and now - start >= max_seconds:
+                        self.cursor = index + 1
+                        self.checkpoint()
+                        return False
+                    if now - last_checkpoint >= self.checkpoint_seconds:
+                        self.cursor = index + 1
+                        self.checkpoint()
+                        last_checkpoint = now
+
+            # the sweep is finished, decide what to do next
+            if self.phase == PHASE_REACH and not self.changed:
+                self.phase = PHASE_RETROGRADE
+                self.pass_number = 1
+            elif self.phase == PHASE_RETROGRADE:
+                if self.changed:
+                    self.pass_number += 1
+                else:
+                    self.phase = PHASE_DONE
+            self.changed = False
+            self.cursor = 0
+            self.checkpoint()
+
+        return True
+
+    def _label(self, index: int) -> int:
+        """
+        returns the entry of a position that is won or lost in
+        pass_number plies, or None
+        """
+        distance = self.pass_number
+        player = index & 1
+        has_moves = False
+        all_lost = True
+        for _, child, winner in successors(index, self.number_of_gobblers):
+            has_moves = True
+            if winner == player:
+                return (1 << 3) | WIN
+            elif winner is not None:
+                # the move reveals a line of the opponent
+                continue
+            entry = self._table[child]
+            state = entry & 7
+            child_distance = entry >> 3
+            if state == LOSS and child_distance == distance - 1:
+                return (distance << 3) | WIN
+            if state != WIN or child_distance >= distance:
+                all_lost = False
+        if has_moves and all_lost:
+            return (distance << 3) | LOSS
+        return None
+
+    def checkpoint(self) -> None:
+        """
+        writes the table and then the progress to disk
+        """
+        self._mmap.flush()
+        self._write_header()
+        self._mmap.flush()
+
+    def close(self) -> None:
+        self.checkpoint()
+        self._table.release()
+        self._mmap.close()
+        self._file.close()
+
+    def _write_header(self) -> None:
+        self._mmap[:HEADER.size] = HEADER.pack(MAGIC, VERSION, self.number_of_gobblers, self.phase,
+                                               self.changed, self.pass_number, self.cursor)
+
+    def _read_header(self) -> None:
+        magic, version, number_of_gobblers, self.phase, changed, self.pass_number, self.cursor = \
+            HEADER.unpack(self._mmap[:HEADER.size])
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{self.path} is not a tablebase file')
+        if number_of_gobblers != self.number_of_gobblers:
+            raise ValueError(f'{self.path} is a tablebase for {number_of_gobblers} gobbler sizes')
+        self.changed = bool(changed)
+
+class Tablebase:
+    """
+    A solved tablebase, memory-mapped for lookups
+    """
+    def __init__(self, path: str):
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.number_of_gobblers, phase, _, _, _ = \
+            HEADER.unpack(self._mmap[:HEADER.size])
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a tablebase file')
+        if phase != PHASE_DONE:
+            raise ValueError(f'{path} is not completely solved yet')
+        self._table = memoryview(self._mmap)[HEADER_SIZE:].cast('H')
+
+    def probe(self, game: Game) -> tuple:
+        """
+        returns (state, distance) of the position for the player to move,
+        where state is WIN, LOSS or DRAW and distance is the number of
+        plies until the game ends with perfect play
+        """
+        entry = self._table[position_index(game)]
+        state = entry & 7
+        if state == UNREACHABLE:
+            raise ValueError('the position is not reachable')
+        return state, entry >> 3
+
+    def best_move(self, game: Game) -> tuple:
+        """
+        returns the (gobbler_size, board_position) of a move
+        with the best result, or None if there are no moves
+        """
+        player = game.current_player_idx
+        best_move = None
+        best_value = None
+        for move, child, winner in successors(position_index(game), self.number_of_gobblers):
+            # win as fast as possible, lose as slowly as possible
+            if winner == player:
+                value = (2, 0)
+            elif winner is not None:
+                value = (0, 0)
+            else:
+                entry = self._table[child]
+                state = entry & 7
+                if state == LOSS:
+                    value = (2, -(entry >> 3))
+                elif state == WIN:
+                    value = (0, entry >> 3)
+                else:
+                    value = (1, 0)
+            if best_value is None or value > best_value:
+                best_move, best_value = move, value
+        return best_move
+
+    def close(self) -> None:
+        self._table.release()
+        self._mmap.close()
+        self._file.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Solve a small variant of Gobblet Gobblers (3 or 4 gobbler '
+                                                 'sizes) into a tablebase file.')
+    parser.add_argument('path', help='tablebase file, created if it does not exist')
+    parser.add_argument('--sizes', type=int, default=3,
+                        help='number of gobbler sizes: 3 takes under a minute and 4 about an hour, '
+                             'the 6 of the real game would need a 2 TB file and weeks')
+    parser.add_argument('--max-seconds', type=float, default=None,
+                        help='stop after this long, run again to resume')
+    args = parser.parse_args()
+
+    solver = Solver(args.path, args.sizes)
+    done = solver.run(args.max_seconds)
+    solver.close()
+    if done:
+        print(f'{args.path} is solved.')
+    else:
+        print(f'Stopped in phase {solver.phase}, pass {solver.pass_number} at position {solver.cursor}. '
+              'Run again to resume.')
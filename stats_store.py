@@ -0,0 +1,574 @@
+"""
+Backends that store the stats of every finished game.
+
+BinaryStatsBackend is the system of record. New games are appended to
+a log of fixed-size records (stats.log), and every so often the log is
+compacted into a columnar file (stats.bin) with one array per column.
+Both files are memory-mapped when the history is loaded. The compaction
+runs on a background thread, so the game that fills the log doesn't wait
+for it.
+
+Several processes can share the files, e.g. app.py and simulate.py:
+appending, compacting and loading take a lock on stats.lock (with
+fcntl.flock, so only where fcntl is available) and first catch up with
+whatever the other processes wrote.
+
+CSVStatsBackend keeps the original stats.csv format, which is now
+used to import and export the stats.
+
+StatsAggregates are the win counts, successful openers and number of
+turns that the charts show. Openers are counted together with their
+rotations/reflections, e.g. '3 to 9' as '3 to 1'. The binary backend
+updates them with every game and keeps them next to the records
+(stats.agg.json), so the charts don't need the whole history.
+"""
+import json
+import logging
+import os
+import struct
+import threading
+try:
+    import fcntl
+except ImportError:
+    # e.g. on Windows, where the files can't be shared by processes
+    fcntl = None
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['winner', 'first_move_0', 'first_move_1', 'last_move_0', 'last_move_1',
+           'first_move_winner', 'last_move_winner', 'num_turns']
+MOVE_COLUMNS = COLUMNS[1:7]
+
+logger = logging.getLogger(__name__)
+
+# moves are stored as one byte, (gobbler_size - 1) * 9 + board_position - 1
+# like logic.encode_move, and shown as strings like '3 to 5'
+MOVE_STRINGS = np.array([f'{size} to {position}' for size in range(1, 7) for position in range(1, 10)],
+                        dtype=object)
+
+# the log: a header, then one record per game
+LOG_MAGIC = b'GGSL'
+LOG_HEADER = struct.Struct('<4sB3xQ') # magic, version, generation
+LOG_RECORD = struct.Struct('<B6BxI') # winner, moves, num_turns
+LOG_DTYPE = np.dtype([('winner', 'u1'), ('moves', 'u1', (6,)), ('pad', 'u1'), ('num_turns', '<u4')])
+
+# the compacted file: a header, then each column as one array
+BASE_MAGIC = b'GGSB'
+BASE_HEADER = struct.Struct('<4sB3xQQ') # magic, version, number of games, generation
+BASE_HEADER_SIZE = 32
+VERSION = 1
+
+def _encode_move(move: str) -> int:
+    gobbler_size, board_position = str(move).split(' to ')
+    return (int(gobbler_size) - 1) * 9 + int(board_position) - 1
+
+def _opener(move: str) -> str:
+    # imported here since symmetry.py imports logic.py, which imports this
+    from symmetry import canonicalize_move
+    return canonicalize_move(MOVE_STRINGS[_encode_move(move)])
+
+class StatsAggregates:
+    """
+    Counters over all recorded games that are updated
+    one game at a time
+    """
+    def __init__(self):
+        self.games = 0
+        self.wins = [0, 0] # for each player
+        self.openers = {} # number of wins for each first move of the winner, up to symmetry
+        self.turns = {} # number of games for each number of turns
+
+    def add(self, record: dict) -> None:
+        """
+        counts one more game (a dict of COLUMNS)
+        """
+        self.games += 1
+        self.wins[int(record['winner'])] += 1
+        opener = _opener(record['first_move_winner'])
+        self.openers[opener] = self.openers.get(opener, 0) + 1
+        num_turns = int(record['num_turns'])
+        self.turns[num_turns] = self.turns.get(num_turns, 0) + 1
+
+    def top_openers(self, k: int = 5) -> list:
+        """
+        returns the k first moves that won the most games,
+        as a list of (move, wins)
+        """
+        # there are only 54 possible moves, so this doesn't grow with the history
+        return sorted(self.openers.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+    @classmethod
+    def from_stats(cls, stats: pd.DataFrame):
+        """
+        counts all of the games in a stats DataFrame
+        """
+        aggregates = cls()
+        aggregates.games = len(stats)
+        wins = stats['winner'].value_counts()
+        aggregates.wins = [int(wins.get(0, 0)), int(wins.get(1, 0))]
+        openers = stats['first_move_winner'].map(_opener)
+        aggregates.openers = {move: int(count) for move, count in openers.value_counts().items()}
+        aggregates.turns = {int(num_turns): int(count)
+                            for num_turns, count in stats['num_turns'].value_counts().items()}
+        return aggregates
+
+    def save(self, path: str) -> None:
+        data = {
+            'games': self.games,
+            'wins': self.wins,
+            'openers': self.openers,
+            'turns': {str(num_turns): count for num_turns, count in self.turns.items()},
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path) as f:
+            data = json.load(f)
+        aggregates = cls()
+        aggregates.games = data['games']
+        aggregates.wins = data['wins']
+        # files saved before openers were counted up to symmetry are merged
+        for opener, count in data['openers'].items():
+            opener = _opener(opener)
+            aggregates.openers[opener] = aggregates.openers.get(opener, 0) + count
+        aggregates.turns = {int(num_turns): count for num_turns, count in data['turns'].items()}
+        return aggregates
+
+    def copy(self):
+        aggregates = StatsAggregates()
+        aggregates.games = self.games
+        aggregates.wins = list(self.wins)
+        aggregates.openers = dict(self.openers)
+        aggregates.turns = dict(self.turns)
+        return aggregates
+
+    def merge(self, other) -> None:
+        """
+        adds the counts of other to these
+        """
+        self.games += other.games
+        self.wins = [self.wins[0] + other.wins[0], self.wins[1] + other.wins[1]]
+        for opener, count in other.openers.items():
+            self.openers[opener] = self.openers.get(opener, 0) + count
+        for num_turns, count in other.turns.items():
+            self.turns[num_turns] = self.turns.get(num_turns, 0) + count
+
+class CSVStatsBackend:
+    """
+    The stats.csv format: a line of comma-terminated
+    values per game, after a line of column headers
+    """
+    def __init__(self, path: str = 'stats.csv'):
+        self.path = path
+
+    def append(self, records: list) -> None:
+        """
+        appends the records (dicts of COLUMNS) of any
+        number of games to the csv in one go
+        """
+        if not records:
+            return
+
+        column_headers = ''
+        lines_to_write = ''
+        file_is_new = not os.path.exists(self.path)
+        if file_is_new:
+            for k in records[0]:
+                column_headers += f'{k},'
+            # add linebreaks
+            column_headers += '\n'
+
+        for data_to_record in records:
+            for v in data_to_record.values():
+                lines_to_write += f'{v},'
+            lines_to_write += '\n'
+
+        # write the column headers and the lines
+        with open(self.path, 'a') as f:
+            f.write(column_headers + lines_to_write)
+
+    def load(self) -> pd.DataFrame:
+        return pd.read_csv(self.path)
+
+    @property
+    def aggregates(self) -> StatsAggregates:
+        # the csv is not the system of record, so
+        # the aggregates are counted from scratch
+        return StatsAggregates.from_stats(self.load())
+
+class BinaryStatsBackend:
+    """
+    An append-only log of fixed-size records plus a compacted
+    columnar file, see the module docstring.
+
+    When several threads finish games at the same time, their records
+    are written together (group commit): the first thread to arrive
+    writes everything that is waiting while the others wait for it.
+    """
+    def __init__(self, path: str = 'stats.bin', log_path: str = None, compact_every: int = 10000,
+                 sync: bool = False):
+        self.path = path
+        self.log_path = log_path if log_path is not None else os.path.splitext(path)[0] + '.log'
+        self.aggregates_path = os.path.splitext(path)[0] + '.agg.json'
+        self.lock_path = os.path.splitext(path)[0] + '.lock'
+        self.compact_every = compact_every # log records that trigger a compaction
+        self.sync = sync # whether to fsync every write
+
+        self._condition = threading.Condition()
+        self._pending = []
+        self._pending_records = []
+        self._batch = 0 # the batch that new records join
+        self._written_batch = -1
+        self._failed_batches = {} # batch -> the exception that stopped it being written
+        self._writing = False
+        self._compaction = None # the thread compacting the files, if any
+
+        self._lock_file = open(self.lock_path, 'ab')
+        with self._process_lock():
+            self._generation = self._read_base_header()[1]
+            self._log_records = self._open_log()
+        self._aggregates = None
+
+    def append(self, records: list) -> None:
+        """
+        appends the records (dicts of COLUMNS) of any number of games,
+        and returns once they are written
+        """
+        records = list(records)
+        packed = [LOG_RECORD.pack(int(record['winner']),
+                                  *(_encode_move(record[column]) for column in MOVE_COLUMNS),
+                                  int(record['num_turns']))
+                  for record in records]
+        if not packed:
+            return
+
+        with self._condition:
+            self._pending.extend(packed)
+            self._pending_records.extend(records)
+            batch = self._batch
+            while self._writing:
+                self._condition.wait()
+            # another thread may have written this batch already,
+            # or failed to, in which case these records are lost too
+            if batch in self._failed_batches:
+                raise self._failed_batches[batch]
+            if self._written_batch >= batch:
+                return
+            self._writing = True
+            pending, self._pending = self._pending, []
+            pending_records, self._pending_records = self._pending_records, []
+            self._batch += 1
+
+        failure = None
+        try:
+            with self._process_lock():
+                self._write(pending, pending_records)
+        except BaseException as error:
+            failure = error
+            raise
+        finally:
+            with self._condition:
+                self._writing = False
+                if failure is None:
+                    self._written_batch = batch
+                else:
+                    self._failed_batches[batch] = failure
+                self._condition.notify_all()
+        if self._log_records >= self.compact_every:
+            self._start_compaction()
+
+    def _write(self, pending: list, pending_records: list) -> None:
+        """
+        writes a batch of packed records to the log, with the writers
+        of this process and of the others kept out
+        """
+        self._catch_up()
+        try:
+            self._log_file.write(b''.join(pending))
+            self._log_file.flush()
+            if self.sync:
+                os.fsync(self._log_file.fileno())
+        except BaseException:
+            # don't leave part of the batch for the next one to be written after
+            self._log_file.close()
+            os.truncate(self.log_path, LOG_HEADER.size + self._log_records * LOG_RECORD.size)
+            self._log_file = open(self.log_path, 'ab')
+            raise
+        self._log_records += len(pending)
+
+        # the aggregates are only updated if they have been loaded,
+        # otherwise they are made up to date when they are needed
+        if self._aggregates is not None:
+            for record in pending_records:
+                self._aggregates.add(record)
+            self._aggregates.save(self.aggregates_path)
+
+    def compact(self) -> None:
+        """
+        moves the games in the log into the columnar file
+        """
+        with self._exclusive():
+            self._compact()
+
+    def wait_for_compaction(self, timeout: float = None) -> None:
+        """
+        waits for a compaction started by append to finish
+        """
+        thread = self._compaction
+        if thread is not None:
+            thread.join(timeout)
+
+    def load(self, start: int = 0) -> pd.DataFrame:
+        """
+        returns the stats of all games (or of the games from start on),
+        with the moves as strings like '3 to 5' as in stats.csv
+        """
+        with self._exclusive():
+            return self._load(start)
+
+    def _load(self, start: int = 0) -> pd.DataFrame:
+        winners, moves, num_turns = self._load_columns(start)
+        stats = pd.DataFrame({'winner': winners.astype(np.int64)})
+        for n, column in enumerate(MOVE_COLUMNS):
+            stats[column] = MOVE_STRINGS[moves[:, n]]
+        stats['num_turns'] = num_turns.astype(np.int64)
+        return stats
+
+    @property
+    def aggregates(self) -> StatsAggregates:
+        """
+        the aggregates of all games, loaded from stats.agg.json and
+        brought up to date with any games recorded since it was saved.
+        This is a copy, taken while no games are being written, so it
+        can be read while other threads record games
+        """
+        with self._exclusive():
+            if self._aggregates is None:
+                aggregates = StatsAggregates()
+                if os.path.exists(self.aggregates_path):
+                    aggregates = StatsAggregates.load(self.aggregates_path)
+                if aggregates.games > self._count():
+                    aggregates = StatsAggregates()
+                if aggregates.games < self._count():
+                    aggregates.merge(StatsAggregates.from_stats(self._load(aggregates.games)))
+                    aggregates.save(self.aggregates_path)
+                self._aggregates = aggregates
+            return self._aggregates.copy()
+
+    def rebuild_aggregates(self) -> StatsAggregates:
+        """
+        counts the aggregates again from all of the records
+        """
+        with self._exclusive():
+            self._aggregates = StatsAggregates.from_stats(self._load())
+            self._aggregates.save(self.aggregates_path)
+            return self._aggregates.copy()
+
+    def __len__(self) -> int:
+        with self._exclusive():
+            return self._count()
+
+    def import_csv(self, path: str = 'stats.csv') -> None:
+        stats = CSVStatsBackend(path).load()
+        self.append(stats[COLUMNS].to_dict('records'))
+
+    def export_csv(self, path: str = 'stats.csv') -> None:
+        stats = self.load()
+        CSVStatsBackend(path).append(stats[COLUMNS].to_dict('records'))
+
+    def close(self) -> None:
+        self.wait_for_compaction()
+        self._log_file.close()
+        self._lock_file.close()
+
+    @contextmanager
+    def _exclusive(self):
+        """
+        keeps writers out (of this process and of the others) while
+        the files are read or compacted, or the aggregates are loaded
+        """
+        with self._condition:
+            while self._writing:
+                self._condition.wait()
+            self._writing = True
+        try:
+            with self._process_lock():
+                self._catch_up()
+                yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+    def _start_compaction(self) -> None:
+        with self._condition:
+            if self._compaction is not None and self._compaction.is_alive():
+                return
+            self._compaction = threading.Thread(target=self._compact_in_background, daemon=True)
+            self._compaction.start()
+
+    def _compact_in_background(self) -> None:
+        try:
+            with self._exclusive():
+                # another thread or process may have compacted already
+                if self._log_records >= self.compact_every:
+                    self._compact()
+        except Exception:
+            # the log keeps the games, the next append tries again
+            logger.exception('compacting %s failed', self.path)
+
+    @contextmanager
+    def _process_lock(self):
+        """
+        keeps the other processes that use the files out
+        """
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _catch_up(self) -> None:
+        """
+        picks up the games that other processes have written, and their
+        compactions, since this process last held the lock
+        """
+        generation = self._read_base_header()[1]
+        log_size = LOG_HEADER.size + self._log_records * LOG_RECORD.size
+        if generation == self._generation and os.path.getsize(self.log_path) == log_size:
+            return
+        self._generation = generation
+        self._log_file.close()
+        self._log_records = self._open_log()
+        if self._aggregates is not None and self._aggregates.games < self._count():
+            self._aggregates.merge(StatsAggregates.from_stats(self._load(self._aggregates.games)))
+
+    def _count(self) -> int:
+        return self._read_base_header()[0] + self._log_records
+
+    def _load_columns(self, start: int = 0) -> tuple:
+        """
+        returns the winner, moves and num_turns columns of the
+        compacted games followed by the games in the log, from the
+        game start on. Only the games from start on are mapped and copied
+        """
+        count, _ = self._read_base_header()
+        winners = [np.zeros(0, dtype=np.uint8)]
+        moves = [np.zeros((0, 6), dtype=np.uint8)]
+        num_turns = [np.zeros(0, dtype=np.uint32)]
+        if count > start:
+            winner_offset, moves_offset, turns_offset = _base_offsets(count)
+            rows = count - start
+            winners.append(np.memmap(self.path, np.uint8, 'r', winner_offset + start, (rows,)))
+            moves.append(np.memmap(self.path, np.uint8, 'r', moves_offset + start * 6, (rows, 6)))
+            num_turns.append(np.memmap(self.path, '<u4', 'r', turns_offset + start * 4, (rows,)))
+        log_start = max(0, start - count)
+        if self._log_records > log_start:
+            log = np.memmap(self.log_path, LOG_DTYPE, 'r', LOG_HEADER.size + log_start * LOG_DTYPE.itemsize,
+                            (self._log_records - log_start,))
+            winners.append(log['winner'])
+            moves.append(log['moves'])
+            num_turns.append(log['num_turns'])
+        return np.concatenate(winners), np.concatenate(moves), np.concatenate(num_turns)
+
+    def _compact(self) -> None:
+        """
+        writes a new columnar file with the games in the log, and then
+        starts a new log. The log has the generation of the columnar file
+        it belongs to, so if this is interrupted after the new columnar
+        file is in place, the old log is known to be included already
+        """
+        winners, moves, num_turns = self._load_columns()
+        count = len(winners)
+        winner_offset, moves_offset, turns_offset = _base_offsets(count)
+        generation = self._generation + 1
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(BASE_HEADER.pack(BASE_MAGIC, VERSION, count, generation).ljust(BASE_HEADER_SIZE, b'\0'))
+            f.write(winners.tobytes())
+            f.write(moves.tobytes().ljust(turns_offset - moves_offset, b'\0'))
+            f.write(num_turns.astype('<u4').tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+        self._generation = generation
+        self._log_file.close()
+        self._log_records = self._open_log()
+
+    def _read_base_header(self) -> tuple:
+        """
+        returns (number of games, generation) of the columnar file
+        """
+        if not os.path.exists(self.path):
+            return 0, 0
+        with open(self.path, 'rb') as f:
+            magic, version, count, generation = BASE_HEADER.unpack(f.read(BASE_HEADER.size))
+        if magic != BASE_MAGIC or version != VERSION:
+            raise ValueError(f'{self.path} is not a stats file')
+        return count, generation
+
+    def _open_log(self) -> int:
+        """
+        opens the log for appending, starting a new one if it belongs to
+        an older generation, and returns the number of records in it
+        """
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'rb') as f:
+                magic, version, generation = LOG_HEADER.unpack(f.read(LOG_HEADER.size))
+            if magic != LOG_MAGIC or version != VERSION:
+                raise ValueError(f'{self.log_path} is not a stats log')
+        else:
+            generation = None
+
+        if generation != self._generation:
+            with open(self.log_path, 'wb') as f:
+                f.write(LOG_HEADER.pack(LOG_MAGIC, VERSION, self._generation))
+            log_records = 0
+        else:
+            # drop a record that was only partly written
+            size = os.path.getsize(self.log_path) - LOG_HEADER.size
+            log_records = size // LOG_RECORD.size
+            if size % LOG_RECORD.size:
+                os.truncate(self.log_path, LOG_HEADER.size + log_records * LOG_RECORD.size)
+
+        self._log_file = open(self.log_path, 'ab')
+        return log_records
+
+def _base_offsets(count: int) -> tuple:
+    """
+    returns the offsets of the winner, moves and num_turns columns
+    in a columnar file with count games
+    """
+    winner_offset = BASE_HEADER_SIZE
+    moves_offset = winner_offset + count
+    turns_offset = moves_offset + 6 * count
+    turns_offset += -turns_offset % 4
+    return winner_offset, moves_offset, turns_offset
+
+_default_backends = {}
+_default_backends_lock = threading.Lock()
+
+def default_backend(path: str = 'stats.bin') -> BinaryStatsBackend:
+    """
+    returns the backend shared by everything in the process that
+    uses path, so that their writes can be grouped. An existing
+    stats.csv is imported the first time the binary stats are created
+    """
+    with _default_backends_lock:
+        if path not in _default_backends:
+            file_is_new = not os.path.exists(path) and not os.path.exists(os.path.splitext(path)[0] + '.log')
+            backend = BinaryStatsBackend(path)
+            if file_is_new and os.path.exists('stats.csv'):
+                backend.import_csv('stats.csv')
+            _default_backends[path] = backend
+        return _default_backends[path]
@@ -0,0 +1,111 @@
+"""
+The 8 symmetries of the board (rotations and reflections), used to map
+every position to one canonical representative.
+
+Cells are numbered 0-8, row by row:
+0 1 2
+3 4 5
+6 7 8
+"""
+from logic import Game, ZOBRIST_PIECES, ZOBRIST_SELECTED, ZOBRIST_PREVIOUS, ZOBRIST_PLAYER
+
+def _transform_cell(transform: int, cell: int) -> int:
+    row, col = divmod(cell, 3)
+    # reflect first, then rotate clockwise a quarter turn at a time
+    if transform >= 4:
+        col = 2 - col
+    for _ in range(transform % 4):
+        row, col = col, 2 - row
+    return row * 3 + col
+
+# TRANSFORMS[t][cell] is where transform t moves a cell to
+# 0-3: rotations by 0, 90, 180 and 270 degrees
+# 4-7: the same rotations after a left-right reflection
+TRANSFORMS = [tuple(_transform_cell(transform, cell) for cell in range(9)) for transform in range(8)]
+
+# INVERSES[t] is the transform that undoes transform t
+INVERSES = [next(inverse for inverse in range(8)
+                 if all(TRANSFORMS[inverse][TRANSFORMS[transform][cell]] == cell for cell in range(9)))
+            for transform in range(8)]
+
+def canonicalize(game: Game) -> tuple:
+    """
+    returns (key, transform) where key is the same integer for all
+    8 symmetric versions of the position, and transform is the one
+    that maps this position onto the canonical one.
+    Use transform_move and inverse_transform_move to map moves
+    between the two.
+    """
+    stacks = game._stacks
+    selected = game._selected
+    previous = None if selected is None else game._previous[selected]
+
+    best_key = None
+    best_transform = 0
+    for transform, cells in enumerate(TRANSFORMS):
+        packed = 0
+        for cell, stack in enumerate(stacks):
+            if stack:
+                packed |= stack << (12 * cells[cell])
+        packed = packed * 10 + (9 if previous is None else cells[previous])
+        if best_key is None or packed < best_key:
+            best_key, best_transform = packed, transform
+
+    selected_value = 12 if selected is None else selected
+    key = (best_key * 13 + selected_value) * 2 + game.current_player_idx
+    return key, best_transform
+
+def canonical_hash(game: Game, transform: int = None) -> int:
+    """
+    returns the zobrist hash of the canonical version of the position,
+    the same for all 8 symmetric versions. transform is the one that
+    canonicalize returns, if it is known already
+    """
+    if transform is None:
+        _, transform = canonicalize(game)
+    cells = TRANSFORMS[transform]
+    value = 0
+    for code, mask in enumerate(game._masks):
+        if mask:
+            value ^= ZOBRIST_PIECES[code][cells[mask.bit_length() - 1]]
+    if game._selected is not None:
+        value ^= ZOBRIST_SELECTED[game._selected]
+        previous = game._previous[game._selected]
+        if previous is not None:
+            value ^= ZOBRIST_PREVIOUS[cells[previous]]
+    if game.current_player_idx:
+        value ^= ZOBRIST_PLAYER
+    return value
+
+def transform_move(move: tuple, transform: int) -> tuple:
+    """
+    maps a (gobbler_size, board_position) move
+    with a transform
+    """
+    gobbler_size, board_position = move
+    return gobbler_size, TRANSFORMS[transform][board_position - 1] + 1
+
+def inverse_transform_move(move: tuple, transform: int) -> tuple:
+    """
+    maps a move on the canonical position back
+    to the original position
+    """
+    return transform_move(move, INVERSES[transform])
+
+def canonicalize_move(move):
+    """
+    maps a move on its own (e.g. an opening move) to the symmetric move
+    with the lowest board position, so that 1, 3, 7 and 9 all become 1,
+    and 2, 4, 6 and 8 all become 2.
+    move can be a (gobbler_size, board_position) pair or a string
+    like '3 to 9', as recorded by GameStats, and the same type is returned
+    """
+    if isinstance(move, str):
+        gobbler_size, board_position = move.split(' to ')
+        board_position = _canonical_position(int(board_position))
+        return f'{gobbler_size} to {board_position}'
+    gobbler_size, board_position = move
+    return gobbler_size, _canonical_position(int(board_position))
+
+def _canonical_position(board_position: int) -> int:
+    return min(cells[board_position - 1] for cells in TRANSFORMS) + 1
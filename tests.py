@@ -1,5 +1,36 @@
+import asyncio
+import copy
+import json
+import os
+import shutil
+import tempfile
+import threading
 import unittest
-from logic import Game
+from unittest import mock
+import numpy as np
+try:
+    import cv2
+except ImportError:
+    # the gui tests are skipped without OpenCV
+    cv2 = None
+from analysis import AnalysisCache, analyze
+from logic import Game, GameStats, encode_move
+from batch import BatchGame
+from benchmarks import BENCHMARKS, compare, run_benchmarks
+from book import OpeningBook, build_book
+from cli import SearchBot
+from events import EventBroker
+from charts import ChartRenderer, CHARTS
+from game_records import GameRecord, GameRecordWriter, read_games
+from mcts import MCTS
+import metrics
+from simulate import SIMULATION_TABLE_MB, SIMULATION_TIME_BUDGET, make_bot, simulate, simulation_options
+from stats_store import BinaryStatsBackend, StatsAggregates
+from search import Search, WIN_SCORE
+from sessions import SessionStore
+from symmetry import canonicalize, canonical_hash, canonicalize_move, transform_move, inverse_transform_move
+from solver import Solver, Tablebase, position_index, successors, DRAW
+from transposition import TranspositionTable, EXACT, LOWER_BOUND
 
 class TestLogic(unittest.TestCase):
 
@@ -158,5 +189,1325 @@ class TestLogic(unittest.TestCase):
 
         self.assertEqual((before, after), (True, False))
 
+    def test_gobbler_board_position(self):
+        game = Game()
+
+        # player 0 plays
+        _ = game.select_gobbler(2)
+        _, _ = game.place_selected_gobbler(5)
+        gobbler = game.board[4][-1]
+        before = (gobbler.player, gobbler.size, gobbler.board_position)
+
+        # player 1 plays
+        _ = game.select_gobbler(1)
+        _, _ = game.place_selected_gobbler(1)
+
+        # player 0 picks up the gobbler again
+        _ = game.select_gobbler(2)
+        after = (gobbler.board_position, gobbler.board_position_previous, game.board[4])
+
+        self.assertEqual((before, after), ((0, 2, 4), (None, 4, [])))
+
+    def test_legal_moves_start(self):
+        game = Game()
+        moves = list(game.legal_moves())
+
+        # every gobbler can go to every cell at the start
+        self.assertEqual(len(moves), 6 * 9)
+
+    def test_legal_moves_are_accepted(self):
+        game = Game()
+
+        # player 0 plays
+        _ = game.select_gobbler(4)
+        _, _ = game.place_selected_gobbler(1)
+
+        # player 1 can't cover the big gobbler with a smaller one
+        moves = list(game.legal_moves())
+        self.assertNotIn((3, 1), moves)
+        self.assertIn((5, 1), moves)
+
+        # each move is played on its own copy of the position
+        for gobbler_size, board_position in moves:
+            copy = game.copy()
+            self.assertEqual(copy.select_gobbler(gobbler_size), True)
+            self.assertEqual(list(copy.legal_moves()),
+                             [m for m in moves if m[0] == gobbler_size])
+            success, _ = copy.place_selected_gobbler(board_position)
+            self.assertEqual(success, True)
+            self.assertEqual(copy.current_player_idx, 0)
+
+    def test_zobrist_hash_transposition(self):
+        """
+        The same position reached in a different order
+        has the same hash.
+        """
+        game_a = Game()
+        game_b = Game()
+        start_hash = game_a.zobrist_hash
+
+        for gobbler_size, board_position in [[1,1], [2,2], [3,3], [4,4]]:
+            _ = game_a.select_gobbler(gobbler_size)
+            _, _ = game_a.place_selected_gobbler(board_position)
+        for gobbler_size, board_position in [[3,3], [4,4], [1,1], [2,2]]:
+            _ = game_b.select_gobbler(gobbler_size)
+            _, _ = game_b.place_selected_gobbler(board_position)
+
+        same_hash = game_a.zobrist_hash == game_b.zobrist_hash
+
+        # picking a gobbler up changes the hash
+        _ = game_a.select_gobbler(3)
+        picked_up_hash = game_a.zobrist_hash
+
+        self.assertEqual(same_hash, True)
+        self.assertNotEqual(picked_up_hash, game_b.zobrist_hash)
+        self.assertNotEqual(game_b.zobrist_hash, start_hash)
+
+    def test_apply_and_undo_move(self):
+        game = Game()
+
+        plays = [
+            # selected_gobbler_size, board_position
+            [1,1], # player 0
+            [2,1], # player 1
+            [2,2],
+            [3,4],
+            [5,3],
+            [6,8],
+            [4,6],
+        ]
+        for play in plays:
+            _ = game.select_gobbler(play[0])
+            _, _ = game.place_selected_gobbler(play[1])
+        before = (game.represent_board(), game.zobrist_hash, game.current_player_idx,
+                  [g.board_position_previous for g in game.gobblers])
+
+        # player 1 moves gobbler 6 from position 8 to 7 and wins
+        record = game.apply_move((6, 7))
+        self.assertEqual(game.winner, 1)
+
+        game.undo_move(record)
+        after = (game.represent_board(), game.zobrist_hash, game.current_player_idx,
+                 [g.board_position_previous for g in game.gobblers])
+
+        self.assertEqual(game.winner, None)
+        self.assertEqual(before, after)
+
+    def test_apply_and_undo_selected_move(self):
+        # e.g. the play page leaves a gobbler selected after an invalid place
+        game = Game()
+        for play in [(3, 5), (2, 1)]:
+            game.apply_move(play)
+        game.select_gobbler(3)
+        before = (game.represent_board(), game.zobrist_hash, game.current_player_idx,
+                  [g.board_position_previous for g in game.gobblers], game.selected_gobbler.size)
+        placed = game.copy()
+        placed.place_selected_gobbler(9)
+
+        record = game.apply_move((3, 9))
+        self.assertEqual(game.selected_gobbler, None)
+        self.assertEqual(game.zobrist_hash, placed.zobrist_hash)
+        self.assertEqual(game.represent_board(), placed.represent_board())
+        self.assertEqual(game._previous, placed._previous)
+
+        game.undo_move(record)
+        after = (game.represent_board(), game.zobrist_hash, game.current_player_idx,
+                 [g.board_position_previous for g in game.gobblers], game.selected_gobbler.size)
+        self.assertEqual(before, after)
+
+class TestTranspositionTable(unittest.TestCase):
+
+    def test_store_and_probe(self):
+        table = TranspositionTable(size_mb=0.01)
+        table.store(12345, 3, -40, LOWER_BOUND, 7)
+
+        self.assertEqual(table.probe(12345), (3, -40, LOWER_BOUND, 7))
+        self.assertEqual(table.probe(54321), None)
+        self.assertEqual((table.hits, table.misses), (1, 1))
+
+    def test_replacement(self):
+        table = TranspositionTable(size_mb=0.01)
+        key = 5
+        colliding_key = key + table.size
+
+        # a shallower result doesn't replace a deeper one
+        table.store(key, 4, 1, EXACT)
+        table.store(colliding_key, 2, 2, EXACT)
+        self.assertEqual(table.probe(key), (4, 1, EXACT, None))
+
+        # unless the deeper one is from an older search
+        table.new_search()
+        table.store(colliding_key, 2, 2, EXACT)
+        self.assertEqual(table.probe(key), None)
+        self.assertEqual(table.probe(colliding_key), (2, 2, EXACT, None))
+
+class TestSolver(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_successors_match_legal_moves(self):
+        game = Game()
+        _ = game.select_gobbler(4)
+        _, _ = game.place_selected_gobbler(5)
+
+        moves = [move for move, _, _ in successors(position_index(game), 6)]
+
+        self.assertEqual(sorted(moves), sorted(game.legal_moves()))
+
+    def test_resume(self):
+        """
+        A solve that is stopped and resumed many times gives
+        the same tablebase as one that runs in one go.
+        """
+        path_a = os.path.join(self.tmp_dir.name, 'a.tb')
+        solver = Solver(path_a, number_of_gobblers=2)
+        self.assertEqual(solver.run(), True)
+        solver.close()
+
+        path_b = os.path.join(self.tmp_dir.name, 'b.tb')
+        done = False
+        runs = 0
+        while not done:
+            solver = Solver(path_b, number_of_gobblers=2)
+            done = solver.run(max_seconds=0)
+            solver.close()
+            runs += 1
+
+        with open(path_a, 'rb') as f_a, open(path_b, 'rb') as f_b:
+            self.assertEqual(f_a.read(), f_b.read())
+        self.assertGreater(runs, 1)
+
+        # with two gobblers each, nobody can win
+        tablebase = Tablebase(path_a)
+        self.assertEqual(tablebase.probe(Game(2)), (DRAW, 0))
+        tablebase.close()
+
+class TestSearch(unittest.TestCase):
+
+    def test_finds_winning_move(self):
+        game = Game()
+
+        plays = [
+            # selected_gobbler_size, board_position
+            [1,1], # player 0
+            [1,4],
+            [2,2],
+            [2,5],
+        ]
+        for play in plays:
+            _ = game.select_gobbler(play[0])
+            _, _ = game.place_selected_gobbler(play[1])
+
+        result = Search().search(game, time_budget=1.0, max_depth=3)
+
+        self.assertEqual(result.move[1], 3)
+        self.assertEqual(result.score, WIN_SCORE - 1)
+
+    def test_time_budget(self):
+        game = Game()
+
+        result = Search().search(game, time_budget=0.2)
+
+        self.assertLess(result.seconds, 0.5)
+        self.assertIn(result.move, list(game.legal_moves()))
+        self.assertGreater(result.nodes, 0)
+
+class TestMCTS(unittest.TestCase):
+
+    def test_reproducible(self):
+        game = Game()
+        mcts = MCTS(workers=2, playouts=200)
+
+        result_a = mcts.search(game, seed=1)
+        result_b = mcts.search(game, seed=1)
+        mcts.close()
+
+        self.assertEqual(result_a.visits, result_b.visits)
+        self.assertEqual(sum(result_a.visits.values()), 200)
+        self.assertIn(result_a.move, list(game.legal_moves()))
+
+class TestSymmetry(unittest.TestCase):
+
+    def test_symmetric_positions(self):
+        """
+        The same opening played in each of the four corners
+        gives the same canonical position.
+        """
+        keys = set()
+        hashes = set()
+        for corner, edge in [[1,2], [3,6], [9,8], [7,4]]:
+            game = Game()
+            _ = game.select_gobbler(3)
+            _, _ = game.place_selected_gobbler(corner)
+            _ = game.select_gobbler(2)
+            _, _ = game.place_selected_gobbler(edge)
+            key, _ = canonicalize(game)
+            keys.add(key)
+            hashes.add(canonical_hash(game))
+
+        self.assertEqual((len(keys), len(hashes)), (1, 1))
+
+    def test_map_moves_back(self):
+        game = Game()
+        _ = game.select_gobbler(3)
+        _, _ = game.place_selected_gobbler(9)
+
+        _, transform = canonicalize(game)
+        move = (4, 1)
+        canonical_move = transform_move(move, transform)
+
+        self.assertEqual(inverse_transform_move(canonical_move, transform), move)
+
+    def test_canonicalize_move(self):
+        self.assertEqual(canonicalize_move('3 to 9'), '3 to 1')
+        self.assertEqual(canonicalize_move('3 to 6'), '3 to 2')
+        self.assertEqual(canonicalize_move('3 to 5'), '3 to 5')
+        self.assertEqual(canonicalize_move((6, 7)), (6, 1))
+
+class TestSimulate(unittest.TestCase):
+
+    def test_simulate_reproducible(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path_a = os.path.join(tmp_dir, 'a.csv')
+            path_b = os.path.join(tmp_dir, 'b.csv')
+
+            result = simulate(30, ['random', 'random'], seed=4, batch_size=7, path=path_a)
+            _ = simulate(30, ['random', 'random'], workers=2, seed=4, batch_size=7, path=path_b)
+
+            with open(path_a) as f_a, open(path_b) as f_b:
+                lines_a = f_a.readlines()
+                lines_b = f_b.readlines()
+
+        # the batches can finish in any order with more than one worker
+        self.assertEqual(lines_a[0], lines_b[0])
+        self.assertEqual(sorted(lines_a), sorted(lines_b))
+        self.assertEqual(len(lines_a) - 1 + result.draws, 30)
+        self.assertEqual(sum(result.wins) + result.draws, 30)
+
+    def test_search_bots_share_a_small_table(self):
+        options = simulation_options({'search': {'time_budget': 0.2}})
+        self.assertEqual(options['search']['time_budget'], 0.2)
+        defaults = simulation_options()
+        self.assertEqual(defaults['search']['time_budget'], SIMULATION_TIME_BUDGET)
+        self.assertIs(options['search']['table'], defaults['search']['table'])
+
+        bots = [make_bot('search', n, Game(), n, defaults) for n in range(2)]
+        self.assertIs(bots[0].search.table, bots[1].search.table)
+        self.assertLessEqual(bots[0].search.table.size * bots[0].search.table.entry_size,
+                             SIMULATION_TABLE_MB * 1024 * 1024)
+
+    def test_bots_share_the_book(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'book.bin')
+            build_book(path, plies=1, depth=1)
+            book = OpeningBook(path)
+            with mock.patch('simulate.open_book', return_value=book) as opened, \
+                    mock.patch('simulate._book', None), mock.patch('simulate._book_opened', False):
+                bots = [make_bot(bot_type, 0, Game(), 0) for bot_type in ('search', 'mcts', 'search')]
+                self.assertEqual(opened.call_count, 1)
+            self.assertTrue(all(bot.book is book for bot in bots))
+            # the book is played without searching
+            bots[0].select_gobbler()
+            self.assertEqual(bots[0].move, book.best_move(Game()))
+            self.assertIsNone(bots[0].last_result)
+
+class TestBatchGame(unittest.TestCase):
+
+    def test_matches_game(self):
+        """
+        The same moves played in a Game and in a batch
+        give the same legal moves and the same winner.
+        """
+        plays = [
+            # selected_gobbler_size, board_position
+            [1,1], # player 0
+            [2,1], # player 1
+            [2,2],
+            [3,4],
+            [5,3],
+            [6,8],
+            [4,6],
+            [6,7],
+        ]
+        game = Game()
+        batch = BatchGame(3)
+
+        for play in plays:
+            legal_moves = sorted(encode_move(move) for move in game.legal_moves())
+            mask = batch.legal_move_mask()
+            self.assertEqual(list(np.nonzero(mask[1])[0]), legal_moves)
+
+            _ = game.select_gobbler(play[0])
+            _, winner = game.place_selected_gobbler(play[1])
+            # only the game in the middle of the batch moves
+            batch.apply_moves([-1, encode_move(play), -1])
+
+        self.assertEqual(list(batch.winner), [-1, winner, -1])
+        self.assertEqual(list(batch.stacks[1]), game._stacks)
+        self.assertEqual(batch.legal_move_mask()[1].any(), False)
+
+    def test_random_playout(self):
+        batch = BatchGame(50)
+
+        winners = batch.random_playout(np.random.default_rng(0), max_plies=300)
+
+        self.assertEqual(((winners == 0) | (winners == 1)).all(), True)
+
+class TestStatsStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'stats.bin')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _record(self, num_turns):
+        return {
+            'winner': num_turns % 2,
+            'first_move_0': '1 to 1',
+            'first_move_1': '2 to 3',
+            'last_move_0': '6 to 9',
+            'last_move_1': '3 to 5',
+            'first_move_winner': '1 to 1' if num_turns % 2 == 0 else '2 to 3',
+            'last_move_winner': '6 to 9' if num_turns % 2 == 0 else '3 to 5',
+            'num_turns': num_turns,
+        }
+
+    def test_append_from_threads(self):
+        backend = BinaryStatsBackend(self.path, compact_every=25)
+
+        def finish_games(first):
+            for num_turns in range(first, first + 20):
+                backend.append([self._record(num_turns)])
+
+        threads = [threading.Thread(target=finish_games, args=(n * 20,)) for n in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = backend.load()
+        backend.close()
+
+        self.assertEqual(sorted(stats['num_turns']), list(range(100)))
+        row = stats[stats['num_turns'] == 7].iloc[0]
+        self.assertEqual(row.to_dict(), self._record(7))
+
+    def test_interrupted_compaction(self):
+        """
+        If the log is still there after it has been compacted,
+        its games are not counted twice.
+        """
+        backend = BinaryStatsBackend(self.path)
+        backend.append([self._record(n) for n in range(3)])
+        log_path = backend.log_path
+        shutil.copy(log_path, log_path + '.old')
+        backend.compact()
+        backend.close()
+        shutil.copy(log_path + '.old', log_path)
+
+        backend = BinaryStatsBackend(self.path)
+        self.assertEqual(len(backend.load()), 3)
+        backend.close()
+
+    def test_writers_in_other_processes(self):
+        # as if the two backends were in different processes
+        a = BinaryStatsBackend(self.path, compact_every=5)
+        self.assertEqual(a.aggregates.games, 0)
+        b = BinaryStatsBackend(self.path)
+        b.append([self._record(n) for n in range(3)])
+        a.append([self._record(n) for n in range(3, 8)])
+        b.append([self._record(8)])
+        self.assertEqual(len(b), 9)
+        self.assertEqual(a.aggregates.games, 9)
+        a.close()
+        b.close()
+
+        backend = BinaryStatsBackend(self.path)
+        self.assertEqual(sorted(backend.load()['num_turns']), list(range(9)))
+        backend.close()
+
+    def test_compaction_in_the_background(self):
+        backend = BinaryStatsBackend(self.path, compact_every=5)
+        compacting = threading.Event()
+        release = threading.Event()
+        compact = backend._compact
+        def held_compact():
+            compacting.set()
+            release.wait(timeout=30)
+            compact()
+        backend._compact = held_compact
+
+        # the append that fills the log returns while the log is compacted
+        backend.append([self._record(n) for n in range(5)])
+        self.assertTrue(compacting.wait(timeout=30))
+        self.assertEqual(backend._log_records, 5)
+        release.set()
+        backend.wait_for_compaction()
+        self.assertEqual((len(backend), backend._log_records), (5, 0))
+        self.assertEqual(list(backend.load()['num_turns']), list(range(5)))
+        backend.close()
+
+    def test_load_from_start(self):
+        # 6 compacted games and 3 in the log
+        backend = BinaryStatsBackend(self.path, compact_every=6)
+        backend.append([self._record(n) for n in range(6)])
+        backend.wait_for_compaction()
+        backend.append([self._record(n) for n in range(6, 9)])
+        self.assertEqual((len(backend), backend._log_records), (9, 3))
+        for start in (0, 4, 6, 8, 9, 12):
+            stats = backend.load(start)
+            self.assertEqual(list(stats['num_turns']), list(range(start, 9)))
+            self.assertEqual(stats.to_dict('records'), backend.load().iloc[start:].to_dict('records'))
+        backend.close()
+
+    def test_torn_record(self):
+        backend = BinaryStatsBackend(self.path)
+        backend.append([self._record(n) for n in range(3)])
+        backend.close()
+        with open(backend.log_path, 'ab') as f:
+            f.write(b'\x01\x02')
+
+        backend = BinaryStatsBackend(self.path)
+        backend.append([self._record(3)])
+
+        self.assertEqual(list(backend.load()['num_turns']), [0, 1, 2, 3])
+        backend.close()
+
+    def test_failed_writes_are_reported_to_every_writer(self):
+        backend = BinaryStatsBackend(self.path)
+        log_file = backend._log_file
+        writing = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        class FailingLog:
+            # the first batch is held and written, the second fails half way
+            def write(self, data):
+                calls.append(len(data))
+                if len(calls) == 1:
+                    writing.set()
+                    release.wait(timeout=30)
+                    return log_file.write(data)
+                log_file.write(data[:3])
+                raise OSError('disk full')
+
+            def __getattr__(self, name):
+                return getattr(log_file, name)
+
+        backend._log_file = FailingLog()
+        errors = []
+        def append(num_turns):
+            try:
+                backend.append([self._record(num_turns)])
+            except OSError as error:
+                errors.append(error)
+
+        first = threading.Thread(target=append, args=(0,))
+        first.start()
+        self.assertTrue(writing.wait(timeout=30))
+        # these two join the next batch while the first is written
+        others = [threading.Thread(target=append, args=(n,)) for n in (1, 2)]
+        for thread in others:
+            thread.start()
+        while len(backend._pending) < 2:
+            threading.Event().wait(0.01)
+        release.set()
+        for thread in [first] + others:
+            thread.join()
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(errors), 2)
+        # the torn batch is gone, and the next game is written after the first
+        backend.append([self._record(3)])
+        self.assertEqual(list(backend.load()['num_turns']), [0, 3])
+        backend.close()
+
+    def test_aggregates_match_stats(self):
+        backend = BinaryStatsBackend(self.path, compact_every=4)
+        for num_turns in range(10):
+            backend.append([self._record(num_turns % 3)])
+        aggregates = StatsAggregates.from_stats(backend.load())
+        self.assertEqual(backend.aggregates.__dict__, aggregates.__dict__)
+        self.assertEqual(aggregates.wins, [7, 3])
+        self.assertEqual(aggregates.turns, {0: 4, 1: 3, 2: 3})
+        self.assertEqual(aggregates.top_openers(1), [('1 to 1', 7)])
+
+        # the aggregates that were handed out don't change under their reader
+        aggregates = backend.aggregates
+        backend.append([self._record(5)])
+        self.assertEqual(aggregates.games, 10)
+        self.assertEqual(backend.aggregates.turns[5], 1)
+        self.assertNotIn(5, aggregates.turns)
+        backend.close()
+
+    def test_symmetric_openers_are_counted_together(self):
+        aggregates = StatsAggregates()
+        for opener in ['3 to 1', '3 to 3', '3 to 9', '2 to 4', '2 to 5']:
+            aggregates.add({'winner': 0, 'first_move_winner': opener, 'num_turns': 3})
+        self.assertEqual(aggregates.top_openers(3), [('3 to 1', 3), ('2 to 2', 1), ('2 to 5', 1)])
+
+        # as are the openers of aggregates saved before they were
+        path = os.path.join(self.tmp_dir.name, 'old.agg.json')
+        with open(path, 'w') as f:
+            json.dump({'games': 2, 'wins': [2, 0], 'openers': {'1 to 7': 1, '1 to 3': 1}, 'turns': {'3': 2}}, f)
+        self.assertEqual(StatsAggregates.load(path).openers, {'1 to 1': 2})
+
+    def test_aggregates_catch_up(self):
+        """
+        Games appended while the saved aggregates were out of date
+        are counted when the backend is opened again.
+        """
+        backend = BinaryStatsBackend(self.path)
+        backend.append([self._record(n) for n in range(3)])
+        backend.aggregates
+        backend.close()
+        aggregates_json = open(backend.aggregates_path).read()
+
+        backend = BinaryStatsBackend(self.path)
+        backend.append([self._record(n) for n in range(3, 5)])
+        backend.close()
+        with open(backend.aggregates_path, 'w') as f:
+            f.write(aggregates_json)
+
+        backend = BinaryStatsBackend(self.path)
+        self.assertEqual(backend.aggregates.games, 5)
+        self.assertEqual(backend.aggregates.turns, {n: 1 for n in range(5)})
+        backend.close()
+
+class TestCharts(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.backend = BinaryStatsBackend(os.path.join(self.tmp_dir.name, 'stats.bin'))
+        self.charts = ChartRenderer(self.backend, directory=self.tmp_dir.name)
+        self.records = GameRecordWriter(os.path.join(self.tmp_dir.name, 'games.bin'))
+
+    def tearDown(self):
+        self.charts.close()
+        self.backend.close()
+        self.records.close()
+        self.tmp_dir.cleanup()
+
+    def _save_game(self, winner):
+        stats = GameStats(self.backend, self.charts, self.records)
+        for move in [(3, 5), (1, 1), (4, 9)]:
+            stats.record_move(*move)
+        stats.save(winner, background=True)
+
+    def test_renders_are_coalesced(self):
+        # hold the first render until all of the other games are saved
+        started = threading.Event()
+        release = threading.Event()
+        draw_winners = self.charts._draw_winners
+        def blocked_draw_winners(aggregates):
+            started.set()
+            release.wait(timeout=30)
+            draw_winners(aggregates)
+        self.charts._draw_winners = blocked_draw_winners
+
+        self._save_game(0)
+        self.assertTrue(started.wait(timeout=30))
+        for n in range(1, 20):
+            self._save_game(n % 2)
+        release.set()
+        self.assertTrue(self.charts.wait(timeout=30))
+
+        # the first render, and one more for the games saved during it
+        self.assertEqual(self.charts.version, 20)
+        self.assertLess(self.charts.renders, 20)
+        self.assertEqual(self.charts.renders, 2)
+        for name in CHARTS:
+            self.assertTrue(os.path.exists(os.path.join(self.tmp_dir.name, f'{name}.png')))
+            self.assertFalse(os.path.exists(os.path.join(self.tmp_dir.name, f'{name}.png.tmp')))
+
+    def test_render_errors_dont_stop_the_thread(self):
+        draw_winners = self.charts._draw_winners
+        self.charts._draw_winners = lambda aggregates: 1 / 0
+        with self.assertLogs('charts', 'ERROR'):
+            self._save_game(0)
+            self.assertTrue(self.charts.wait(timeout=30))
+        self.charts._draw_winners = draw_winners
+        self._save_game(1)
+        self.assertTrue(self.charts.wait(timeout=30))
+        self.assertEqual(self.charts.version, 2)
+
+    def test_urls_are_versioned(self):
+        self._save_game(0)
+        self.charts.wait()
+        urls = self.charts.urls()
+        self._save_game(1)
+        self.charts.wait()
+        self.assertEqual(urls['winners'], '/static/winners.png?v=1')
+        self.assertEqual(self.charts.urls()['winners'], '/static/winners.png?v=2')
+
+class TestGameRecords(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'games.bin')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_write_and_read(self):
+        records = [
+            GameRecord(bytes([encode_move((1, 1)), encode_move((1, 4))]), None, ['random', 'mcts'], 2 ** 64 - 1),
+            GameRecord(b'', 1),
+            GameRecord(bytes(range(54)), 0, ['search', 'human'], 0),
+        ]
+        writer = GameRecordWriter(self.path)
+        writer.write(records)
+        writer.close()
+
+        # a tiny chunk size splits the games across chunks
+        games = list(read_games(self.path, chunk_size=5))
+        self.assertEqual(len(games), 3)
+        for game, record in zip(games, records):
+            self.assertEqual(game.__dict__, record.__dict__)
+        self.assertEqual(games[0].moves, [(1, 1), (1, 4)])
+        self.assertEqual(os.path.getsize(self.path), 8 + 3 * 14 + 2 + 54)
+
+    def test_torn_game(self):
+        writer = GameRecordWriter(self.path)
+        writer.write([GameRecord(b'\x00\x01', 0)])
+        writer.close()
+        with open(self.path, 'ab') as f:
+            f.write(GameRecord(b'\x02\x03\x04', 1).pack()[:-1])
+
+        self.assertEqual(len(list(read_games(self.path))), 1)
+        writer = GameRecordWriter(self.path)
+        writer.write([GameRecord(b'\x05', 1)])
+        writer.close()
+        self.assertEqual([game.encoded_moves for game in read_games(self.path)], [b'\x00\x01', b'\x05'])
+
+    def test_replay_simulated_games(self):
+        simulate(10, ['random', 'random'], seed=3, path=os.path.join(self.tmp_dir.name, 'stats.bin'))
+        games = list(read_games(self.path))
+        self.assertEqual(len(games), 10)
+        for record in games:
+            self.assertEqual(record.players, ['random', 'random'])
+            self.assertIsNotNone(record.seed)
+            for _, game in record.replay():
+                pass
+            self.assertEqual(game.winner, record.winner)
+
+class TestSessions(unittest.TestCase):
+
+    def test_least_recently_used_is_evicted(self):
+        store = SessionStore(max_sessions=2)
+        first = store.create()
+        second = store.create()
+        store.get(first.session_id)
+        store.create()
+        self.assertIn(first.session_id, store)
+        self.assertNotIn(second.session_id, store)
+        self.assertEqual(store.evictions, 1)
+        self.assertIs(store.get_game(first.game_id), first)
+        self.assertIsNone(store.get_game(second.game_id))
+        self.assertIsNone(store.get_game(first.session_id))
+
+    def test_idle_sessions_expire(self):
+        store = SessionStore(idle_timeout=60)
+        session = store.create()
+        session.last_used -= 61
+        self.assertIsNone(store.get(session.session_id))
+        self.assertEqual(len(store), 0)
+
+    def test_memory_accounting(self):
+        store = SessionStore()
+        session = store.create()
+        start_bytes = store.memory_bytes
+        with store.use(session.session_id) as used:
+            for move in [(1, 1), (1, 4), (2, 2)]:
+                used.game.apply_move(move)
+                used.stats.record_move(*move)
+        self.assertGreater(store.memory_bytes, start_bytes)
+        self.assertEqual(store.memory_bytes, session.memory_bytes())
+
+        # a store too small for two sessions keeps only the newest
+        store.max_bytes = store.memory_bytes + 1
+        newest = store.create()
+        self.assertEqual(len(store), 1)
+        self.assertIn(newest.session_id, store)
+        store.remove(newest.session_id)
+        self.assertEqual(store.memory_bytes, 0)
+
+    def test_clients_have_their_own_games(self):
+        from app import app
+        clients = [app.test_client(), app.test_client()]
+        for client in clients:
+            client.get('/')
+            client.post('/', data={'name': ['anna', 'bert'], 'button': 'Start Game'})
+        clients[0].post('/play', data={'gobbler_size': 6, 'board_position': 5, 'button': 'Play'})
+        page = clients[1].post('/play', data={'gobbler_size': 6, 'board_position': 5, 'button': 'Play'})
+        self.assertNotIn(b'Invalid selection!', page.data)
+
+    def test_invalid_selections_are_published_if_they_change_the_game(self):
+        from app import app, sessions
+        client = app.test_client()
+        client.get('/')
+        client.post('/', data={'name': ['anna', 'bert'], 'button': 'Start Game'})
+        session = sessions.get(client.get_cookie('game_session').value)
+        subscription = sessions.events.subscribe(session.game_id)
+        version = session.version
+
+        # nothing changes
+        client.post('/play', data={'gobbler_size': 'big', 'board_position': 5, 'button': 'Play'})
+        self.assertEqual(session.version, version)
+        # a gobbler is picked up
+        client.post('/play', data={'gobbler_size': 6, 'board_position': 'middle', 'button': 'Play'})
+        self.assertEqual(session.version, version + 1)
+        self.assertIn(b'event: state\n', next(subscription))
+        # and placed by the next selection
+        client.post('/play', data={'gobbler_size': 1, 'board_position': 5, 'button': 'Play'})
+        self.assertEqual(session.version, version + 2)
+        move = next(subscription)
+        self.assertIn(b'"gobbler_size": 6', move)
+        self.assertIn(b'"board_position": 5', move)
+        subscription.close()
+
+    def test_watch_a_game(self):
+        from app import app, sessions
+        client = app.test_client()
+        client.get('/')
+        client.post('/', data={'name': ['anna', 'bert'], 'button': 'Start Game'})
+        client.post('/play', data={'gobbler_size': 6, 'board_position': 5, 'button': 'Play'})
+        session = sessions.get(client.get_cookie('game_session').value)
+
+        page = app.test_client().get(f'/watch/{session.game_id}')
+        self.assertEqual(page.status_code, 200)
+        self.assertIn(b'Watching game', page.data)
+        self.assertIn(b'id="cell-4" class="player0">6<', page.data)
+        self.assertNotIn(b'name="button"', page.data)
+        self.assertEqual(app.test_client().get(f'/watch/{session.session_id}').status_code, 404)
+
+class TestApi(unittest.TestCase):
+
+    def setUp(self):
+        from app import app
+        self.client = app.test_client()
+
+    def test_play_a_game(self):
+        response = self.client.post('/api/games', json={'players': ['anna', 'bert']})
+        self.assertEqual(response.status_code, 201)
+        game_id = response.get_json()['game_id']
+        headers = {'Authorization': f'Bearer {response.get_json()["token"]}'}
+
+        moves = self.client.get(f'/api/games/{game_id}/moves').get_json()['moves']
+        self.assertEqual(len(moves), 54)
+        response = self.client.post(f'/api/games/{game_id}/moves', json={'gobbler_size': 2, 'board_position': 5},
+                                    headers=headers)
+        state = response.get_json()
+        self.assertEqual(state['board'][4], [[0, 2]])
+        self.assertEqual(state['current_player'], 1)
+
+        # player 1 can't cover a bigger gobbler
+        response = self.client.post(f'/api/games/{game_id}/moves', json={'gobbler_size': 1, 'board_position': 5},
+                                    headers=headers)
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post(f'/api/games/{game_id}/moves', json={'gobbler_size': 'big'}, headers=headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/games/nothing').status_code, 404)
+
+    def test_moves_need_the_token(self):
+        data = self.client.post('/api/games').get_json()
+        game_id = data['game_id']
+        self.assertNotEqual(game_id, data['token'])
+        move = {'gobbler_size': 2, 'board_position': 5}
+
+        # anyone can watch with the game id, but not play with it
+        self.assertEqual(self.client.get(f'/api/games/{game_id}').status_code, 200)
+        for headers in ({}, {'Authorization': f'Bearer {game_id}'}):
+            response = self.client.post(f'/api/games/{game_id}/moves', json=move, headers=headers)
+            self.assertEqual(response.status_code, 403)
+            response = self.client.post(f'/api/games/{game_id}/bot-move', json={'bot': 'random'}, headers=headers)
+            self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get(f'/api/games/{data["token"]}').status_code, 404)
+
+        # a browser plays with its session cookie
+        self.client.set_cookie('game_session', data['token'])
+        self.assertEqual(self.client.post(f'/api/games/{game_id}/moves', json=move).status_code, 200)
+        self.client.delete_cookie('game_session')
+
+    def test_bot_move_is_dropped_if_the_game_changed(self):
+        from app import app
+        data = self.client.post('/api/games').get_json()
+        headers = {'Authorization': f'Bearer {data["token"]}'}
+        sessions = app.extensions['sessions']
+
+        def choose_move(game, *args, **kwargs):
+            # another move is played while the bot is thinking
+            with sessions.use_game(data['game_id']) as session:
+                session.play(6, 1)
+            return 6, 5
+
+        with mock.patch('api.choose_move', choose_move):
+            response = self.client.post(f'/api/games/{data["game_id"]}/bot-move', json={'bot': 'random'},
+                                        headers=headers)
+        self.assertEqual(response.status_code, 409)
+        state = self.client.get(f'/api/games/{data["game_id"]}').get_json()
+        self.assertEqual(state['board'][0], [[0, 6]])
+        self.assertEqual(state['board'][4], [])
+
+    def test_not_modified(self):
+        data = self.client.post('/api/games').get_json()
+        game_id = data['game_id']
+        response = self.client.get(f'/api/games/{game_id}')
+        etag = response.headers['ETag']
+
+        response = self.client.get(f'/api/games/{game_id}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+        self.client.post(f'/api/games/{game_id}/moves', json={'gobbler_size': 1, 'board_position': 1},
+                         headers={'Authorization': f'Bearer {data["token"]}'})
+        response = self.client.get(f'/api/games/{game_id}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+class TestEvents(unittest.TestCase):
+
+    def test_fan_out(self):
+        broker = EventBroker()
+        subscriptions = [broker.subscribe('game') for _ in range(3)]
+        broker.publish('game', 'move', {'version': 1})
+        broker.publish('other game', 'move', {'version': 1})
+        epoch = subscriptions[0].channel.epoch.encode()
+        for subscription in subscriptions:
+            self.assertEqual(next(subscription), b'id: ' + epoch + b'.1\nevent: move\ndata: {"version": 1}\n\n')
+
+        for subscription in subscriptions:
+            subscription.close()
+        self.assertEqual(broker.subscribers('game'), 0)
+        self.assertEqual(broker.published, 1)
+
+    def test_resync_when_behind(self):
+        broker = EventBroker(history=2)
+        subscription = broker.subscribe('game')
+        for version in range(3):
+            broker.publish('game', 'move', {'version': version})
+        self.assertEqual(next(subscription), b'event: resync\ndata: {}\n\n')
+        epoch = subscription.channel.epoch.encode()
+        self.assertTrue(next(subscription).startswith(b'id: ' + epoch + b'.2\n'))
+        self.assertTrue(next(subscription).startswith(b'id: ' + epoch + b'.3\n'))
+        subscription.close()
+
+    def test_reconnect(self):
+        broker = EventBroker()
+        subscription = broker.subscribe('game')
+        broker.publish('game', 'move', {'version': 1})
+        broker.publish('game', 'move', {'version': 2})
+        last_event_id = f'{subscription.channel.epoch}.1'
+
+        # a client that got the first event gets the second
+        reconnected = broker.subscribe('game', last_event_id)
+        self.assertIn(b'"version": 2', next(reconnected))
+        reconnected.close()
+        subscription.close()
+
+        # once the channel is gone the same id doesn't match the new one,
+        # even after as many events as before
+        subscription = broker.subscribe('game')
+        for version in range(3, 6):
+            broker.publish('game', 'move', {'version': version})
+        reconnected = broker.subscribe('game', last_event_id)
+        self.assertEqual(next(reconnected), b'event: resync\ndata: {}\n\n')
+        reconnected.close()
+        subscription.close()
+
+    def test_event_stream(self):
+        from app import app
+        client = app.test_client()
+        data = client.post('/api/games').get_json()
+        game_id = data['game_id']
+        response = client.get(f'/api/games/{game_id}/events', buffered=False)
+        client.post(f'/api/games/{game_id}/moves', json={'gobbler_size': 6, 'board_position': 5},
+                    headers={'Authorization': f'Bearer {data["token"]}'})
+
+        messages = iter(response.response)
+        self.assertTrue(next(messages).startswith(b'event: state\n'))
+        move = next(messages)
+        self.assertIn(b'event: move\n', move)
+        self.assertIn(b'"board_position": 5', move)
+        response.close()
+        self.assertEqual(app.extensions['sessions'].events.subscribers(game_id), 0)
+
+class TestAsgi(unittest.TestCase):
+
+    def setUp(self):
+        from app import app, sessions
+        from asgi import AsgiApp
+        self.asgi_app = AsgiApp(app, sessions, threads=4, bot_workers=1)
+
+    def tearDown(self):
+        self.asgi_app.close()
+
+    async def _request(self, method, path, data=None, token=None):
+        """
+        returns the status, headers and body of a request
+        """
+        body = json.dumps(data).encode() if data is not None else b''
+        headers = [(b'content-type', b'application/json')]
+        if token is not None:
+            headers.append((b'authorization', f'Bearer {token}'.encode()))
+        path, _, query = path.partition('?')
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(), 'headers': headers}
+        messages = [{'type': 'http.request', 'body': body}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await self.asgi_app(scope, receive, send)
+        return sent[0]['status'], dict(sent[0]['headers']), b''.join(m.get('body', b'') for m in sent[1:])
+
+    def test_routes(self):
+        async def run():
+            status, headers, body = await self._request('GET', '/')
+            self.assertEqual(status, 200)
+            self.assertIn(b'game_session=', headers[b'set-cookie'])
+
+            status, _, body = await self._request('POST', '/api/games')
+            game_id, token = json.loads(body)['game_id'], json.loads(body)['token']
+            status, _, body = await self._request('POST', f'/api/games/{game_id}/bot-move', {'bot': 'random'}, token)
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(body)['current_player'], 1)
+            status, _, _ = await self._request('POST', f'/api/games/{game_id}/bot-move', {'bot': 'nobody'}, token)
+            self.assertEqual(status, 400)
+            status, _, _ = await self._request('POST', f'/api/games/{game_id}/bot-move', {'bot': 'random'})
+            self.assertEqual(status, 403)
+
+        asyncio.run(run())
+
+    def test_metrics(self):
+        async def run():
+            _, _, body = await self._request('POST', '/api/games')
+            game_id, token = json.loads(body)['game_id'], json.loads(body)['token']
+            status, _, _ = await self._request('POST', f'/api/games/{game_id}/bot-move',
+                                               {'bot': 'search', 'time_budget': 0.05}, token)
+            self.assertEqual(status, 200)
+
+        metrics.reset()
+        metrics.enable()
+        try:
+            asyncio.run(run())
+            # the search ran in a worker process, but is counted here
+            self.assertEqual(metrics.SEARCHES.value(('search',)), 1)
+            self.assertGreater(metrics.SEARCH_NODES.value(('search',)), 0)
+            self.assertEqual(metrics.REQUEST_SECONDS.count(('POST', '/api/games/<game_id>/bot-move', '200')), 1)
+            self.assertEqual(metrics.REQUEST_SECONDS.count(('POST', '/api/games', '201')), 1)
+        finally:
+            metrics.disable()
+            metrics.reset()
+
+    def test_analysis(self):
+        async def run():
+            _, _, body = await self._request('POST', '/api/games')
+            game_id = json.loads(body)['game_id']
+            status, _, body = await self._request('GET', f'/api/games/{game_id}/analysis?time_budget=0.2')
+            self.assertEqual(status, 200)
+            self.assertEqual(len(json.loads(body)['best_move']), 2)
+
+            # the same position, searched in a worker process, is cached here
+            positions = [{'board': [[]] * 9}] * 2
+            status, _, body = await self._request('POST', '/api/analysis', {'positions': positions, 'time_budget': 0.1})
+            self.assertEqual(status, 200)
+            self.assertTrue(all(analysis['cached'] for analysis in json.loads(body)['analyses']))
+            status, _, _ = await self._request('POST', '/api/analysis', {'board': 'nothing'})
+            self.assertEqual(status, 400)
+
+        asyncio.run(run())
+
+    def test_event_stream(self):
+        async def run():
+            _, _, body = await self._request('POST', '/api/games')
+            game_id, token = json.loads(body)['game_id'], json.loads(body)['token']
+
+            scope = {'type': 'http', 'method': 'GET', 'path': f'/api/games/{game_id}/events',
+                     'query_string': b'', 'headers': []}
+            disconnected = asyncio.Event()
+            sent = asyncio.Queue()
+
+            async def receive():
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            stream = asyncio.ensure_future(self.asgi_app(scope, receive, sent.put))
+            self.assertEqual((await sent.get())['status'], 200)
+            self.assertTrue((await sent.get())['body'].startswith(b'event: state'))
+
+            await self._request('POST', f'/api/games/{game_id}/moves', {'gobbler_size': 6, 'board_position': 5},
+                                token)
+            move = await asyncio.wait_for(sent.get(), 5)
+            self.assertIn(b'event: move', move['body'])
+
+            disconnected.set()
+            await asyncio.wait_for(stream, 5)
+            self.assertEqual(self.asgi_app.sessions.events.subscribers(game_id), 0)
+
+        asyncio.run(run())
+
+class TestOpeningBook(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmp_dir.name, 'book.bin')
+        cls.count = build_book(cls.path, plies=2, depth=2)
+        cls.book = OpeningBook(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.book.close()
+        cls.tmp_dir.cleanup()
+
+    def test_symmetric_positions_are_stored_once(self):
+        # the start, and 6 sizes in a corner, on an edge or in the middle
+        self.assertEqual(self.count, 1 + 6 * 3)
+        self.assertEqual(len(self.book), self.count)
+
+    def test_symmetric_moves(self):
+        moves = []
+        for board_position in [1, 3, 9, 7]:
+            game = Game()
+            game.apply_move((4, board_position))
+            moves.append(self.book.best_move(game))
+        transform = next(t for t in range(8) if transform_move((4, 1), t) == (4, 3))
+        self.assertEqual(moves[1], transform_move(moves[0], transform))
+        for move in moves:
+            self.assertIsNotNone(move)
+
+    def test_outside_of_the_book(self):
+        game = Game()
+        for move in [(1, 1), (1, 5), (2, 9)]:
+            game.apply_move(move)
+        self.assertIsNone(self.book.probe(game))
+
+    def test_bot_plays_book_moves(self):
+        game = Game()
+        bot = SearchBot(0, 'bot', game, book=self.book, verbose=False)
+        self.assertEqual(bot.select_gobbler(), self.book.best_move(game)[0])
+        self.assertIsNone(bot.last_result)
+
+class TestAnalysis(unittest.TestCase):
+
+    def play(self, moves):
+        game = Game()
+        for move in moves:
+            game.apply_move(move)
+        return game
+
+    def test_from_board(self):
+        from app import sessions
+        session = sessions.create()
+        for move in [(3, 5), (4, 5), (1, 1)]:
+            session.play(*move)
+        state = session.state()
+        game = Game.from_board(state['board'], state['current_player'])
+        self.assertEqual(game.zobrist_hash, session.game.zobrist_hash)
+        self.assertEqual(sorted(game.legal_moves()), sorted(session.game.legal_moves()))
+        sessions.remove(session.session_id)
+
+        with self.assertRaises(ValueError):
+            Game.from_board([[[0, 3], [1, 2]]] + [[]] * 8)
+        with self.assertRaises(ValueError):
+            Game.from_board([[[0, 3]], [[0, 3]]] + [[]] * 7)
+
+    def test_principal_variation(self):
+        game = self.play([(1, 1), (1, 5)])
+        analysis = analyze(game, 0.2)
+        self.assertEqual(analysis.principal_variation[0], analysis.best_move)
+        for move in analysis.principal_variation:
+            self.assertIn(move, set(game.legal_moves()))
+            game.apply_move(move)
+
+    def test_selected_gobbler(self):
+        game = self.play([(1, 1), (1, 5)])
+        game.select_gobbler(4)
+        analysis = analyze(game, 0.2)
+        self.assertEqual(analysis.best_move[0], 4)
+        for move in analysis.principal_variation:
+            self.assertIn(move, set(game.legal_moves()))
+            game.apply_move(move)
+        self.assertEqual(game.selected_gobbler, None)
+
+    def test_cache_symmetric_positions(self):
+        cache = AnalysisCache()
+        first = analyze(self.play([(4, 1)]), 0.2, cache)
+        second = analyze(self.play([(4, 9)]), 0.2, cache)
+        self.assertFalse(first.cached)
+        self.assertTrue(second.cached)
+        transform = next(t for t in range(8) if transform_move((4, 1), t) == (4, 9))
+        self.assertEqual(second.principal_variation, [transform_move(move, transform) for move in first.principal_variation])
+        # a longer analysis than the cached one searches again
+        self.assertFalse(analyze(self.play([(4, 9)]), 0.4, cache).cached)
+
+    def test_api(self):
+        from app import app
+        client = app.test_client()
+        data = client.post('/api/games').get_json()
+        game_id = data['game_id']
+        client.post(f'/api/games/{game_id}/moves', json={'gobbler_size': 2, 'board_position': 5},
+                    headers={'Authorization': f'Bearer {data["token"]}'})
+        response = client.get(f'/api/games/{game_id}/analysis?time_budget=0.1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()['best_move']), 2)
+
+        board = client.get(f'/api/games/{game_id}').get_json()['board']
+        positions = [{'board': board, 'current_player': 1}, {'board': [[]] * 9}]
+        response = client.post('/api/analysis', json={'positions': positions, 'time_budget': 0.1})
+        analyses = response.get_json()['analyses']
+        self.assertEqual(len(analyses), 2)
+        self.assertTrue(analyses[0]['cached'])
+        self.assertEqual(client.post('/api/analysis', json={'board': [[]]}).status_code, 400)
+        # 100 positions of 5 seconds would keep a worker for minutes
+        response = client.post('/api/analysis', json={'positions': [{'board': [[]] * 9}] * 100, 'time_budget': 5})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(client.post('/api/analysis', json={'board': [[]] * 9, 'time_budget': 60}).status_code, 400)
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_run_and_compare(self):
+        results = run_benchmarks(['select_place', 'play_request'], repeat=2, verbose=False)
+        self.assertEqual(set(results['results']), {'select_place', 'play_request'})
+        self.assertEqual(results['results']['select_place']['runs'], 2)
+        json.dumps(results)
+
+        # twice as many moves per second, in half the time
+        faster = json.loads(json.dumps(results))
+        faster['results']['select_place']['median'] *= 2
+        faster['results']['play_request']['median'] /= 2
+        for name, _, _, speedup in compare(results, faster):
+            self.assertAlmostEqual(speedup, 2.0, msg=name)
+        self.assertIn('stats_save', BENCHMARKS)
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        from app import app
+        self.client = app.test_client()
+        metrics.reset()
+        metrics.enable()
+
+    def tearDown(self):
+        metrics.disable()
+        metrics.reset()
+
+    def test_moves_and_requests(self):
+        data = self.client.post('/api/games').get_json()
+        game_id = data['game_id']
+        for move in [(1, 1), (1, 4), (2, 2), (2, 5)]:
+            self.client.post(f'/api/games/{game_id}/moves', json={'gobbler_size': move[0], 'board_position': move[1]},
+                             headers={'Authorization': f'Bearer {data["token"]}'})
+        self.assertEqual(metrics.MOVES.value(), 4)
+        self.assertEqual(metrics.REQUEST_SECONDS.count(('POST', '/api/games/<game_id>/moves', '200')), 4)
+
+        text = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('gobblers_moves_total 4', text)
+        self.assertIn('gobblers_request_seconds_count{method="POST",route="/api/games/<game_id>/moves",status="200"} 4', text)
+        self.assertIn('le="+Inf"', text)
+
+    def test_search_and_stats(self):
+        Search().search(Game(), float('inf'), 2)
+        self.assertEqual(metrics.SEARCHES.value(('search',)), 1)
+        self.assertGreater(metrics.SEARCH_NODES.value(('search',)), 0)
+        self.assertEqual(metrics.SEARCH_DEPTH.count(), 1)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            backend = BinaryStatsBackend(os.path.join(tmp_dir, 'stats.bin'))
+            records = GameRecordWriter(os.path.join(tmp_dir, 'games.bin'))
+            stats = GameStats(backend, ChartRenderer(backend, tmp_dir), records)
+            for move in [(1, 1), (1, 4), (2, 2), (2, 5), (3, 3)]:
+                stats.record_move(*move)
+            stats.save(0)
+            records.close()
+            backend.close()
+        histogram = metrics.snapshot()['gobblers_stats_save_seconds']
+        self.assertEqual(set(histogram), {('write',), ('read',), ('render',)})
+
+    def test_disabled(self):
+        metrics.disable()
+        game = Game()
+        game.select_gobbler(1)
+        game.place_selected_gobbler(1)
+        self.assertEqual(metrics.MOVES.value(), 0)
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+@unittest.skipIf(cv2 is None, 'the gui needs OpenCV')
+class TestGui(unittest.TestCase):
+
+    def full_redraw(self, board):
+        """
+        returns the frame of the board drawn from scratch,
+        without what was drawn before
+        """
+        reference = copy.copy(board)
+        reference.static_board = board.blank_board.copy()
+        reference.dynamic_board = reference.static_board.copy()
+        reference.dirty_rects = []
+        reference._placed = None
+        reference._overlay_state = None
+        reference._overlay_rects = []
+        reference.draw_static_board()
+        reference.draw_dynamic_board()
+        return reference.dynamic_board
+
+    def test_frames_match_a_full_redraw(self):
+        import gui
+        board = gui.Board(Game())
+        board.draw_static_board()
+
+        def hover(x, y):
+            board.click_event(None, x, y, None, None)
+
+        # as gui.main plays them
+        def select(size):
+            self.assertTrue(board.game.select_gobbler(size))
+            board.draw_static_board()
+
+        def place(region):
+            gobbler = board.game.selected_gobbler
+            success, board.winner = board.game.place_selected_gobbler(region)
+            self.assertTrue(success)
+            board.place_gobbler_on_board(gobbler, region)
+            board.draw_static_board()
+
+        steps = [lambda: hover(300, 200), lambda: hover(5, 5), lambda: select(4), lambda: hover(320, 260),
+                 lambda: place(5), lambda: hover(600, 100), lambda: select(6), lambda: hover(310, 240),
+                 lambda: place(5), lambda: select(2), lambda: hover(70, 30), lambda: place(1),
+                 # player 1 moves the 6 off of the 4 of player 0
+                 lambda: select(6), lambda: hover(560, 420), lambda: place(9), lambda: hover(400, 400)]
+        for step in steps:
+            step()
+            board.draw_dynamic_board()
+            board.dirty_rects.clear()
+            np.testing.assert_array_equal(board.dynamic_board, self.full_redraw(board))
+
+        # nothing is redrawn while nothing changes
+        board.draw_dynamic_board()
+        self.assertEqual(board.dirty_rects, [])
+
+    def test_frame_timer_percentiles(self):
+        import gui
+        timer = gui.FrameTimer(idle_after=0.25)
+        for start, end in [(0.0, 0.01), (0.02, 0.03), (0.04, 0.07), (1.0, 1.02)]:
+            timer.record(start, end)
+        summary = timer.percentiles((50, 100))
+        self.assertEqual(summary['frames'], 4)
+        self.assertEqual({key: round(value, 6) for key, value in summary['frame_time_ms'].items()},
+                         {'p50': 20, 'p100': 30})
+        # the pause before the last frame isn't an interval
+        self.assertEqual({key: round(value, 6) for key, value in summary['interval_ms'].items()},
+                         {'p50': 40, 'p100': 40})
+        self.assertEqual(gui.FrameTimer().percentiles(), {'frames': 0, 'frame_time_ms': {}, 'interval_ms': {}})
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,107 @@
+from array import array
+
+# the kinds of value that can be stored
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+class TranspositionTable:
+    """
+    A fixed-size table of search results keyed on Game.zobrist_hash,
+    that can be shared by any search bot.
+
+    Each entry is a 64-bit key and a 64-bit packed value:
+    bits 0-31 value, 32-39 depth, 40-41 flag, 42-47 move,
+    48-55 generation, 63 occupied.
+    When two positions map to the same slot, the new result replaces
+    the old one if the slot holds the same position, an entry from an
+    older search (see new_search) or a shallower search.
+    """
+    entry_size = 16 # bytes
+
+    def __init__(self, size_mb: float = 16):
+        # the number of entries is rounded down to a power of
+        # two so that a key can be turned into an index with a mask
+        number_of_entries = max(1, int(size_mb * 1024 * 1024) // self.entry_size)
+        self.size = 1 << (number_of_entries.bit_length() - 1)
+        self._index_mask = self.size - 1
+        self._keys = array('Q', bytes(8 * self.size))
+        self._data = array('Q', bytes(8 * self.size))
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def probe(self, key: int) -> tuple:
+        """
+        returns (depth, value, flag, move) stored for the position,
+        or None if the position is not in the table.
+        move is a value from logic.encode_move, or None
+        """
+        idx = key & self._index_mask
+        data = self._data[idx]
+        if data >> 63 and self._keys[idx] == key:
+            self.hits += 1
+            move = (data >> 42) & 0x3F
+            return ((data >> 32) & 0xFF,
+                    (data & 0xFFFFFFFF) - 0x80000000,
+                    (data >> 40) & 0x3,
+                    move - 1 if move else None)
+        self.misses += 1
+        return None
+
+    def store(self, key: int, depth: int, value: int, flag: int, move: int = None) -> None:
+        """
+        stores the result of searching a position to the given depth
+        """
+        idx = key & self._index_mask
+        data = self._data[idx]
+        if data >> 63:
+            same_position = self._keys[idx] == key
+            older = (data >> 48) & 0xFF != self.generation
+            deeper = depth >= (data >> 32) & 0xFF
+            if not (same_position or older or deeper):
+                return
+            if not same_position:
+                self.replacements += 1
+            # keep the best move of a previous search of the same position
+            if move is None and same_position:
+                move = ((data >> 42) & 0x3F) - 1
+                if move < 0:
+                    move = None
+        self._keys[idx] = key
+        self._data[idx] = ((1 << 63)
+                           | (self.generation << 48)
+                           | ((0 if move is None else move + 1) << 42)
+                           | (flag << 40)
+                           | (min(depth, 0xFF) << 32)
+                           | (value + 0x80000000))
+        self.stores += 1
+
+    def new_search(self) -> None:
+        """
+        marks all current entries as belonging to an older search,
+        so that they are the first to be replaced
+        """
+        self.generation = (self.generation + 1) & 0xFF
+
+    def clear(self) -> None:
+        self._keys = array('Q', bytes(8 * self.size))
+        self._data = array('Q', bytes(8 * self.size))
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.replacements = 0
+
+    @property
+    def hit_rate(self) -> float:
+        probes = self.hits + self.misses
+        if probes == 0:
+            return 0.0
+        return self.hits / probes
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.size * self.entry_size